@@ -0,0 +1,192 @@
+"""
+بيانات الملفات المشتقة (Manifests) - التحقق من الصلاحية عند الإقلاع
+===========================================
+الملفات المشتقة (similarity cache، مصفوفة الأزواج، فهرس LSH، إحصائيات الكلمات، جدول FTS5)
+كانت تُحمَّل عند الإقلاع دون أي تحقق، حتى لو تغيّرت قواعد normalize_arabic_text
+أو ملف quran_data_arabic_juz.csv بعد بنائها. الآن كل ملف يحمل manifest:
+
+✅ artifact + format     : نوع الملف ونسخة صيغته
+✅ normalizer_version    : بصمة قواعد ومحرك التطبيع (NORMALIZER_VERSION)
+✅ corpus_checksum       : بصمة المدوّنة (المعرّفات + النص + النص المُطبَّع + السورة والجزء)
+✅ params                : معاملات البناء (إعادة البناء بنفس الإعدادات)
+✅ built_at
+
+مكان الـ manifest:
+- similarity_cache_csr/meta.json و word_stats_store/meta.json و ngram_index/meta.json
+  (مجلدات المصفوفات: save_artifact_dir / load_artifact_dir)
+- similarity_pairs.npz و quran_lsh_index.npz: داخل الملف نفسه
+- جداول FTS5: صف في app_metadata
+
+initialize_optimizations يقارن كل manifest بالمدوّنة الحالية: الصالح يُحمَّل، والقديم لا يُخدم
+ويُعاد بناؤه في الخلفية، والحالة كلها في /performance/stats (artifacts).
+"""
+
+import json
+import os
+import shutil
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from database import AppMetadata
+from similarity import NORMALIZER_VERSION
+
+# ============================================
+# ⚙️ الإعدادات
+# ============================================
+MANIFEST_VERSION = 1
+MANIFEST_KEY_PREFIX = "manifest:"   # مفتاح manifest الجداول داخل app_metadata
+META_FILE = "meta.json"             # manifest مجلدات المصفوفات
+
+# ============================================
+# 🧾 إنشاء الـ manifest والتحقق منه
+# ============================================
+def build_manifest(artifact: str, format: str, corpus, params: Optional[dict] = None) -> dict:
+    """manifest ملف مبني الآن من هذه المدوّنة"""
+    return {
+        'artifact': artifact,
+        'format': format,
+        'manifest_version': MANIFEST_VERSION,
+        'normalizer_version': NORMALIZER_VERSION,
+        'corpus_checksum': corpus.checksum,
+        'params': dict(params or {}),
+        'built_at': time.time()
+    }
+
+def manifest_problem(manifest: Optional[dict], artifact: str, format: str, corpus,
+                     params: Optional[dict] = None) -> Optional[str]:
+    """
+    سبب عدم صلاحية الملف، أو None إذا كان صالحاً للمدوّنة الحالية
+
+    params: معاملات يجب أن تتطابق (مثل إعدادات تواقيع LSH) - الباقي يُحفظ للعرض فقط
+    """
+    if manifest is None:
+        return "بدون manifest"
+    if manifest.get('manifest_version') != MANIFEST_VERSION or manifest.get('artifact') != artifact:
+        return "بدون manifest (بُني بإصدار أقدم)"
+    if manifest.get('format') != format:
+        return f"صيغة مختلفة ({manifest.get('format')} ≠ {format})"
+    if manifest.get('normalizer_version') != NORMALIZER_VERSION:
+        return f"قواعد التطبيع تغيّرت ({manifest.get('normalizer_version')} ≠ {NORMALIZER_VERSION})"
+    if manifest.get('corpus_checksum') != corpus.checksum:
+        return f"المدوّنة تغيّرت ({manifest.get('corpus_checksum')} ≠ {corpus.checksum})"
+    for key, value in (params or {}).items():
+        if manifest.get('params', {}).get(key) != value:
+            return f"معامل البناء {key} تغيّر ({manifest.get('params', {}).get(key)} ≠ {value})"
+    return None
+
+# ============================================
+# 💾 التخزين
+# ============================================
+def write_db_manifest(db: Session, name: str, manifest: dict):
+    """manifest جدول داخل قاعدة البيانات (مثل verses_fts)"""
+    db.merge(AppMetadata(key=MANIFEST_KEY_PREFIX + name, value=json.dumps(manifest, ensure_ascii=False)))
+    db.commit()
+
+def read_db_manifest(db: Session, name: str) -> Optional[dict]:
+    row = db.query(AppMetadata).filter(AppMetadata.key == MANIFEST_KEY_PREFIX + name).first()
+    return json.loads(row.value) if row is not None else None
+
+# ============================================
+# 📁 مجلدات المصفوفات (similarity_cache_csr، word_stats_store، ngram_index، الحزمة)
+# ============================================
+def new_artifact_dir(path: str) -> str:
+    """مجلد نسخة جديدة فارغ بجانب path ({path}.<رقم>) - يُكتب كاملاً ثم publish_artifact_dir"""
+    version_path = f"{path}.{time.time_ns()}"
+    os.makedirs(version_path)
+    return version_path
+
+def publish_artifact_dir(version_path: str, path: str):
+    """
+    جعل path يشير إلى نسخة مكتوبة بالكامل
+
+    path رابط رمزي (نسبي) إلى مجلد النسخة، ويُستبدل برابط جديد بـ os.replace واحد:
+    لا توجد لحظة بدون path. بعد النشر تُحذف النسخ الأخرى (السابقة، ومجلدات كتابة انقطعت،
+    و .tmp/.old من الصيغة الأقدم)، لذلك القارئ يحلّ الرابط مرة واحدة (os.path.realpath)
+    ويقرأ كل ملفاته من ذلك المجلد، ويعيد المحاولة إذا حُذف أثناء القراءة (load_artifact_dir).
+    مجلد حقيقي من إصدار أقدم يُنقل جانباً مرة واحدة قبل أول رابط.
+    """
+    link_path = f"{path}.link"
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    os.symlink(os.path.basename(version_path), link_path)
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(f"{path}.old", ignore_errors=True)
+        os.replace(path, f"{path}.old")
+    os.replace(link_path, path)
+
+    parent, name = os.path.split(path)
+    for entry in os.listdir(parent or "."):
+        suffix = entry[len(name) + 1:] if entry.startswith(f"{name}.") else ""
+        if (suffix.isdigit() or suffix in ("old", "tmp")) and entry != os.path.basename(version_path):
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+def save_artifact_dir(path: str, arrays: Dict[str, np.ndarray], meta: dict):
+    """{name}.npy لكل مصفوفة + meta.json في نسخة جديدة ثم نشرها (publish_artifact_dir)"""
+    version_path = new_artifact_dir(path)
+    for name, array in arrays.items():
+        np.save(os.path.join(version_path, f"{name}.npy"), np.asarray(array))
+    with open(os.path.join(version_path, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    publish_artifact_dir(version_path, path)
+
+def read_dir_manifest(path: str, meta_file: str = META_FILE) -> Optional[dict]:
+    """الـ manifest المحفوظ في المجلد بدون تحميل المصفوفات - None إذا لم يوجد"""
+    meta_path = os.path.join(path, meta_file)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_artifact_dir(path: str, names: Sequence[str], artifact: str, format: str, corpus,
+                      params: Optional[dict] = None) -> Optional[Tuple[Dict[str, np.ndarray], dict]]:
+    """
+    (المصفوفات بـ memory-map، الـ manifest) إذا كان المجلد صالحاً للمدوّنة الحالية
+
+    الرابط path يُحلّ مرة واحدة: الـ manifest وكل المصفوفات من نفس النسخة حتى لو نُشرت
+    نسخة جديدة أثناء القراءة. إذا حُذفت النسخة المحلولة قبل فتح ملفاتها (path يشير الآن
+    إلى غيرها) يُعاد الحل - النسخة الجديدة منشورة كاملة.
+
+    Returns:
+        None إذا لم يوجد أو كان قديماً (السبب يُطبع) → المستدعي يعيد البناء
+    """
+    while True:
+        version_path = os.path.realpath(path)
+        try:
+            meta = read_dir_manifest(version_path)
+            if meta is None:
+                if os.path.realpath(path) != version_path:
+                    continue
+                return None
+            problem = manifest_problem(meta, artifact, format, corpus, params)
+            if problem is not None:
+                print(f"🔄 {artifact} قديم ({problem}) - أعد بناءه")
+                return None
+            return {name: np.load(os.path.join(version_path, f"{name}.npy"), mmap_mode='r') for name in names}, meta
+        except FileNotFoundError:
+            if os.path.realpath(path) == version_path:
+                raise
+
+# ============================================
+# 📋 حالة الملفات
+# ============================================
+def artifact_status(name: str, location: str, manifest: Optional[dict], problem: Optional[str],
+                    exists: Optional[bool] = None) -> dict:
+    """
+    حالة ملف مشتق للعرض في /performance/stats
+
+    exists: افتراضياً وجود الـ manifest (مرّر True لملف قديم موجود بدون manifest)
+    """
+    exists = manifest is not None if exists is None else exists
+    return {
+        'artifact': name,
+        'location': location,
+        'exists': exists,
+        'fresh': exists and problem is None,
+        'reason': problem if exists else "غير موجود",
+        'format': manifest.get('format') if manifest else None,
+        'params': manifest.get('params') if manifest else None,
+        'built_at': manifest.get('built_at') if manifest else None
+    }
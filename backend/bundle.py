@@ -0,0 +1,267 @@
+"""
+الحزمة المجمّعة (Bundle) - كل ما يحتاجه الإقلاع في مجلد واحد جاهز للـ memory-map
+===========================================
+الإقلاع كان يعتمد على ملفات متفرقة (quran.db، إحصائيات الكلمات، similarity cache...)
+بعضها يُبنى عبر طلبات HTTP للمسؤول. هنا أمر بناء واحد يقرأ quran_data_arabic_juz.csv
+ويُخرج مجلداً واحداً بإصدار (quran_bundle/):
+
+✅ quran.db                          : الآيات (مع النص المُطبَّع) + جداول FTS5 (الأصلي، المُطبَّع، الثلاثيات)
+✅ verse_ids / surahs / ayahs / juzs : أعمدة المدوّنة (npy)
+✅ texts / texts_clean / surah_names : النصوص (بايتات UTF-8 + إزاحات)
+✅ vocab                             : قاموس الكلمات بترتيب المعرّف
+✅ postings_indptr / docs / counts   : الفهرس المقلوب بصيغة CSR
+✅ similarity_cache_csr/             : similarity cache (CSR)
+✅ similarity_pairs.npz              : مصفوفة أزواج التشابه
+✅ word_stats_store/                 : إحصائيات الكلمات (CSR) لـ /stats/word و /autocomplete
+✅ ngram_index/                      : الثنائيات والثلاثيات لـ /autocomplete/phrase
+✅ mutashabihat_kalima.json          : بنك أسئلة وضع الخبير
+✅ manifest.json                     : الصيغة + بصمة التطبيع والمدوّنة وملف CSV + معاملات البناء
+
+lifespan يكتشف الحزمة ويحمّلها بـ memory-map بدون أي بناء (بدون init_db ولا قراءة CSV)؛
+إذا كانت قديمة (تغيّر التطبيع أو ملف CSV) يعود للمسار العادي مع تحذير.
+
+   cd backend && python -m bundle
+   python -m bundle --csv quran_data_arabic_juz.csv --output quran_bundle --min-similarity 0.5
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, load_data_from_csv, file_checksum, BUNDLE_DIR, BUNDLE_FORMAT, CSV_FILE
+from corpus import QuranCorpus, build_corpus
+from inverted_index import InvertedIndex
+from artifacts import build_manifest, manifest_problem, new_artifact_dir, publish_artifact_dir, read_dir_manifest
+from cache_builder import build_cache, MAX_RESULTS
+from pair_matrix import build_pair_matrix, save_pair_matrix, PAIR_FLOOR
+from fts_index import build_fts_table, build_clean_fts_table, build_trigram_fts_table
+from word_stats_store import build_word_stats, save_word_stats
+from ngram_index import build_ngram_index, save_ngram_index
+from jobs import print_progress, ProgressCallback
+
+# ============================================
+# ⚙️ الإعدادات
+# ============================================
+BUNDLE_ARTIFACT = "bundle"
+BUNDLE_MANIFEST = "manifest.json"
+BUNDLE_DATABASE = "quran.db"
+BUNDLE_STORE_DIR = "similarity_cache_csr"
+BUNDLE_PAIRS_FILE = "similarity_pairs.npz"
+BUNDLE_WORD_STATS_DIR = "word_stats_store"
+BUNDLE_NGRAM_DIR = "ngram_index"
+BANK_FILE = "mutashabihat_kalima.json"
+BANK_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), BANK_FILE)
+
+# ============================================
+# 📦 الحزمة المحمّلة
+# ============================================
+class QuranBundle:
+    """حزمة صالحة: الـ manifest + المدوّنة المحمّلة منها + مسارات ملفاتها"""
+
+    __slots__ = ('path', 'manifest', 'corpus')
+
+    def __init__(self, path: str, manifest: dict, corpus: QuranCorpus):
+        self.path = path
+        self.manifest = manifest
+        self.corpus = corpus
+
+    @property
+    def database_file(self) -> str:
+        return os.path.join(self.path, BUNDLE_DATABASE)
+
+    @property
+    def store_dir(self) -> str:
+        return os.path.join(self.path, BUNDLE_STORE_DIR)
+
+    @property
+    def pairs_file(self) -> str:
+        return os.path.join(self.path, BUNDLE_PAIRS_FILE)
+
+    @property
+    def word_stats_dir(self) -> str:
+        return os.path.join(self.path, BUNDLE_WORD_STATS_DIR)
+
+    @property
+    def ngram_dir(self) -> str:
+        return os.path.join(self.path, BUNDLE_NGRAM_DIR)
+
+    @property
+    def bank_file(self) -> str:
+        return os.path.join(self.path, BANK_FILE)
+
+# ============================================
+# 🔤 النصوص (بايتات UTF-8 + إزاحات)
+# ============================================
+def save_strings(path: str, name: str, strings: List[str]):
+    encoded = [text.encode('utf-8') for text in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(data) for data in encoded])
+    np.save(os.path.join(path, f"{name}.npy"), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    np.save(os.path.join(path, f"{name}_offsets.npy"), offsets)
+
+def load_strings(path: str, name: str) -> List[str]:
+    raw = np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r').tobytes()
+    offsets = np.load(os.path.join(path, f"{name}_offsets.npy")).tolist()
+    return [raw[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+
+# ============================================
+# 📚 المدوّنة
+# ============================================
+def write_corpus(corpus: QuranCorpus, path: str):
+    """أعمدة المدوّنة والنصوص والقاموس والفهرس المقلوب"""
+    np.save(os.path.join(path, "verse_ids.npy"), corpus.ids)
+    np.save(os.path.join(path, "verse_surahs.npy"), corpus.surahs)
+    np.save(os.path.join(path, "verse_ayahs.npy"), corpus.ayahs)
+    np.save(os.path.join(path, "verse_juzs.npy"), corpus.juzs)
+    save_strings(path, "texts", list(corpus.texts))
+    save_strings(path, "texts_clean", list(corpus.texts_clean))
+    save_strings(path, "surah_names", [record.surah_name for record in corpus.records])
+    save_strings(path, "vocab", sorted(corpus.vocab, key=corpus.vocab.get))
+
+    indptr, docs, counts = corpus.inverted_index.to_arrays()
+    np.save(os.path.join(path, "postings_indptr.npy"), indptr)
+    np.save(os.path.join(path, "postings_docs.npy"), docs)
+    np.save(os.path.join(path, "postings_counts.npy"), counts)
+
+def read_corpus(path: str) -> QuranCorpus:
+    """المدوّنة من الحزمة: القاموس والفهرس المقلوب جاهزان (الفهرس شرائح memory-map)"""
+    ids = np.load(os.path.join(path, "verse_ids.npy")).tolist()
+    rows = list(zip(ids,
+                    np.load(os.path.join(path, "verse_surahs.npy")).tolist(),
+                    load_strings(path, "surah_names"),
+                    np.load(os.path.join(path, "verse_ayahs.npy")).tolist(),
+                    load_strings(path, "texts"),
+                    np.load(os.path.join(path, "verse_juzs.npy")).tolist(),
+                    load_strings(path, "texts_clean")))
+    vocab = {word: word_id for word_id, word in enumerate(load_strings(path, "vocab"))}
+    inverted_index = InvertedIndex(arrays=(
+        np.load(os.path.join(path, "postings_indptr.npy"), mmap_mode='r'),
+        np.load(os.path.join(path, "postings_docs.npy"), mmap_mode='r'),
+        np.load(os.path.join(path, "postings_counts.npy"), mmap_mode='r'),
+        len(rows)
+    ))
+    return QuranCorpus(rows, vocab, inverted_index)
+
+# ============================================
+# 🏗️ التجميع
+# ============================================
+def compile_bundle(csv_path: str = CSV_FILE, output: str = BUNDLE_DIR, min_similarity: float = 0.50,
+                   top_k: int = MAX_RESULTS, pair_floor: float = PAIR_FLOOR, workers: int = 1,
+                   progress: ProgressCallback = print_progress) -> dict:
+    """
+    بناء الحزمة كاملة من ملف CSV في مجلد نسخة جديدة ثم نشرها ذرياً (publish_artifact_dir)
+
+    Returns:
+        manifest الحزمة
+    """
+    start_time = time.time()
+    tmp_path = new_artifact_dir(output)
+
+    print("="*60)
+    print(f"📦 تجميع الحزمة: {csv_path} → {output}")
+    print("="*60)
+
+    # 1. قاعدة بيانات جديدة من CSV (الآيات + النص المُطبَّع)
+    database_file = os.path.join(tmp_path, BUNDLE_DATABASE)
+    engine = create_engine(f"sqlite:///{database_file}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        if not load_data_from_csv(db, csv_path):
+            raise RuntimeError(f"تعذّر تحميل {csv_path}")
+        corpus = build_corpus(db)
+
+        # 2. المدوّنة: الأعمدة والنصوص والقاموس والفهرس المقلوب
+        write_corpus(corpus, tmp_path)
+        print(f"✅ المدوّنة: {len(corpus)} آية، {len(corpus.vocab):,} كلمة")
+
+        # 3. similarity cache + مصفوفة الأزواج + إحصائيات الكلمات + الـ n-grams
+        build_cache(corpus, min_similarity, "exact", False, workers, False, top_k, progress,
+                    path=os.path.join(tmp_path, BUNDLE_STORE_DIR),
+                    checkpoint_path=os.path.join(tmp_path, "similarity_cache_temp.npy"))
+        save_pair_matrix(build_pair_matrix(corpus, pair_floor, progress), os.path.join(tmp_path, BUNDLE_PAIRS_FILE))
+        save_word_stats(build_word_stats(corpus), os.path.join(tmp_path, BUNDLE_WORD_STATS_DIR))
+        save_ngram_index(build_ngram_index(corpus), os.path.join(tmp_path, BUNDLE_NGRAM_DIR))
+
+        # 4. FTS5 داخل قاعدة بيانات الحزمة
+        build_fts_table(database_file, db, corpus)
+        build_clean_fts_table(database_file, db, corpus)
+        build_trigram_fts_table(database_file, db, corpus)
+    finally:
+        db.close()
+        engine.dispose()
+
+    # 5. بنك أسئلة وضع الخبير
+    if os.path.exists(BANK_SOURCE):
+        shutil.copyfile(BANK_SOURCE, os.path.join(tmp_path, BANK_FILE))
+
+    params = {'min_similarity': min_similarity, 'top_k': top_k, 'pair_floor': pair_floor}
+    manifest = dict(build_manifest(BUNDLE_ARTIFACT, BUNDLE_FORMAT, corpus, params),
+                    source_checksum=file_checksum(csv_path), rows=len(corpus),
+                    files=sorted(os.listdir(tmp_path)))
+    with open(os.path.join(tmp_path, BUNDLE_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    publish_artifact_dir(tmp_path, output)
+
+    size = sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(output) for name in names)
+    print(f"✅ تم تجميع الحزمة {output} ({size / 1024 / 1024:.1f} MB) في {time.time() - start_time:.1f}ث")
+    return manifest
+
+# ============================================
+# 📂 الفتح عند الإقلاع
+# ============================================
+def open_bundle(path: str = BUNDLE_DIR, csv_path: str = CSV_FILE) -> Optional[QuranBundle]:
+    """
+    الحزمة إذا وُجدت وكانت صالحة (وإلا None → المسار العادي)
+
+    صالحة = نفس الصيغة وقواعد التطبيع، بصمة المدوّنة المحمّلة تطابق الـ manifest،
+    وملف CSV (إن وُجد بجانب الخادم) لم يتغيّر منذ التجميع
+    """
+    # نسخة واحدة محلولة: تجميع جديد أثناء الفتح لا يخلط ملفات نسختين
+    version_path = os.path.realpath(path)
+    manifest = read_dir_manifest(version_path, BUNDLE_MANIFEST)
+    if manifest is None:
+        return None
+
+    start_time = time.time()
+    try:
+        corpus = read_corpus(version_path)
+    except Exception as e:
+        print(f"⚠️ تعذّر قراءة الحزمة {path}: {e} - المسار العادي")
+        return None
+
+    problem = manifest_problem(manifest, BUNDLE_ARTIFACT, BUNDLE_FORMAT, corpus)
+    if problem is None and os.path.exists(csv_path) and file_checksum(csv_path) != manifest.get('source_checksum'):
+        problem = f"ملف {csv_path} تغيّر منذ التجميع"
+    if problem is not None:
+        print(f"⚠️ الحزمة {path} قديمة ({problem}) - المسار العادي؛ أعد التجميع: python -m bundle")
+        return None
+
+    print(f"📦 تم فتح الحزمة {path}: {len(corpus)} آية في {time.time() - start_time:.2f}ث")
+    return QuranBundle(version_path, manifest, corpus)
+
+# ============================================
+# 🖥️ سطر الأوامر
+# ============================================
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="تجميع الحزمة الجاهزة للإقلاع من ملف CSV")
+    parser.add_argument("--csv", default=CSV_FILE, help="ملف الآيات")
+    parser.add_argument("--output", default=BUNDLE_DIR, help="مجلد الحزمة")
+    parser.add_argument("--min-similarity", type=float, default=0.50, help="حد similarity cache")
+    parser.add_argument("--top-k", type=int, default=MAX_RESULTS, help="عدد المتشابهات لكل آية")
+    parser.add_argument("--pair-floor", type=float, default=PAIR_FLOOR, help="حد مصفوفة الأزواج")
+    parser.add_argument("--workers", type=int, default=1, help="عمليات بناء similarity cache (0 = كل الأنوية)")
+    args = parser.parse_args(argv)
+
+    compile_bundle(args.csv, args.output, args.min_similarity, args.top_k, args.pair_floor, args.workers)
+
+if __name__ == "__main__":
+    main()
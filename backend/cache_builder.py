@@ -0,0 +1,476 @@
+"""
+بناء similarity cache على عدة عمليات (Sharded / Multi-process)
+===========================================
+البناء القديم حلقة مزدوجة في خيط واحد داخل طلب GET. هنا:
+
+✅ كل زوج غير مرتب يُحسب مرة واحدة (~نصف المقارنات) ويُكتب في قائمتي الآيتين
+✅ الآيات تُقسَّم إلى شرائح (shards) متجاورة متقاربة في حجم العمل
+✅ كل شريحة تُحسب في عملية منفصلة (ProcessPoolExecutor)
+✅ المدوّنة مشتركة للقراءة فقط: fork يرث CORPUS من العملية الأم (copy-on-write)،
+   وعلى الأنظمة بدون fork تبني كل عملية المدوّنة مرة واحدة من quran.db
+✅ أفضل K متشابهة فعلياً لكل آية (كومة صغرى) مع مسح مرتب بالحد الأعلى:
+   أضعف نتيجة في الكومة ترفع العتبة → أزواج أقل تصل للنواة
+✅ كومات الشرائح تُدمج (أفضل K من الاتحاد) → نفس النتيجة بأي عدد عمليات
+✅ نقاط استئناف ذرية (similarity_cache_temp.npy) مع بيانات التوافق:
+   نفس التطبيع + العتبة + الطريقة + K + بصمة المدوّنة → يُستأنف البناء من الآيات المتبقية فقط
+✅ التقدّم أحداث منظّمة (progress_event) → الطباعة افتراضياً، أو طابور مهمة في الخلفية (jobs)
+   يقرأ منه GET /admin/build-cache/status آخر حدث للمهمة الجارية
+✅ نقطة تشغيل من سطر الأوامر:
+
+   python cache_builder.py --workers 8 --min-similarity 0.5 --method exact
+"""
+
+import argparse
+import heapq
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import corpus as corpus_module
+from database import SessionLocal, init_db
+from corpus import get_corpus, load_corpus
+from similarity import NORMALIZER_VERSION
+from word_kernel import PrefilterStats
+from lsh_index import get_lsh_index, jaccard_for_similarity, exact_pairs, lsh_recall, lsh_usable, LSH_MIN_SIMILARITY
+from similarity_store import SimilarityStore, store_from_rows, save_store, SIMILARITY_STORE_DIR
+from jobs import pool_context, progress_event, print_progress, ProgressCallback
+
+# ============================================
+# ⚙️ الإعدادات
+# ============================================
+SIMILARITY_CACHE_TEMP_FILE = "similarity_cache_temp.npy"
+MAX_RESULTS = 20           # أفضل K نتيجة لكل آية (الافتراضي)
+SHARDS_PER_WORKER = 4      # شرائح أكثر من العمليات → توزيع أفضل (آيات البقرة أطول)
+CHECKPOINT_EVERY = 200     # نقطة استئناف كل 200 آية مكتملة (وحد أقصى لحجم الشريحة)
+
+Neighbors = Dict[int, List[int]]
+
+# ============================================
+# 🧮 حساب شريحة (كل زوج مرة واحدة)
+# ============================================
+Entry = Tuple[float, int]  # (التشابه، -موقع الآية الأخرى): الأضعف ثم الأحدث في قمة الكومة الصغرى
+
+def offer(heap: List[Entry], entry: Entry, top_k: int) -> bool:
+    """إضافة نتيجة إلى كومة أفضل top_k - True إذا تغيّرت أضعف نتيجة فيها"""
+    if len(heap) < top_k:
+        heapq.heappush(heap, entry)
+        return len(heap) == top_k
+    if entry > heap[0]:
+        heapq.heapreplace(heap, entry)
+        return True
+    return False
+
+def build_shard(indices: List[int], min_similarity: float, top_k: int = MAX_RESULTS,
+                lsh_neighbors: Optional[Neighbors] = None, corpus=None) -> dict:
+    """
+    حساب شريحة من الآيات (مواقع داخل المدوّنة) - كل آية تُقارن بما بعدها فقط
+
+    - كل زوج غير مرتب يُحسب مرة واحدة بالاتجاه (الأقدم → الأحدث) مثل البحث الشامل،
+      والنتيجة تُكتب في قائمتي الآيتين
+    - حد الكيس لكل الآيات دفعة واحدة (similarity_bounds) والمسح من الأعلى حداً إلى الأدنى
+    - كومة صغرى بحجم top_k لكل آية: أضعف نتيجة فيها عتبتها الفعلية، والزوج الذي حدّه
+      دون عتبتي الآيتين معاً لا يُحسب (العتبات ترتفع فقط → الإقصاء آمن)
+
+    يُستدعى داخل العمليات الفرعية (corpus=None → مدوّنة العملية) أو مباشرة مع workers=1
+    النتيجة: كومات جزئية لكل آية لمستها الشريحة (تُدمج في العملية الأم)
+    """
+    if corpus is None:
+        corpus = get_corpus()
+    total = len(corpus)
+    basmala_mask = corpus.basmala_mask
+    stats = PrefilterStats()
+    heaps: Dict[int, List[Entry]] = {}
+    thresholds = [min_similarity] * total
+    comparisons = 0
+    pairs_found = 0
+    skipped_basmala = 0
+
+    for index in indices:
+        # ✅ تخطي البسملات (توفير وقت)
+        if basmala_mask[index]:
+            skipped_basmala += 1
+            continue
+
+        verse = corpus.records[index]
+        bounds = corpus.similarity_bounds(corpus.token_counts[index], verse.word_count)
+
+        # الآيات اللاحقة فقط، بدون البسملات، ومع حد يبلغ العتبة
+        allowed = (bounds >= min_similarity) & ~basmala_mask
+        allowed[:index + 1] = False
+        if lsh_neighbors is not None:
+            in_candidates = np.zeros(total, dtype=bool)
+            in_candidates[lsh_neighbors.get(index, [])] = True
+            allowed &= in_candidates
+
+        candidates = np.flatnonzero(allowed)
+        order = candidates[np.argsort(-bounds[candidates], kind='stable')].tolist()
+        order_bounds = bounds[order].tolist()
+        stats.index_skipped += (total - index - 1) - len(order)
+        comparisons += len(order)
+
+        heap = heaps.setdefault(index, [])
+        computed = 0
+        for other_index, bound in zip(order, order_bounds):
+            if bound < thresholds[index] and bound < thresholds[other_index]:
+                continue
+            computed += 1
+            similarity = corpus.ratio(index, other_index)
+
+            if not (min_similarity <= similarity < 0.99):
+                continue
+            pairs_found += 1
+            if offer(heap, (similarity, -other_index), top_k):
+                thresholds[index] = max(min_similarity, heap[0][0])
+            other_heap = heaps.setdefault(other_index, [])
+            if offer(other_heap, (similarity, -index), top_k):
+                thresholds[other_index] = max(min_similarity, other_heap[0][0])
+
+        stats.pairs += len(order)
+        stats.bag_pruned += len(order) - computed
+        stats.exact += computed
+
+    return {
+        'processed': list(indices),
+        'heaps': {index: heap for index, heap in heaps.items() if heap},
+        'comparisons': comparisons,
+        'pairs_found': pairs_found,
+        'skipped_basmala': skipped_basmala,
+        'prefilter': stats
+    }
+
+def merge_heaps(heaps: Dict[int, List[Entry]], shard_heaps: Dict[int, List[Entry]], top_k: int):
+    """دمج كومات شريحة في الكومات الكلية (أفضل top_k من الاتحاد = أفضل top_k الكلية)"""
+    for index, entries in shard_heaps.items():
+        current = heaps.get(index)
+        heaps[index] = heapq.nlargest(top_k, entries if current is None else current + entries)
+
+def heaps_to_rows(corpus, heaps: Dict[int, List[Entry]]) -> Dict[int, List[Tuple[int, float]]]:
+    """الكومات → {verse_id: [(neighbor_id, similarity), ...]} تنازلياً (التعادل للمعرّف الأصغر)"""
+    ids = corpus.ids.tolist()
+    return {ids[index]: [(ids[-neg_index], similarity) for similarity, neg_index in sorted(entries, reverse=True)]
+            for index, entries in heaps.items()}
+
+def split_shards(indices: List[int], num_shards: int, total: int) -> List[List[int]]:
+    """
+    تقسيم المواقع إلى شرائح متجاورة متقاربة في حجم العمل
+
+    الآية في الموقع i تُقارن بـ (total - i - 1) آية لاحقة → الشرائح الأولى أقصر
+    """
+    if not indices:
+        return []
+    num_shards = max(1, min(num_shards, len(indices)))
+    work = np.cumsum(total - np.asarray(indices, dtype=np.int64))
+    cuts = np.searchsorted(work, work[-1] * np.arange(1, num_shards) / num_shards) + 1
+    bounds = np.unique(np.concatenate(([0], np.minimum(cuts, len(indices)), [len(indices)])))
+    return [indices[bounds[k]:bounds[k + 1]] for k in range(len(bounds) - 1)]
+
+# ============================================
+# 👷 العمليات الفرعية
+# ============================================
+def resolve_workers(workers: int) -> int:
+    """عدد العمليات الفعلي (0 = كل الأنوية)"""
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+def init_worker():
+    """تهيئة العملية الفرعية: المدوّنة موروثة مع fork، وإلا تُبنى مرة واحدة من quran.db"""
+    if corpus_module.CORPUS is not None:
+        return
+    db = SessionLocal()
+    try:
+        load_corpus(db)
+    finally:
+        db.close()
+
+# ============================================
+# 🏗️ البناء الكامل
+# ============================================
+def lsh_candidate_neighbors(corpus, min_similarity: float, check_recall: bool, info: dict) -> Neighbors:
+    """جيران كل آية من أزواج LSH المرشّحة (مرتبة بالمعرّف مثل الفهرس المقلوب)"""
+    firsts, seconds = get_lsh_index(corpus).candidate_pairs(jaccard_for_similarity(min_similarity))
+    # الاتجاهان معاً مرتبين بـ (الآية، الجار) ثم تقسيم عند تغيّر الآية
+    sources = np.concatenate((firsts, seconds))
+    targets = np.concatenate((seconds, firsts))
+    order = np.lexsort((targets, sources))
+    sources, targets = sources[order], targets[order]
+    verses, starts = np.unique(sources, return_index=True)
+    lsh_neighbors: Neighbors = {
+        verse: neighbors.tolist() for verse, neighbors in zip(verses.tolist(), np.split(targets, starts[1:]))
+    }
+    print(f"   🧩 أزواج LSH المرشّحة: {len(firsts):,}")
+
+    if check_recall:
+        exact = {pair for pair in exact_pairs(corpus, min_similarity)}
+        exact |= {(j, i) for i, j in exact}
+        covered = set(zip(sources.tolist(), targets.tolist()))
+        info['recall'] = lsh_recall(covered & exact, exact)
+        print(f"   🎯 استرجاع LSH مقابل النتيجة الدقيقة: {info['recall']}")
+    return lsh_neighbors
+
+def atomic_save(obj, path: str):
+    """حفظ npy ذري: ملف مؤقت ثم os.replace (لا يبقى ملف نصف مكتوب عند الانقطاع)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, obj, allow_pickle=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+# ============================================
+# 💾 نقاط الاستئناف (Checkpoints)
+# ============================================
+def checkpoint_meta(corpus, min_similarity: float, method: str, top_k: int = MAX_RESULTS) -> dict:
+    """ما يجب أن يتطابق لاستئناف بناء سابق"""
+    return {
+        'normalizer_version': NORMALIZER_VERSION,
+        'corpus_checksum': corpus.checksum,
+        'min_similarity': float(min_similarity),
+        'method': method,
+        'top_k': top_k
+    }
+
+def save_checkpoint(corpus, processed: List[int], heaps: Dict[int, List[Entry]], meta: dict,
+                    path: str = SIMILARITY_CACHE_TEMP_FILE):
+    """نقطة استئناف: الآيات المُعالجة + الكومات الجزئية (بالمعرّفات) + بيانات التوافق"""
+    ids = corpus.ids.tolist()
+    atomic_save({
+        'meta': meta,
+        'processed': [ids[i] for i in processed],
+        'neighbors': {ids[i]: [(similarity, ids[-neg]) for similarity, neg in entries]
+                      for i, entries in heaps.items()},
+        'saved_at': time.time()
+    }, path)
+
+def read_checkpoint(path: str = SIMILARITY_CACHE_TEMP_FILE) -> Optional[dict]:
+    """قراءة نقطة الاستئناف (None إذا لم توجد أو كانت بصيغة قديمة/تالفة)"""
+    if not os.path.exists(path):
+        return None
+    try:
+        checkpoint = np.load(path, allow_pickle=True).item()
+    except Exception as e:
+        print(f"⚠️ نقطة استئناف تالفة ({path}): {e}")
+        return None
+    # الصيغ القديمة (الـ cache مباشرة أو قوائم كاملة لكل آية) لا يمكن استئنافها هنا
+    if not isinstance(checkpoint, dict) or not {'meta', 'processed', 'neighbors'} <= checkpoint.keys():
+        return None
+    return checkpoint
+
+def load_checkpoint(corpus, meta: dict,
+                    path: str = SIMILARITY_CACHE_TEMP_FILE) -> Tuple[List[int], Dict[int, List[Entry]]]:
+    """(المواقع المُعالجة، الكومات الجزئية) من نقطة استئناف متوافقة - فارغة إذا لا توجد"""
+    checkpoint = read_checkpoint(path)
+    if checkpoint is None:
+        return [], {}
+    if checkpoint['meta'] != meta:
+        print(f"🔄 نقطة استئناف غير متوافقة - تجاهلها: {checkpoint['meta']}")
+        return [], {}
+    index_by_id = corpus.index_by_id
+    processed = [index_by_id[verse_id] for verse_id in checkpoint['processed']]
+    heaps = {index_by_id[verse_id]: [(similarity, -index_by_id[other_id]) for similarity, other_id in entries]
+             for verse_id, entries in checkpoint['neighbors'].items()}
+    return processed, heaps
+
+def checkpoint_status(corpus=None, path: str = SIMILARITY_CACHE_TEMP_FILE) -> dict:
+    """موقع نقطة الاستئناف على القرص (للعرض في endpoint الحالة)"""
+    checkpoint = read_checkpoint(path)
+    if checkpoint is None:
+        return {'exists': os.path.exists(path), 'usable': False}
+
+    processed = set(checkpoint['processed'])
+    meta = checkpoint['meta']
+    status = {
+        'exists': True,
+        'usable': True,
+        'meta': meta,
+        'completed_verses': len(processed),
+        'saved_at': checkpoint.get('saved_at')
+    }
+    if corpus is not None:
+        status['usable'] = (meta['normalizer_version'] == NORMALIZER_VERSION and
+                            meta['corpus_checksum'] == corpus.checksum)
+        status['total_verses'] = len(corpus)
+        status['progress_percent'] = round(len(processed) / len(corpus) * 100, 1) if len(corpus) else 0.0
+        # أول آية لم تُعالج بعد (نقطة الاستئناف)
+        status['next_verse_id'] = next((r.id for r in corpus.records if r.id not in processed), None)
+    return status
+
+def build_cache(corpus, min_similarity: float = 0.50, method: str = "exact",
+                check_recall: bool = False, workers: int = 1, resume: bool = True,
+                top_k: int = MAX_RESULTS,
+                progress: ProgressCallback = print_progress,
+                path: str = SIMILARITY_STORE_DIR,
+                checkpoint_path: str = SIMILARITY_CACHE_TEMP_FILE) -> Tuple[SimilarityStore, dict]:
+    """
+    بناء similarity cache كاملاً وحفظه بصيغة CSR → (المخزن، معلومات البناء)
+
+    workers: عدد العمليات (1 = في نفس العملية، 0 = كل الأنوية)
+    resume: استئناف نقطة محفوظة متوافقة (نفس التطبيع والعتبة والطريقة و K وبصمة المدوّنة)
+    top_k: عدد أفضل المتشابهات المحفوظة لكل آية
+    progress: مستهلك أحداث التقدّم (بعد كل شريحة)
+    path / checkpoint_path: مكان الحفظ ونقطة الاستئناف (الحزمة المجمّعة تبني في مجلدها)
+    """
+    workers = resolve_workers(workers)
+    lsh_redirected = method == "lsh" and not lsh_usable(min_similarity)
+    if lsh_redirected:
+        # تحت LSH_MIN_SIMILARITY يفقد LSH معظم الأزواج → البناء الدقيق (الفهرس المقلوب)
+        method = "exact"
+
+    print("="*60)
+    print("🔥 بدء بناء similarity cache...")
+    print(f"   🎯 حد التشابه: {min_similarity*100}%")
+    print(f"   🧭 الطريقة: {method}")
+    print(f"   🏅 أفضل {top_k} نتيجة لكل آية")
+    print(f"   👷 العمليات: {workers}")
+    print("="*60)
+
+    start_time = time.time()
+    records = corpus.records
+    total_verses = len(records)
+    info = {'method': method, 'min_similarity': min_similarity, 'top_k': top_k, 'workers': workers}
+    if lsh_redirected:
+        info['lsh_redirected'] = True
+        print(f"   ↪️ النسبة أقل من {LSH_MIN_SIMILARITY}: البناء الدقيق بدلاً من LSH")
+    meta = checkpoint_meta(corpus, min_similarity, method, top_k)
+
+    # 💾 الاستئناف: الآيات المُعالجة في نقطة سابقة لا تُعاد (وكوماتها الجزئية تُكمَل)
+    processed, heaps = load_checkpoint(corpus, meta, checkpoint_path) if resume else ([], {})
+    processed_set = set(processed)
+    pending = [r.index for r in records if r.index not in processed_set]
+    info['resumed_verses'] = len(processed)
+    if processed:
+        print(f"   💾 استئناف من نقطة محفوظة: {len(processed)}/{total_verses} آية مُعالجة")
+
+    # حدث أولي: الاستئناف يظهر في حالة المهمة قبل انتهاء أول شريحة
+    progress(progress_event('similarity', len(processed), total_verses, start_time, 0, 1,
+                            method=method, min_similarity=min_similarity, top_k=top_k,
+                            resumed_verses=len(processed)))
+
+    lsh_neighbors = None
+    if method == "lsh":
+        lsh_neighbors = lsh_candidate_neighbors(corpus, min_similarity, check_recall, info)
+
+    # شرائح بحجم عمل ~CHECKPOINT_EVERY آية → نقطة استئناف بعد كل شريحة
+    num_shards = max(workers * SHARDS_PER_WORKER if workers > 1 else 1,
+                     -(-len(pending) // CHECKPOINT_EVERY))
+    shards = split_shards(pending, num_shards, total_verses)
+    shard_neighbors = [
+        None if lsh_neighbors is None else {i: lsh_neighbors[i] for i in shard if i in lsh_neighbors}
+        for shard in shards
+    ]
+    info['shards'] = len(shards)
+
+    shard_results: Dict[int, dict] = {}
+    total_work = sum(total_verses - i for i in pending) or 1
+    done_work = 0
+    total_pairs_found = 0
+    total_comparisons_done = 0
+
+    def collect(shard_id: int, shard_result: dict):
+        nonlocal done_work, total_pairs_found, total_comparisons_done
+        shard_results[shard_id] = shard_result
+        processed.extend(shard_result['processed'])
+        merge_heaps(heaps, shard_result.pop('heaps'), top_k)
+        done_work += sum(total_verses - i for i in shards[shard_id])
+        total_pairs_found += shard_result['pairs_found']
+        total_comparisons_done += shard_result['comparisons']
+
+        completed = len(processed)
+        event = progress_event('similarity', completed, total_verses, start_time, done_work, total_work,
+                               total_comparisons_done, pairs_found=total_pairs_found,
+                               resumed_verses=info['resumed_verses'])
+        progress(event)
+
+        # 💾 نقطة استئناف (الشرائح المكتملة فقط)
+        if len(shard_results) < len(shards):
+            try:
+                save_checkpoint(corpus, processed, heaps, meta, checkpoint_path)
+            except Exception as e:
+                print(f"   ⚠️ خطأ في الحفظ المؤقت: {e}")
+
+    if workers == 1:
+        for shard_id, shard in enumerate(shards):
+            collect(shard_id, build_shard(shard, min_similarity, top_k, shard_neighbors[shard_id], corpus))
+    elif shards:
+        # المدوّنة الحالية تصبح مدوّنة العمليات الفرعية (موروثة مع fork)
+        corpus_module.CORPUS = corpus
+        with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(),
+                                 initializer=init_worker) as executor:
+            futures = {
+                executor.submit(build_shard, shard, min_similarity, top_k, shard_neighbors[shard_id]): shard_id
+                for shard_id, shard in enumerate(shards)
+            }
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+
+    store, _ = store_from_rows(corpus, heaps_to_rows(corpus, heaps),
+                               {'method': method, 'min_similarity': min_similarity, 'top_k': top_k})
+
+    # حفظ نهائي
+    try:
+        save_store(store, path)
+        print(f"\n✅ تم حفظ similarity cache: {len(store)} آية ({path}، {store.nbytes / 1024:.0f} KB)")
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+    except Exception as e:
+        print(f"❌ خطأ في حفظ similarity cache: {e}")
+
+    elapsed = time.time() - start_time
+    prefilter_stats = PrefilterStats()
+    for shard_result in shard_results.values():
+        prefilter_stats.merge(shard_result['prefilter'])
+    total_comparisons = sum(r['comparisons'] for r in shard_results.values())
+    skipped_basmala = int(corpus.basmala_mask.sum())
+    total_results = store.nnz
+
+    built_verses = len(store) - skipped_basmala
+    avg_results_per_verse = total_results / built_verses if built_verses > 0 else 0
+
+    info['total_comparisons'] = total_comparisons
+    info['prefilter'] = prefilter_stats.to_dict()
+    info['elapsed_seconds'] = round(elapsed, 2)
+
+    print("="*60)
+    print("✅ اكتمل بناء similarity cache")
+    print(f"   ⏱️  الزمن: {elapsed/60:.1f} دقيقة ({elapsed:.0f} ثانية)")
+    print(f"   👷 العمليات: {workers} | الشرائح: {len(shards)}")
+    if info['resumed_verses']:
+        print(f"   💾 مستأنفة من نقطة محفوظة: {info['resumed_verses']} آية")
+    print(f"   📊 المقارنات (كل زوج مرة واحدة): {total_comparisons:,}")
+    print(f"   🚧 المرشّحات: {prefilter_stats}")
+    print(f"   ✅ المتشابهات: {total_results:,}")
+    print(f"   🚫 البسملات المستبعدة: {skipped_basmala}")
+    print(f"   📈 متوسط النتائج/آية: {avg_results_per_verse:.1f}")
+    print(f"   💾 الحجم: {store.nbytes / 1024:.0f} KB")
+    print("="*60)
+
+    return store, info
+
+# ============================================
+# 🖥️ سطر الأوامر
+# ============================================
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="بناء similarity cache على عدة عمليات")
+    parser.add_argument("--workers", type=int, default=0, help="عدد العمليات (0 = كل الأنوية)")
+    parser.add_argument("--min-similarity", type=float, default=0.50, help="الحد الأدنى للتشابه")
+    parser.add_argument("--method", choices=["exact", "lsh"], default="exact")
+    parser.add_argument("--top-k", type=int, default=MAX_RESULTS, help="عدد أفضل المتشابهات لكل آية")
+    parser.add_argument("--check-recall", action="store_true", help="قياس استرجاع LSH")
+    parser.add_argument("--no-resume", action="store_true", help="تجاهل نقطة الاستئناف والبدء من الصفر")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        init_db(db)
+        corpus = load_corpus(db)
+    finally:
+        db.close()
+
+    build_cache(corpus, args.min_similarity, args.method, args.check_recall, args.workers,
+                not args.no_resume, args.top_k)
+
+if __name__ == "__main__":
+    main()
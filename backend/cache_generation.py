@@ -0,0 +1,107 @@
+"""
+أجيال الـ caches (Generations) - تبديل ذري بدون توقف
+===========================================
+كل الـ caches المشتقة (similarity cache، مصفوفة الأزواج، إحصائيات الكلمات، فهرس الـ n-grams، توفر فهارس FTS5)
+تُجمع في جيل واحد للقراءة فقط:
+
+✅ إعادة البناء تتم جانباً (كائنات جديدة) ثم تُنشر بتعيين واحد لـ CACHE_GENERATION
+   → الطلب الجاري لا يرى cache نصف ممتلئ ولا خليطاً من جيلين
+✅ الطلب يأخذ الجيل مرة واحدة (current_generation) ويستخدمه حتى النهاية
+✅ رقم الجيل يتزايد مع كل نشر ويُعاد في الاستجابات (cache_generation)
+✅ الذاكرات المشتقة (lru_cache) مفتاحها الجيل + تُفرَّغ عند النشر (on_publish)
+"""
+
+import threading
+import time
+from typing import Callable, List, Optional
+
+# ============================================
+# 🧬 الجيل
+# ============================================
+class CacheGeneration:
+    """لقطة ثابتة من كل الـ caches - المساواة والـ hash برقم الجيل (مفتاح صالح لـ lru_cache)"""
+
+    __slots__ = ('number', 'similarity_cache', 'similarity_build_info', 'similarity_pairs',
+                 'word_stats', 'ngram_index', 'fts_available', 'fts_clean_available', 'fts_trigram_available',
+                 'published_at', 'changed')
+
+    def __init__(self, number: int, similarity_cache=None, similarity_build_info: Optional[dict] = None,
+                 similarity_pairs=None, word_stats=None, ngram_index=None, fts_available: bool = False,
+                 fts_clean_available: bool = False, fts_trigram_available: bool = False,
+                 changed: tuple = ()):
+        self.number = number
+        self.similarity_cache = similarity_cache if similarity_cache is not None else {}
+        self.similarity_build_info = similarity_build_info or {}
+        self.similarity_pairs = similarity_pairs
+        self.word_stats = word_stats if word_stats is not None else {}
+        self.ngram_index = ngram_index  # NgramIndex أو None (/autocomplete/phrase)
+        self.fts_available = fts_available
+        self.fts_clean_available = fts_clean_available  # verses_clean_fts (النص المُطبَّع)
+        self.fts_trigram_available = fts_trigram_available  # verses_trigram_fts (البحث الجزئي)
+        self.published_at = time.time()
+        self.changed = changed
+
+    def __hash__(self) -> int:
+        return hash(self.number)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CacheGeneration) and other.number == self.number
+
+    def pairs_cover(self, min_similarity: float) -> bool:
+        """هل مصفوفة الأزواج في هذا الجيل تغطي العتبة بالكامل؟"""
+        return self.similarity_pairs is not None and self.similarity_pairs.covers(min_similarity)
+
+    def to_dict(self) -> dict:
+        return {
+            'number': self.number,
+            'published_at': self.published_at,
+            'changed': list(self.changed),
+            'similarity_cache_size': len(self.similarity_cache),
+            'similarity_pairs': self.similarity_pairs.nnz if self.similarity_pairs is not None else 0,
+            'word_stats_cache_size': len(self.word_stats),
+            'ngram_index_size': len(self.ngram_index) if self.ngram_index is not None else 0,
+            'fts_available': self.fts_available,
+            'fts_clean_available': self.fts_clean_available,
+            'fts_trigram_available': self.fts_trigram_available
+        }
+
+# ============================================
+# 📣 النشر
+# ============================================
+CACHE_GENERATION = CacheGeneration(0)
+PUBLISH_LOCK = threading.Lock()
+PUBLISH_LISTENERS: List[Callable[[CacheGeneration], None]] = []
+
+def current_generation() -> CacheGeneration:
+    """الجيل المنشور حالياً (خذه مرة واحدة في بداية الطلب)"""
+    return CACHE_GENERATION
+
+def publish_generation(**artifacts) -> CacheGeneration:
+    """
+    نشر جيل جديد: ما لم يُمرَّر يُنقل من الجيل الحالي، ثم تبديل ذري واحد
+
+    مثال: publish_generation(similarity_cache=store, similarity_build_info=info)
+    """
+    global CACHE_GENERATION
+
+    with PUBLISH_LOCK:
+        previous = CACHE_GENERATION
+        fields = {name: getattr(previous, name) for name in
+                  ('similarity_cache', 'similarity_build_info', 'similarity_pairs', 'word_stats', 'ngram_index',
+                   'fts_available', 'fts_clean_available', 'fts_trigram_available')}
+        unknown = set(artifacts) - set(fields)
+        if unknown:
+            raise TypeError(f"caches غير معروفة: {sorted(unknown)}")
+        fields.update(artifacts)
+        generation = CacheGeneration(previous.number + 1, changed=tuple(sorted(artifacts)), **fields)
+        CACHE_GENERATION = generation
+
+    for listener in PUBLISH_LISTENERS:
+        listener(generation)
+    print(f"🧬 نشر الجيل {generation.number} ({', '.join(generation.changed) or '-'})")
+    return generation
+
+def on_publish(listener: Callable[[CacheGeneration], None]) -> Callable[[CacheGeneration], None]:
+    """تسجيل دالة تُستدعى بعد كل نشر (تفريغ الذاكرات المشتقة)"""
+    PUBLISH_LISTENERS.append(listener)
+    return listener
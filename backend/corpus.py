@@ -0,0 +1,318 @@
+"""
+مدوّنة الآيات في الذاكرة (Corpus) - تُبنى مرة واحدة عند بدء التشغيل
+===========================================
+بدلاً من db.query(Verse).all() في كل طلب (6,236 كائن ORM + to_dict لكل واحد)
+نحمّل الآيات مرة واحدة في بنية للقراءة فقط:
+
+✅ أعمدة NumPy مضغوطة (id / surah / ayah / juz / word_count) للتصفية السريعة
+✅ النص الأصلي والنص المُطبَّع وقوائم الكلمات
+✅ بحث O(1) بالمعرّف أو بـ (السورة، الآية)
+✅ VerseRecord بنفس واجهة Verse (الحقول + to_dict) → الدوال الحالية تعمل بدون تعديل
+✅ قاموس كلمات int32 + نواة تشابه (word_kernel) بنفس نتيجة SequenceMatcher
+✅ مرشّحات الحدود العليا قبل النواة عند تمرير عتبة (threshold)
+✅ فهرس مقلوب (inverted_index) يرشّح الآيات التي تشارك كلمات كافية فقط
+✅ قناع البسملات (basmala_mask) محسوب مرة واحدة
+"""
+
+import hashlib
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from database import Verse
+from similarity import normalize_arabic_text as clean_text
+from word_kernel import (build_vocabulary, encode_words, encode_text, pack_token_ids, build_b2j,
+                         count_words, word_ratio, filtered_ratio, EncodedText, PrefilterStats)
+from inverted_index import InvertedIndex
+
+# ============================================
+# 🚫 البسملة
+# ============================================
+BASMALA_CLEAN_VARIATIONS = [
+    clean_text("بسم الله الرحمن الرحيم"),
+    clean_text("بسم الله الرحمن الرحيم"),
+    clean_text("بِسْمِ اللَّهِ الرَّحْمَٰنِ الرَّحِيمِ"),
+    clean_text("بِّسْمِ اللَّهِ الرَّحْمَٰنِ الرَّحِيمِ"),
+    "بسم الله الرحمن الرحيم",  # النص النظيف
+]
+
+def is_basmala_verse(verse: Verse) -> bool:
+    """التحقق من أن الآية هي البسملة - نسخة محسنة"""
+    if verse.ayah != 1 or verse.surah == 9:  # سورة التوبة لا تبدأ بالبسملة
+        return False
+    
+    verse_clean = verse.text_clean or clean_text(verse.text)
+    
+    # التحقق من جميع الأشكال
+    for basmala in BASMALA_CLEAN_VARIATIONS:
+        if (verse_clean == basmala or 
+            verse_clean.startswith(basmala) or
+            basmala in verse_clean):
+            return True
+    
+    # استبعاد الآيات القصيرة جداً التي قد تكون بسملة
+    return len(verse_clean) < 30 and any(word in verse_clean for word in ['بسم', 'الله', 'الرحمن', 'الرحيم'])
+
+# ============================================
+# 📖 سجل آية (للقراءة فقط)
+# ============================================
+class VerseRecord:
+    """نسخة خفيفة من Verse - نفس أسماء الحقول ونفس to_dict"""
+
+    __slots__ = ('index', 'id', 'surah', 'surah_name', 'ayah', 'text', 'juz',
+                 'text_clean', 'word_count', 'words')
+
+    def __init__(self, index: int, id: int, surah: int, surah_name: str, ayah: int,
+                 text: str, juz: int, text_clean: str, words: Tuple[str, ...]):
+        self.index = index  # الموقع داخل أعمدة المدوّنة
+        self.id = id
+        self.surah = surah
+        self.surah_name = surah_name
+        self.ayah = ayah
+        self.text = text
+        self.juz = juz
+        self.text_clean = text_clean
+        self.word_count = len(words)
+        self.words = words
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "surah": self.surah,
+            "surah_name": self.surah_name,
+            "ayah": self.ayah,
+            "text": self.text,
+            "juz": self.juz
+        }
+
+# ============================================
+# 📚 المدوّنة الكاملة
+# ============================================
+class QuranCorpus:
+    """
+    المدوّنة الكاملة بترتيب المعرّف (نفس ترتيب db.query(Verse).all())
+
+    الأعمدة الرقمية مصفوفات NumPy (int32) للتصفية بالأقنعة،
+    والسجلات تحمل قيم Python العادية (قابلة للتحويل إلى JSON مباشرة)
+    """
+
+    __slots__ = ('ids', 'surahs', 'ayahs', 'juzs', 'word_counts',
+                 'surah_names', 'texts', 'texts_clean', 'tokens',
+                 'records', 'index_by_id', 'index_by_ref',
+                 'vocab', 'token_ids', 'token_data', 'token_offsets', 'b2j', 'token_counts',
+                 'inverted_index', 'basmala_mask', 'checksum')
+
+    def __init__(self, rows: List[Tuple[int, int, str, int, str, int, str]],
+                 vocab: Optional[Dict[str, int]] = None, inverted_index: Optional[InvertedIndex] = None):
+        """
+        rows: (id, surah, surah_name, ayah, text, juz, text_clean) لكل آية
+        vocab / inverted_index: محسوبة مسبقاً (من الحزمة المجمّعة - bundle) بدلاً من بنائها هنا
+        """
+        rows = sorted(rows, key=lambda row: row[0])
+
+        self.records: List[VerseRecord] = []
+        self.index_by_id: Dict[int, int] = {}
+        self.index_by_ref: Dict[Tuple[int, int], int] = {}
+        self.surah_names: Dict[int, str] = {}
+
+        for index, (verse_id, surah, surah_name, ayah, text, juz, text_clean) in enumerate(rows):
+            record = VerseRecord(index, verse_id, surah, surah_name, ayah, text, juz,
+                                 text_clean, tuple(text_clean.split()))
+            self.records.append(record)
+            self.index_by_id[verse_id] = index
+            self.index_by_ref[(surah, ayah)] = index
+            self.surah_names.setdefault(surah, surah_name)
+
+        self.ids = np.array([r.id for r in self.records], dtype=np.int32)
+        self.surahs = np.array([r.surah for r in self.records], dtype=np.int32)
+        self.ayahs = np.array([r.ayah for r in self.records], dtype=np.int32)
+        self.juzs = np.array([r.juz for r in self.records], dtype=np.int32)
+        self.word_counts = np.array([r.word_count for r in self.records], dtype=np.int32)
+
+        self.texts = tuple(r.text for r in self.records)
+        self.texts_clean = tuple(r.text_clean for r in self.records)
+        self.tokens = tuple(r.words for r in self.records)
+
+        # 🔢 معرّفات الكلمات: مصفوفة int32 مضغوطة + نسخة tuple وفهرس مواقع لكل آية (للنواة)
+        self.vocab = vocab if vocab is not None else build_vocabulary(self.tokens)
+        self.token_ids = tuple(encode_words(words, self.vocab) for words in self.tokens)
+        self.token_data, self.token_offsets = pack_token_ids(self.token_ids)
+        self.b2j = tuple(build_b2j(ids) for ids in self.token_ids)
+        self.token_counts = tuple(count_words(ids) for ids in self.token_ids)
+        self.inverted_index = inverted_index if inverted_index is not None else InvertedIndex(self.token_counts)
+
+        # 🚫 البسملات محسوبة مرة واحدة (فحص O(1) داخل الحلقات)
+        self.basmala_mask = np.array([is_basmala_verse(r) for r in self.records], dtype=bool)
+
+        # 🔏 بصمة المحتوى (كل ما تنسخه الملفات المشتقة: المعرّفات والموقع والنص بالتشكيل والمُطبَّع)
+        # - للتحقق من توافق الملفات المحفوظة (artifacts)
+        digest = hashlib.sha256(self.ids.tobytes())
+        digest.update(self.surahs.tobytes())
+        digest.update(self.ayahs.tobytes())
+        digest.update(self.juzs.tobytes())
+        for record in self.records:
+            digest.update(f"{record.surah_name}\t{record.text}\t{record.text_clean}\n".encode('utf-8'))
+        self.checksum = digest.hexdigest()[:16]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    # ============================================
+    # 🔎 البحث المباشر O(1)
+    # ============================================
+    def get(self, verse_id: int) -> Optional[VerseRecord]:
+        """جلب آية بالمعرّف"""
+        index = self.index_by_id.get(verse_id)
+        return self.records[index] if index is not None else None
+
+    def get_by_ref(self, surah: int, ayah: int) -> Optional[VerseRecord]:
+        """جلب آية بالسورة ورقم الآية"""
+        index = self.index_by_ref.get((surah, ayah))
+        return self.records[index] if index is not None else None
+
+    def indices_of(self, verse_ids: np.ndarray) -> np.ndarray:
+        """مواقع عدة معرّفات دفعة واحدة (المعرّفات مرتبة تصاعدياً في المدوّنة)"""
+        return np.searchsorted(self.ids, verse_ids)
+
+    def all(self) -> List[VerseRecord]:
+        """جميع الآيات بترتيب المعرّف (نسخة جديدة من القائمة - آمنة للخلط)"""
+        return list(self.records)
+
+    # ============================================
+    # ⚡ التشابه اللفظي (نفس نتيجة calculate_similarity_clean)
+    # ============================================
+    def encode(self, text_clean: str) -> EncodedText:
+        """تحويل نص مُطبَّع (استعلام مثلاً) إلى معرّفات القاموس"""
+        return encode_text(text_clean, self.vocab)
+
+    def similarity(self, verse1: VerseRecord, verse2: VerseRecord, threshold: float = 0.0,
+                   stats: Optional[PrefilterStats] = None) -> float:
+        """
+        التشابه بين آيتين = calculate_similarity_clean(verse1.text_clean, verse2.text_clean)
+
+        مع threshold: الأزواج التي لا يمكن أن تبلغ العتبة تُقصى مبكراً وتُرجع 0.0
+        """
+        i, j = verse1.index, verse2.index
+        return filtered_ratio(self.token_ids[i], self.token_ids[j], self.b2j[j],
+                              self.token_counts[i], self.token_counts[j], threshold, stats)
+
+    def query_similarity(self, query: EncodedText, verse: VerseRecord, threshold: float = 0.0,
+                         stats: Optional[PrefilterStats] = None) -> float:
+        """التشابه بين استعلام مُرمَّز (encode) وآية - بنفس قواعد similarity"""
+        j = verse.index
+        return filtered_ratio(query.ids, self.token_ids[j], self.b2j[j],
+                              query.counts, self.token_counts[j], threshold, stats)
+
+    def ratio(self, i: int, j: int) -> float:
+        """النواة الدقيقة بين موقعين بدون مرشّحات (المستدعي فحص الحدود مسبقاً)"""
+        return word_ratio(self.token_ids[i], self.token_ids[j], self.b2j[j])
+
+    def similarity_bounds(self, counts: Dict[int, int], length: int) -> np.ndarray:
+        """
+        الحد الأعلى للتشابه مع كل آية دفعة واحدة: 2*تقاطع الكيسين/(m+n)
+
+        نفس صيغة حد الكيس في filtered_ratio (ونفس حساب الفاصلة العائمة) → المقارنة بالعتبة دقيقة
+        """
+        return 2.0 * self.inverted_index.overlaps(counts) / (length + self.word_counts)
+
+    def candidates(self, counts: Dict[int, int], threshold: float,
+                   stats: Optional[PrefilterStats] = None) -> List[VerseRecord]:
+        """
+        الآيات التي يمكن أن تبلغ العتبة مع نص كيس كلماته counts (بترتيب المعرّف)
+
+        الباقي لا يمكن أن يبلغها حتماً → يُحسب في stats.index_skipped دون فحص
+        """
+        indices = self.inverted_index.candidates(counts, threshold)
+        if stats is not None:
+            stats.index_skipped += len(self.records) - len(indices)
+        records = self.records
+        return [records[i] for i in indices.tolist()]
+
+    def similar_candidates(self, verse: VerseRecord, threshold: float,
+                           stats: Optional[PrefilterStats] = None) -> List[VerseRecord]:
+        """مرشّحو التشابه مع آية من المدوّنة"""
+        return self.candidates(self.token_counts[verse.index], threshold, stats)
+
+    # ============================================
+    # 🎯 التصفية حسب النطاق
+    # ============================================
+    def scope_mask(self, surah: Optional[int] = None, juz: Optional[int] = None,
+                   juz_range: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        """قناع منطقي للآيات داخل النطاق (بدون شروط = كل الآيات)"""
+        mask = np.ones(len(self.records), dtype=bool)
+        if surah is not None:
+            mask &= self.surahs == surah
+        if juz is not None:
+            mask &= self.juzs == juz
+        if juz_range is not None:
+            mask &= (self.juzs >= juz_range[0]) & (self.juzs <= juz_range[1])
+        return mask
+
+    def select(self, surah: Optional[int] = None, juz: Optional[int] = None,
+               juz_range: Optional[Tuple[int, int]] = None) -> List[VerseRecord]:
+        """الآيات داخل النطاق بترتيب المعرّف"""
+        if surah is None and juz is None and juz_range is None:
+            return self.all()
+        indices = np.flatnonzero(self.scope_mask(surah, juz, juz_range))
+        return [self.records[i] for i in indices]
+
+    def in_scope(self, record: VerseRecord, surah: Optional[int] = None, juz: Optional[int] = None,
+                 juz_range: Optional[Tuple[int, int]] = None) -> bool:
+        """هل الآية داخل النطاق؟"""
+        if surah is not None and record.surah != surah:
+            return False
+        if juz is not None and record.juz != juz:
+            return False
+        if juz_range is not None and not (juz_range[0] <= record.juz <= juz_range[1]):
+            return False
+        return True
+
+    def random_verse(self, surah: Optional[int] = None, juz: Optional[int] = None,
+                     juz_range: Optional[Tuple[int, int]] = None) -> Optional[VerseRecord]:
+        """آية عشوائية داخل النطاق (بديل ORDER BY RANDOM())"""
+        if surah is None and juz is None and juz_range is None:
+            return random.choice(self.records) if self.records else None
+        indices = np.flatnonzero(self.scope_mask(surah, juz, juz_range))
+        if len(indices) == 0:
+            return None
+        return self.records[int(random.choice(indices))]
+
+# ============================================
+# 🏗️ بناء المدوّنة (مرة واحدة لكل عملية)
+# ============================================
+CORPUS: Optional[QuranCorpus] = None
+
+def build_corpus(db: Session) -> QuranCorpus:
+    """قراءة جدول الآيات مرة واحدة (أعمدة فقط بدون كائنات ORM)"""
+    rows = db.query(
+        Verse.id, Verse.surah, Verse.surah_name, Verse.ayah,
+        Verse.text, Verse.juz, Verse.text_clean
+    ).all()
+    return QuranCorpus([tuple(row) for row in rows])
+
+def load_corpus(db: Session) -> QuranCorpus:
+    """بناء المدوّنة وتخزينها في CORPUS (يُستدعى من lifespan)"""
+    global CORPUS
+
+    start_time = time.time()
+    CORPUS = build_corpus(db)
+    elapsed = time.time() - start_time
+    print(f"✅ تم تحميل المدوّنة في الذاكرة: {len(CORPUS)} آية في {elapsed:.2f}ث")
+    return CORPUS
+
+def set_corpus(corpus: QuranCorpus) -> QuranCorpus:
+    """تثبيت مدوّنة جاهزة (من الحزمة المجمّعة) بدلاً من بنائها من قاعدة البيانات"""
+    global CORPUS
+    CORPUS = corpus
+    return CORPUS
+
+def get_corpus(db: Optional[Session] = None) -> QuranCorpus:
+    """المدوّنة الحالية - تُبنى عند أول استخدام إذا لم يشغّل lifespan"""
+    if CORPUS is None:
+        if db is None:
+            raise RuntimeError("المدوّنة غير محمّلة - استدعِ load_corpus(db) أولاً")
+        load_corpus(db)
+    return CORPUS
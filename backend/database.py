@@ -2,24 +2,61 @@
 إعداد قاعدة البيانات - النسخة المبسطة (تعتمد على CSV فقط)
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Text
+from sqlalchemy import create_engine, Column, Integer, String, Text, func, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
-from typing import Iterator
-import pandas as pd
+from typing import Iterator, Optional
+import hashlib
+import json
 import os
 
+from similarity import normalize_arabic_text, NORMALIZER_VERSION
+
+# ============================================
+# 📂 ملف CSV المستخدم
+# ============================================
+CSV_FILE = "quran_data_arabic_juz.csv"
+
+def file_checksum(path: str) -> str:
+    """بصمة محتوى ملف (أول 16 حرفاً من sha256)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
 # ============================================
 # ⚙️ إعداد الاتصال بقاعدة البيانات
 # ============================================
-DATABASE_URL = "sqlite:///./quran.db"
+# 📦 الحزمة المجمّعة (python -m bundle) تحمل قاعدة بياناتها الجاهزة (الآيات + FTS5)
+BUNDLE_DIR = os.environ.get("QURAN_BUNDLE_DIR", "quran_bundle")
+BUNDLE_MANIFEST_FILE = os.path.join(BUNDLE_DIR, "manifest.json")
+BUNDLE_FORMAT = "bundle-v6"   # v2: + verses_clean_fts، v3: + verses_trigram_fts، v4: + word_stats_store، v5: + prefix_top، v6: + ngram_index
+
+def bundle_database_file() -> Optional[str]:
+    """
+    قاعدة بيانات الحزمة إذا كانت مبنية من ملف CSV الحالي وبالصيغة وقواعد التطبيع الحالية، وإلا None
+
+    الحزمة القديمة لا تُستخدم قاعدتها أبداً - المسار العادي يعيد تحميل الآيات في ./quran.db
+    ولا يكتب داخل الحزمة (التحقق الكامل من المدوّنة في bundle.open_bundle)
+    """
+    if not os.path.exists(BUNDLE_MANIFEST_FILE):
+        return None
+    with open(BUNDLE_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != BUNDLE_FORMAT or manifest.get('normalizer_version') != NORMALIZER_VERSION:
+        return None
+    if os.path.exists(CSV_FILE) and file_checksum(CSV_FILE) != manifest.get('source_checksum'):
+        return None
+    return os.path.join(BUNDLE_DIR, "quran.db")
+
+DATABASE_FILE = bundle_database_file() or "./quran.db"
+DATABASE_URL = f"sqlite:///{DATABASE_FILE}"
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-# ============================================
-# 📂 ملف CSV المستخدم
-# ============================================
-CSV_FILE = "quran_data_arabic_juz.csv"
+# 📂 مجلد الملفات المشتقة وقت التشغيل (دائماً خارج الحزمة - الحزمة للقراءة فقط)
+DATA_DIR = "."
 
 # ============================================
 # 📖 نموذج الآية
@@ -33,6 +70,10 @@ class Verse(Base):
     ayah = Column(Integer)
     text = Column(Text)
     juz = Column(Integer, index=True)  # ✅ مهم للبحث السريع
+    
+    # ⚡ النص بعد التطبيع محسوب مسبقاً (بدلاً من clean_text لكل آية في كل طلب)
+    text_clean = Column(Text)
+    word_count = Column(Integer)
 
     def to_dict(self):
         return {
@@ -44,23 +85,51 @@ class Verse(Base):
             "juz": self.juz
         }
 
+# ============================================
+# 🏷️ بيانات وصفية (نسخة التطبيع المخزّن)
+# ============================================
+class AppMetadata(Base):
+    __tablename__ = "app_metadata"
+    
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+NORMALIZER_VERSION_KEY = "normalizer_version"
+SOURCE_CHECKSUM_KEY = "source_checksum"   # بصمة ملف CSV الذي حُمّلت منه الآيات
+
 # ============================================
 # 💾 تحميل البيانات من ملف CSV
 # ============================================
 def load_data_from_csv(db: Session, csv_path: str = CSV_FILE) -> bool:
-    """تحميل بيانات القرآن من ملف CSV"""
+    """
+    تحميل بيانات القرآن من ملف CSV
+    
+    إذا كانت القاعدة معبأة: يُعاد التحميل فقط إذا تغيّرت بصمة الملف عن آخر تحميل
+    (القواعد الأقدم بدون بصمة تُعتبر مطابقة للملف الحالي)
+    """
     
+    source_checksum = file_checksum(csv_path) if os.path.exists(csv_path) else None
+    reload = False
     if db.query(Verse).count() > 0:
-        print("✅ قاعدة البيانات معبأة بالفعل. تخطي تحميل CSV.")
-        return True
+        stored = db.query(AppMetadata).filter(AppMetadata.key == SOURCE_CHECKSUM_KEY).first()
+        if source_checksum is None or stored is None or stored.value == source_checksum:
+            if stored is None and source_checksum is not None:
+                db.merge(AppMetadata(key=SOURCE_CHECKSUM_KEY, value=source_checksum))
+                db.commit()
+            print("✅ قاعدة البيانات معبأة بالفعل. تخطي تحميل CSV.")
+            return True
+        print(f"🔄 ملف {csv_path} تغيّر منذ آخر تحميل ({stored.value} → {source_checksum}) - إعادة التحميل")
+        reload = True
 
-    if not os.path.exists(csv_path):
+    if source_checksum is None:
         print(f"❌ الملف غير موجود: {csv_path}")
         return False
     
     print(f"📂 جاري تحميل البيانات من {csv_path}...")
     
     try:
+        # pandas يُستورد هنا فقط (~0.3ث) - الإقلاع من قاعدة معبأة أو من الحزمة لا يحتاجه
+        import pandas as pd
         df = pd.read_csv(csv_path)
         print(f"📊 الأعمدة الموجودة: {df.columns.tolist()}")
         
@@ -74,6 +143,10 @@ def load_data_from_csv(db: Session, csv_path: str = CSV_FILE) -> bool:
         
         print(f"✅ جميع الأعمدة المطلوبة موجودة")
         
+        if reload:
+            # الآيات المحذوفة من الملف لا يجب أن تبقى (merge وحده لا يحذف)
+            db.query(Verse).delete()
+        
         # ✅ التحقق من صحة البيانات
         print("\n🔍 فحص صحة البيانات...")
         
@@ -103,13 +176,17 @@ def load_data_from_csv(db: Session, csv_path: str = CSV_FILE) -> bool:
                 print(f"   ⚠️ تخطي الآية {row['id']}: juz فارغ")
                 continue
             
+            verse_text = str(row['text']).strip()
+            verse_clean = normalize_arabic_text(verse_text)
             verse = Verse(
                 id=int(row['id']),
                 surah=int(row['surah']),
                 surah_name=str(row['surah_name']).strip(),  # ✅ إزالة مسافات زائدة
                 ayah=int(row['ayah']),
-                text=str(row['text']).strip(),
-                juz=int(row['juz'])
+                text=verse_text,
+                juz=int(row['juz']),
+                text_clean=verse_clean,
+                word_count=len(verse_clean.split())
             )
             db.merge(verse)
             
@@ -117,6 +194,8 @@ def load_data_from_csv(db: Session, csv_path: str = CSV_FILE) -> bool:
             if (idx + 1) % 1000 == 0:
                 print(f"   📊 تم تحميل {idx + 1}/{len(df)} آية...")
         
+        db.merge(AppMetadata(key=NORMALIZER_VERSION_KEY, value=NORMALIZER_VERSION))
+        db.merge(AppMetadata(key=SOURCE_CHECKSUM_KEY, value=source_checksum))
         db.commit()
         
         # ✅ التحقق النهائي
@@ -132,7 +211,6 @@ def load_data_from_csv(db: Session, csv_path: str = CSV_FILE) -> bool:
         print(f"\n📋 توزيع الآيات على الأجزاء:")
         juz_counts = db.query(Verse.juz, func.count(Verse.id)).group_by(Verse.juz).order_by(Verse.juz).all()
         
-        from sqlalchemy import func
         for juz_num, count in juz_counts:
             print(f"   الجزء {juz_num}: {count} آية")
         
@@ -145,6 +223,60 @@ def load_data_from_csv(db: Session, csv_path: str = CSV_FILE) -> bool:
         db.rollback()
         return False
 
+# ============================================
+# ⚡ النص المُطبَّع المخزّن (text_clean / word_count)
+# ============================================
+def add_missing_verse_columns():
+    """إضافة أعمدة text_clean و word_count لقواعد البيانات القديمة (create_all لا يعدّل الجداول)"""
+    existing = {col['name'] for col in inspect(engine).get_columns(Verse.__tablename__)}
+    
+    with engine.begin() as conn:
+        if 'text_clean' not in existing:
+            conn.execute(text("ALTER TABLE verses ADD COLUMN text_clean TEXT"))
+            print("   ➕ تمت إضافة العمود text_clean")
+        if 'word_count' not in existing:
+            conn.execute(text("ALTER TABLE verses ADD COLUMN word_count INTEGER"))
+            print("   ➕ تمت إضافة العمود word_count")
+
+def backfill_normalized_text(db: Session) -> int:
+    """
+    حساب text_clean و word_count للآيات التي تنقصها أو إذا تغيّرت قواعد التطبيع
+    
+    Returns:
+        عدد الآيات التي أعيد حسابها
+    """
+    stored = db.query(AppMetadata).filter(AppMetadata.key == NORMALIZER_VERSION_KEY).first()
+    version_changed = stored is None or stored.value != NORMALIZER_VERSION
+    
+    query = db.query(Verse.id, Verse.text)
+    if not version_changed:
+        query = query.filter((Verse.text_clean.is_(None)) | (Verse.word_count.is_(None)))
+    rows = query.all()
+    
+    if version_changed:
+        print(f"🔄 نسخة التطبيع تغيّرت ({stored.value if stored else 'غير موجودة'} → {NORMALIZER_VERSION})")
+    
+    if rows:
+        print(f"🔄 جاري حساب النص المُطبَّع لـ {len(rows)} آية...")
+        updates = []
+        for verse_id, verse_text in rows:
+            verse_clean = normalize_arabic_text(verse_text)
+            updates.append({
+                'id': verse_id,
+                'text_clean': verse_clean,
+                'word_count': len(verse_clean.split())
+            })
+        db.bulk_update_mappings(Verse, updates)
+    
+    if version_changed:
+        db.merge(AppMetadata(key=NORMALIZER_VERSION_KEY, value=NORMALIZER_VERSION))
+    
+    db.commit()
+    
+    if rows:
+        print(f"✅ تم تحديث النص المُطبَّع ({NORMALIZER_VERSION})")
+    return len(rows)
+
 # ============================================
 # 🏗️ تهيئة قاعدة البيانات
 # ============================================
@@ -152,7 +284,9 @@ def init_db(db: Session):
     """إنشاء الجداول وتحميل البيانات"""
     print("📝 جاري إنشاء الجداول في قاعدة البيانات...")
     Base.metadata.create_all(bind=engine)
+    add_missing_verse_columns()
     load_data_from_csv(db)
+    backfill_normalized_text(db)
 
 # ============================================
 # 🔄 جلسة قاعدة البيانات
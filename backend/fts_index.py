@@ -0,0 +1,270 @@
+"""
+فهرسا FTS5 داخل قاعدة البيانات (verses_fts و verses_clean_fts)
+===========================================
+منفصل عن main.py ليبنيه الخادم (/admin/build-fts، المهام) والحزمة المجمّعة (bundle) بنفس الطريقة:
+
+verses_fts (النص العثماني الأصلي):
+✅ جدول external content (content=verses) - لا يكرر النص
+✅ 'rebuild' عند الإنشاء أو عندما لا يطابق الـ manifest المدوّنة الحالية
+   (جدول content لا يتحدّث وحده عند تغيّر الآيات)
+
+verses_clean_fts (النص المُطبَّع - للبحث بالكتابة العادية مثل "الصلاه"):
+✅ يُملأ من text_clean في المدوّنة → نفس normalize_arabic_text المستخدم على الاستعلام
+✅ contentless (content='') - الفهرس فقط، والنص من المدوّنة في الذاكرة
+✅ عبارة FTS5 ("w1 w2" متجاورة) + بادئة لآخر كلمة (* أثناء الكتابة)
+✅ substring_candidates: مرشّحات البحث الجزئي بدون مسح كل الآيات
+   (المطابقة التي تبدأ داخل كلمة - مثل "صلاه" في "والصلاه" - من القاموس والفهرس المقلوب)
+
+verses_trigram_fts (النص الأصلي + المُطبَّع - للبحث الجزئي الحر في /search/fixed و /search/both):
+✅ tokenizer trigram: كل نص جزئي بطول 3+ أحرف = عبارة من ثلاثياته المتتالية
+   → تقاطع postings الثلاثيات داخل FTS5 بدلاً من LIKE '%q%' على كل الصفوف
+✅ contentless، والتحقق النهائي (q in text) على المستدعي
+✅ أقل من 3 أحرف: لا ثلاثيات → trigram_search يُرجع None والمستدعي يمسح
+
+الـ manifest لكل جدول صف في app_metadata (artifacts)
+"""
+
+import sqlite3
+from typing import List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from artifacts import build_manifest, manifest_problem, write_db_manifest, read_db_manifest
+
+# ============================================
+# ⚙️ الإعدادات
+# ============================================
+FTS_ARTIFACT = "verses_fts"
+FTS_FORMAT = "fts5-v1"
+CLEAN_FTS_ARTIFACT = "verses_clean_fts"
+CLEAN_FTS_FORMAT = "fts5-clean-v1"
+# بدون remove_diacritics: النص مُطبَّع مسبقاً، والكلمات تبقى كما في القاموس
+CLEAN_FTS_TOKENIZER = "unicode61 remove_diacritics 0"
+TRIGRAM_FTS_ARTIFACT = "verses_trigram_fts"
+TRIGRAM_FTS_FORMAT = "fts5-trigram-v1"
+TRIGRAM_FTS_COLUMNS = ("text", "text_clean")
+TRIGRAM_MIN_LENGTH = 3
+
+# ============================================
+# 🔎 الفحص والبناء
+# ============================================
+def fts_table_exists(database_file: str, table: str = FTS_ARTIFACT) -> bool:
+    conn = sqlite3.connect(database_file)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+        return cursor.fetchone() is not None
+    finally:
+        conn.close()
+
+def build_fts_table(database_file: str, db: Session, corpus) -> int:
+    """
+    إنشاء جدول FTS5 وملؤه إذا كان فارغاً أو قديماً
+
+    db: جلسة على نفس قاعدة البيانات (لقراءة وكتابة الـ manifest)
+    Returns:
+        عدد الآيات المفهرسة
+    """
+    problem = manifest_problem(read_db_manifest(db, FTS_ARTIFACT), FTS_ARTIFACT, FTS_FORMAT, corpus)
+
+    conn = sqlite3.connect(database_file)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS verses_fts
+            USING fts5(text, content=verses, content_rowid=id)
+        ''')
+
+        # ملء الفهرس (إذا كان فارغاً أو قديماً)
+        cursor.execute('SELECT COUNT(*) FROM verses_fts')
+        count = cursor.fetchone()[0]
+
+        if count == 0 or problem is not None:
+            cursor.execute("INSERT INTO verses_fts(verses_fts) VALUES('rebuild')")
+            print(f"✅ تم ملء فهرس FTS5 بالبيانات ({problem or 'فارغ'})")
+            cursor.execute('SELECT COUNT(*) FROM verses_fts')
+            count = cursor.fetchone()[0]
+        else:
+            print(f"✅ فهرس FTS5 موجود بالفعل: {count} آية")
+        conn.commit()
+    finally:
+        conn.close()
+
+    if problem is not None:
+        write_db_manifest(db, FTS_ARTIFACT, build_manifest(FTS_ARTIFACT, FTS_FORMAT, corpus))
+    return count
+
+def build_clean_fts_table(database_file: str, db: Session, corpus) -> int:
+    """
+    إنشاء جدول FTS5 على النص المُطبَّع وملؤه من المدوّنة إذا كان جديداً أو قديماً
+
+    Returns:
+        عدد الآيات المفهرسة
+    """
+    problem = manifest_problem(read_db_manifest(db, CLEAN_FTS_ARTIFACT), CLEAN_FTS_ARTIFACT,
+                               CLEAN_FTS_FORMAT, corpus)
+
+    conn = sqlite3.connect(database_file)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS verses_clean_fts
+            USING fts5(text_clean, content='', tokenize='{CLEAN_FTS_TOKENIZER}')
+        ''')
+
+        if problem is not None:
+            cursor.execute("INSERT INTO verses_clean_fts(verses_clean_fts) VALUES('delete-all')")
+            cursor.executemany(
+                "INSERT INTO verses_clean_fts(rowid, text_clean) VALUES (?, ?)",
+                ((record.id, record.text_clean) for record in corpus.records)
+            )
+            print(f"✅ تم ملء فهرس FTS5 للنص المُطبَّع ({problem}): {len(corpus)} آية")
+        else:
+            print(f"✅ فهرس FTS5 للنص المُطبَّع موجود بالفعل: {len(corpus)} آية")
+        conn.commit()
+    finally:
+        conn.close()
+
+    if problem is not None:
+        write_db_manifest(db, CLEAN_FTS_ARTIFACT, build_manifest(CLEAN_FTS_ARTIFACT, CLEAN_FTS_FORMAT, corpus))
+    return len(corpus)
+
+def build_trigram_fts_table(database_file: str, db: Session, corpus) -> int:
+    """
+    إنشاء جدول FTS5 بثلاثيات الأحرف (النص الأصلي + المُطبَّع) وملؤه من المدوّنة إذا كان جديداً أو قديماً
+
+    Returns:
+        عدد الآيات المفهرسة
+    """
+    problem = manifest_problem(read_db_manifest(db, TRIGRAM_FTS_ARTIFACT), TRIGRAM_FTS_ARTIFACT,
+                               TRIGRAM_FTS_FORMAT, corpus)
+
+    conn = sqlite3.connect(database_file)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS verses_trigram_fts
+            USING fts5(text, text_clean, content='', tokenize='trigram')
+        ''')
+
+        if problem is not None:
+            cursor.execute("INSERT INTO verses_trigram_fts(verses_trigram_fts) VALUES('delete-all')")
+            cursor.executemany(
+                "INSERT INTO verses_trigram_fts(rowid, text, text_clean) VALUES (?, ?, ?)",
+                ((record.id, record.text, record.text_clean) for record in corpus.records)
+            )
+            print(f"✅ تم ملء فهرس الثلاثيات ({problem}): {len(corpus)} آية")
+        else:
+            print(f"✅ فهرس الثلاثيات موجود بالفعل: {len(corpus)} آية")
+        conn.commit()
+    finally:
+        conn.close()
+
+    if problem is not None:
+        write_db_manifest(db, TRIGRAM_FTS_ARTIFACT, build_manifest(TRIGRAM_FTS_ARTIFACT, TRIGRAM_FTS_FORMAT, corpus))
+    return len(corpus)
+
+# ============================================
+# 🔍 بناء الاستعلامات والبحث
+# ============================================
+def fts_phrase(words: Sequence[str], prefix: bool = False) -> str:
+    """
+    عبارة FTS5: الكلمات متجاورة وبالترتيب ("w1 w2")
+
+    prefix: آخر كلمة بادئة ("w1 w2" *) - للبحث أثناء الكتابة والمطابقة الجزئية
+    """
+    phrase = '"' + ' '.join(word.replace('"', '""') for word in words) + '"'
+    return f"{phrase} *" if prefix else phrase
+
+def clean_fts_search(database_file: str, match: str, limit: Optional[int] = None,
+                     by_rank: bool = False) -> Optional[List[int]]:
+    """
+    معرّفات الآيات المطابقة في verses_clean_fts
+
+    by_rank: ترتيب bm25 (البحث الفوري) بدلاً من ترتيب المصحف
+    Returns:
+        المعرّفات، أو None إذا تعذّر الاستعلام (الجدول غير موجود أو استعلام غير صالح)
+    """
+    order = "rank" if by_rank else "rowid"
+    conn = sqlite3.connect(database_file)
+    try:
+        cursor = conn.execute(
+            f"SELECT rowid FROM verses_clean_fts WHERE verses_clean_fts MATCH ? ORDER BY {order} LIMIT ?",
+            (match, -1 if limit is None else limit)
+        )
+        return [row[0] for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"⚠️ تعذّر البحث في verses_clean_fts ({match}): {e}")
+        return None
+    finally:
+        conn.close()
+
+def substring_candidates(database_file: str, corpus, query_clean: str) -> Optional[List[int]]:
+    """
+    الآيات التي قد يحتوي نصها المُطبَّع على query_clean (مجموعة شاملة - التحقق على المستدعي)
+
+    المطابقة "w1 w2 … wn" داخل النص المُطبَّع إما:
+    - تبدأ عند بداية كلمة: "w1 … wn" * في FTS5 (w1..wn-1 كلمات كاملة، wn بادئة)
+    - أو تبدأ داخل كلمة: كلمة تنتهي بـ w1 (أو تحتويه إن كان الاستعلام كلمة واحدة)
+      من القاموس → postings الفهرس المقلوب، مقاطعة مع "w2 … wn" *
+
+    Returns:
+        مواقع الآيات في المدوّنة مرتبة، أو None إذا تعذّر استخدام الفهرس
+    """
+    words = query_clean.split()
+    if not words:
+        return None
+
+    ids = clean_fts_search(database_file, fts_phrase(words, prefix=True))
+    if ids is None:
+        return None
+    indices = {corpus.index_by_id[verse_id] for verse_id in ids if verse_id in corpus.index_by_id}
+
+    first = words[0]
+    if len(words) == 1:
+        partial = [word_id for word, word_id in corpus.vocab.items() if first in word[1:]]
+    else:
+        partial = [word_id for word, word_id in corpus.vocab.items()
+                   if len(word) > len(first) and word.endswith(first)]
+    postings = [corpus.inverted_index.postings[word_id] for word_id in partial
+                if word_id in corpus.inverted_index.postings]
+    if postings:
+        docs = np.unique(np.concatenate(postings))
+        if len(words) > 1:
+            rest = clean_fts_search(database_file, fts_phrase(words[1:], prefix=True))
+            if rest is None:
+                return None
+            rest_indices = np.array([corpus.index_by_id[verse_id] for verse_id in rest
+                                     if verse_id in corpus.index_by_id], dtype=np.int32)
+            docs = np.intersect1d(docs, rest_indices, assume_unique=True)
+        indices.update(docs.tolist())
+    return sorted(indices)
+
+def trigram_search(database_file: str, column: str, query: str, limit: Optional[int] = None) -> Optional[List[int]]:
+    """
+    معرّفات الآيات التي يحتوي عمودها (text أو text_clean) على query كنص جزئي، بترتيب المصحف
+
+    العبارة "query" في جدول trigram = كل ثلاثياتها متتالية → FTS5 يقاطع postings الثلاثيات
+    (الأندر أولاً) فيبقى الزمن ثابتاً تقريباً مع طول الاستعلام وعدد النتائج (LIMIT داخل SQLite)
+
+    Returns:
+        المعرّفات، أو None (استعلام أقصر من 3 أحرف أو تعذّر استخدام الجدول) → المستدعي يمسح
+    """
+    if column not in TRIGRAM_FTS_COLUMNS:
+        raise ValueError(f"عمود غير معروف: {column}")
+    if len(query) < TRIGRAM_MIN_LENGTH:
+        return None
+
+    conn = sqlite3.connect(database_file)
+    try:
+        cursor = conn.execute(
+            "SELECT rowid FROM verses_trigram_fts WHERE verses_trigram_fts MATCH ? ORDER BY rowid LIMIT ?",
+            (f"{column} : {fts_phrase([query])}", -1 if limit is None else limit)
+        )
+        return [row[0] for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"⚠️ تعذّر البحث في verses_trigram_fts ({query}): {e}")
+        return None
+    finally:
+        conn.close()
@@ -0,0 +1,134 @@
+"""
+فهرس مقلوب (كلمة ← آيات) لتوليد المرشّحين قبل حساب التشابه
+===========================================
+بدلاً من مقارنة الآية مع 6,236 آية في كل طلب، نجمع فقط الآيات التي تشارك
+الاستعلام عدداً كافياً من الكلمات لتبلغ العتبة.
+
+✅ قوائم postings مرتبة (int32) لكل معرّف كلمة + عدد تكرارها في كل آية + وزن الندرة (IDF)
+✅ overlaps: تقاطع كيس الكلمات مع كل الآيات دفعة واحدة (NumPy) → الحد الأعلى الدقيق للتشابه
+✅ مرشّح البادئة (prefix filter): الكلمات الأندر أولاً، والكلمات الشائعة جداً
+   (الله، من، في...) لا تُفتح قوائمها إلا إذا لزم - دون فقدان أي نتيجة:
+
+   النسبة <= 2*تقاطع/(m+n) فالآية التي تبلغ العتبة يجب أن تشارك t كلمة على الأقل،
+   وأي آية تشارك t كلمة من m يجب أن تحتوي إحدى أندر (m - t + 1) كلمة في الاستعلام.
+"""
+
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+class InvertedIndex:
+    """فهرس مقلوب على معرّفات القاموس (مواقع الآيات داخل المدوّنة)"""
+
+    __slots__ = ('postings', 'posting_counts', 'doc_freq', 'idf', 'size')
+
+    def __init__(self, token_counts: Sequence[Dict[int, int]] = (),
+                 arrays: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, int]] = None):
+        """
+        token_counts: كيس كلمات كل آية (بناء من الصفر)
+        arrays: (indptr, docs, counts, size) من to_arrays() - تحميل جاهز (الحزمة المجمّعة)
+        """
+        if arrays is not None:
+            indptr, docs, counts, self.size = arrays
+            # شرائح من المصفوفات (memory-map) بدون نسخ
+            words = np.flatnonzero(np.diff(indptr)).tolist()
+            bounds = indptr.tolist()
+            self.postings: Dict[int, np.ndarray] = {w: docs[bounds[w]:bounds[w + 1]] for w in words}
+            self.posting_counts: Dict[int, np.ndarray] = {w: counts[bounds[w]:bounds[w + 1]] for w in words}
+        else:
+            self.size = len(token_counts)
+
+            lists: Dict[int, List[int]] = {}
+            count_lists: Dict[int, List[int]] = {}
+            for index, counts in enumerate(token_counts):
+                for word_id, count in counts.items():
+                    lists.setdefault(word_id, []).append(index)
+                    count_lists.setdefault(word_id, []).append(count)
+
+            # المواقع مضافة بترتيب تصاعدي → القوائم مرتبة مسبقاً
+            self.postings = {
+                word_id: np.array(indices, dtype=np.int32) for word_id, indices in lists.items()
+            }
+            # عدد مرات الكلمة في كل آية (بنفس ترتيب postings)
+            self.posting_counts = {
+                word_id: np.array(counts, dtype=np.int32) for word_id, counts in count_lists.items()
+            }
+        self.doc_freq: Dict[int, int] = {word_id: len(indices) for word_id, indices in self.postings.items()}
+        self.idf: Dict[int, float] = {
+            word_id: math.log(self.size / df) for word_id, df in self.doc_freq.items()
+        }
+
+    def to_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(indptr, docs, counts) بصيغة CSR مفهرسة بمعرّف الكلمة - للحفظ في الحزمة"""
+        vocab_size = max(self.postings, default=-1) + 1
+        indptr = np.zeros(vocab_size + 1, dtype=np.int64)
+        for word_id, docs in self.postings.items():
+            indptr[word_id + 1] = len(docs)
+        np.cumsum(indptr, out=indptr)
+        words = range(vocab_size)
+        empty = np.empty(0, dtype=np.int32)
+        docs = np.concatenate([self.postings.get(w, empty) for w in words]) if vocab_size else empty
+        counts = np.concatenate([self.posting_counts.get(w, empty) for w in words]) if vocab_size else empty
+        return indptr, docs.astype(np.int32), counts.astype(np.int32)
+
+    def weight(self, word_id: int) -> float:
+        """وزن الندرة - الكلمات غير الموجودة في المدوّنة أندر ما يمكن"""
+        return self.idf.get(word_id, math.log(self.size + 1))
+
+    def min_overlap(self, length: int, threshold: float) -> int:
+        """
+        أقل عدد كلمات مشتركة يمكن أن يحقق العتبة لاستعلام طوله length
+
+        من حد الطول: n >= m*thr/(2-thr)، ومن حد الكيس: تقاطع >= thr*(m+n)/2
+        """
+        if threshold <= 0:
+            return 0
+        if threshold >= 2:
+            return length + 1
+        min_other = length * threshold / (2.0 - threshold)
+        # هامش صغير ضد أخطاء الفاصلة العائمة (يجعل المرشّح أوسع لا أضيق)
+        return max(1, math.ceil(threshold * (length + min_other) / 2.0 - 1e-9))
+
+    def candidates(self, counts: Dict[int, int], threshold: float) -> np.ndarray:
+        """
+        مواقع الآيات المرشّحة (مرتبة تصاعدياً) لاستعلام بكيس كلماته counts
+
+        كل آية يمكن أن تبلغ العتبة موجودة في الناتج حتماً (قد يشمل الناتج آيات لا تبلغها)
+        """
+        length = sum(counts.values())
+        required = self.min_overlap(length, threshold)
+        if required <= 0:
+            return np.arange(self.size, dtype=np.int32)
+        if required > length:
+            return np.empty(0, dtype=np.int32)
+
+        # البادئة: أندر (m - t + 1) عنصر من الاستعلام (مع التكرار)
+        prefix_size = length - required + 1
+        prefix_words = []
+        taken = 0
+        for word_id in sorted(counts, key=lambda w: (self.doc_freq.get(w, 0), w)):
+            prefix_words.append(word_id)
+            taken += counts[word_id]
+            if taken >= prefix_size:
+                break
+
+        lists = [self.postings[w] for w in prefix_words if w in self.postings]
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        if len(lists) == 1:
+            return lists[0]
+        return np.unique(np.concatenate(lists))
+
+    def overlaps(self, counts: Dict[int, int]) -> np.ndarray:
+        """
+        تقاطع كيس الكلمات counts مع كل آية: sum(min(عدد الكلمة هنا، عددها هناك))
+
+        مصفوفة بطول المدوّنة - الآيات التي لا تشارك أي كلمة قيمتها 0
+        """
+        overlap = np.zeros(self.size, dtype=np.int32)
+        for word_id, count in counts.items():
+            postings = self.postings.get(word_id)
+            if postings is not None:
+                overlap[postings] += np.minimum(self.posting_counts[word_id], count)
+        return overlap
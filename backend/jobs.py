@@ -0,0 +1,285 @@
+"""
+مهام البناء في الخلفية (Background Jobs) - عملية منفصلة لكل مهمة
+===========================================
+البناء داخل طلب HTTP يحجز العامل طوال البناء (دقائق للقرآن كاملاً)
+وينتهي وقت الطلب قبل انتهاء البناء. هنا:
+
+✅ POST /admin/jobs يضيف المهمة إلى طابور ويُرجع معرّفها فوراً
+   (GET /admin/build-cache و /admin/build-fts يضيفان مهامهما إلى نفس الطابور)
+✅ مهمة واحدة في كل مرة، في عملية منفصلة (fork يرث المدوّنة) → البحث لا يتباطأ في عملية الخادم
+✅ البنّاءون يُصدرون أحداث تقدّم منظّمة (progress_event) بدلاً من الطباعة:
+   المكتمل / الكلي / النسبة / الزمن / ETA / أزواج في الثانية
+✅ الأحداث تصل عبر multiprocessing.Queue وتُحفظ آخرها في المهمة (GET /admin/jobs/{id})
+✅ الإلغاء: مهمة في الطابور تُحذف، والجارية تُنهى عمليتها (نقطة استئناف similarity cache تبقى)
+✅ عند النجاح تُستدعى on_done في عملية الخادم لإعادة تحميل الملفات المبنية
+"""
+
+import multiprocessing
+import signal
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from database import SessionLocal, engine
+from corpus import get_corpus
+
+# ============================================
+# ⚙️ الإعدادات
+# ============================================
+JOB_HISTORY = 50           # عدد المهام المنتهية المحفوظة للعرض
+CANCEL_GRACE_SECONDS = 10  # مهلة إنهاء العملية قبل قتلها
+
+ProgressCallback = Callable[[dict], None]
+JobHandler = Callable[..., dict]
+
+# ============================================
+# 📡 أحداث التقدّم
+# ============================================
+def progress_event(stage: str, completed: int, total: int, started_at: float,
+                   done_work: float, total_work: float, comparisons: int = 0, **extra) -> dict:
+    """
+    حدث تقدّم منظّم: الزمن المتبقي من نسبة العمل المنجز (وليس عدد الآيات - آيات البقرة أطول)
+    """
+    elapsed = time.time() - started_at
+    eta = elapsed / done_work * (total_work - done_work) if done_work > 0 else None
+    event = {
+        'stage': stage,
+        'completed': completed,
+        'total': total,
+        'percent': round(completed / total * 100, 1) if total else 100.0,
+        'elapsed_seconds': round(elapsed, 2),
+        'eta_seconds': round(eta, 2) if eta is not None else None,
+        'comparisons': comparisons,
+        'pairs_per_second': round(comparisons / elapsed, 1) if elapsed > 0 else None,
+        'time': time.time()
+    }
+    event.update(extra)
+    return event
+
+def print_progress(event: dict):
+    """المستهلك الافتراضي: سطر واحد في السجل"""
+    eta = event['eta_seconds']
+    parts = [f"   📊 {event['stage']}: {event['completed']}/{event['total']} ({event['percent']:.1f}%)",
+             f"⏱️ {event['elapsed_seconds'] / 60:.1f}م",
+             f"ETA: {eta / 60:.1f}م" if eta is not None else "ETA: -"]
+    if event.get('pairs_found') is not None:
+        parts.append(f"أزواج متشابهة: {event['pairs_found']:,}")
+    if event.get('pairs_per_second') is not None:
+        parts.append(f"{event['pairs_per_second']:,.0f} مقارنة/ث")
+    print(" | ".join(parts))
+
+# ============================================
+# 🧾 المهمة
+# ============================================
+class Job:
+    """مهمة بناء واحدة وحالتها (queued → running → done / failed / cancelled)"""
+
+    __slots__ = ('id', 'kind', 'params', 'state', 'created_at', 'started_at', 'finished_at',
+                 'progress', 'events', 'result', 'error', 'process')
+
+    def __init__(self, kind: str, params: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.state = 'queued'
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.progress: Optional[dict] = None
+        self.events = 0
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.process = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ('done', 'failed', 'cancelled')
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        progress = self.progress or {}
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'state': self.state,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'elapsed_seconds': round(end - self.started_at, 2) if self.started_at else None,
+            'percent': 100.0 if self.state == 'done' else progress.get('percent'),
+            'eta_seconds': 0.0 if self.state == 'done' else progress.get('eta_seconds'),
+            'pairs_per_second': progress.get('pairs_per_second'),
+            'progress': self.progress,
+            'events': self.events,
+            'result': self.result,
+            'error': self.error
+        }
+
+# ============================================
+# 👷 العملية الفرعية
+# ============================================
+def pool_context():
+    """fork إن توفر (مشاركة المدوّنة دون نسخ)، وإلا الافتراضي"""
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+def raise_exit(signum, frame):
+    """SIGTERM (الإلغاء) → SystemExit: تُغلق الموارد (ومجمّع العمليات الداخلي) بشكل نظيف"""
+    sys.exit(128 + signum)
+
+def run_job(handler: JobHandler, params: dict, events):
+    """نقطة دخول العملية الفرعية: تشغيل المعالج وإرسال (النوع، البيانات) عبر الطابور"""
+    signal.signal(signal.SIGTERM, raise_exit)
+    # اتصالات SQLite الموروثة مع fork لا تُشارك بين العمليات
+    engine.dispose(close=False)
+
+    db = SessionLocal()
+    try:
+        get_corpus(db)
+        result = handler(db, lambda event: events.put(('progress', event)), **params)
+        events.put(('result', result))
+    except BaseException:
+        events.put(('error', traceback.format_exc()))
+    finally:
+        db.close()
+
+# ============================================
+# 🧵 مشغّل المهام (في عملية الخادم)
+# ============================================
+class JobRunner:
+    """
+    طابور مهام بترتيب الوصول - خيط مراقب واحد يشغّل كل مهمة في عملية منفصلة
+
+    handlers: {النوع: دالة(db, progress, **params) → dict} (دوال على مستوى الوحدة - قابلة للتسلسل)
+    on_done: تُستدعى بعد نجاح المهمة في عملية الخادم (إعادة تحميل الملفات)
+    """
+
+    def __init__(self, handlers: Dict[str, JobHandler], on_done: Optional[Callable[[Job], None]] = None):
+        self.handlers = handlers
+        self.on_done = on_done
+        self.jobs: Dict[str, Job] = {}
+        self.pending: Deque[Job] = deque()
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = False
+
+    def submit(self, kind: str, params: dict) -> Job:
+        """إضافة مهمة إلى الطابور (يبدأ الخيط المراقب عند أول مهمة)"""
+        if kind not in self.handlers:
+            raise ValueError(f"نوع مهمة غير معروف: {kind}")
+        job = Job(kind, params)
+        with self.condition:
+            self.jobs[job.id] = job
+            self.pending.append(job)
+            self.forget_old_jobs()
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping = False
+                self.thread = threading.Thread(target=self.loop, name="job-runner", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        return sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """إلغاء مهمة: من الطابور مباشرة، أو إنهاء عمليتها إذا كانت تعمل"""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job.state = 'cancelled'
+            job.finished_at = time.time()
+            if job in self.pending:
+                self.pending.remove(job)
+                return job
+            process = job.process
+        if process is not None and process.is_alive():
+            process.terminate()
+        return job
+
+    def shutdown(self):
+        """إيقاف الخيط وإلغاء المهمة الجارية (عند إغلاق الخادم)"""
+        with self.condition:
+            self.stopping = True
+            running = [job.id for job in self.jobs.values() if job.state == 'running']
+            self.condition.notify()
+        for job_id in running:
+            self.cancel(job_id)
+
+    def forget_old_jobs(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in sorted(finished, key=lambda job: job.created_at)[:max(0, len(finished) - JOB_HISTORY)]:
+            del self.jobs[job.id]
+
+    def loop(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    return
+                job = self.pending.popleft()
+                job.state = 'running'
+                job.started_at = time.time()
+            try:
+                self.execute(job)
+            except Exception:
+                job.state, job.error = 'failed', traceback.format_exc()
+                job.finished_at = time.time()
+
+    def execute(self, job: Job):
+        """تشغيل المهمة في عملية منفصلة وتصريف أحداثها حتى تنتهي"""
+        context = pool_context()
+        events = context.Queue()
+        process = context.Process(target=run_job, args=(self.handlers[job.kind], job.params, events),
+                                  name=f"job-{job.kind}-{job.id}")
+        with self.condition:
+            if job.state == 'cancelled':
+                return
+            job.process = process
+            process.start()
+
+        outcome = None
+        while outcome is None and (process.is_alive() or not events.empty()):
+            try:
+                kind, payload = events.get(timeout=0.5)
+            except Exception:
+                continue
+            if kind == 'progress':
+                job.progress = payload
+                job.events += 1
+            else:
+                outcome = (kind, payload)
+
+        process.join(CANCEL_GRACE_SECONDS)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        job.process = None
+
+        if job.state == 'cancelled':
+            return
+        if outcome is not None and outcome[0] == 'result':
+            job.result = outcome[1]
+            if self.on_done is not None:
+                try:
+                    self.on_done(job)
+                except Exception:
+                    job.state, job.error = 'failed', traceback.format_exc()
+                    job.finished_at = time.time()
+                    return
+            job.state = 'done'
+        else:
+            job.state = 'failed'
+            job.error = outcome[1] if outcome is not None else f"انتهت العملية بالرمز {process.exitcode}"
+        job.finished_at = time.time()
@@ -0,0 +1,259 @@
+"""
+فهرس MinHash / LSH تقريبي لاكتشاف المتشابهات على مستوى القرآن كاملاً
+===========================================
+حتى مع المرشّحات والفهرس المقلوب، مقارنة القرآن كاملاً عند عتبات منخفضة تبقى O(n²).
+هنا نولّد أزواجاً مرشّحة تقريبية ثم نتحقق منها بالنواة الدقيقة (نفس calculate_word_similarity):
+
+✅ Shingles = الكلمات المفردة + الثنائيات المتتالية (معرّفات القاموس)
+✅ توقيع MinHash بـ 128 تبديلة (hash عام mod 2^31-1) لكل آية
+✅ LSH بالنطاقات (bands × rows) - عدد الصفوف يُختار حسب عتبة Jaccard المطلوبة، وليس أقل من
+   LSH_MIN_ROWS: صف واحد لكل نطاق يجعل ~28% من كل الأزواج مرشّحة (أبطأ من exact بمراتب)
+✅ التواقيع محفوظة بجانب quran.db (quran_lsh_index.npz) مع manifest وتُعاد بناؤها إذا تغيّر التطبيع أو المدوّنة
+✅ الاسترجاع (recall) يُقاس مقابل النتيجة الدقيقة (brute force) عند الطلب
+
+⚠️ تقريبي: قد تفوته أزواج قليلة - استخدم exact عند الحاجة لنتيجة كاملة
+"""
+
+import json
+import os
+import time
+from typing import Dict, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from database import DATA_DIR
+from artifacts import build_manifest, manifest_problem
+from word_kernel import PrefilterStats
+
+# ============================================
+# ⚙️ الإعدادات
+# ============================================
+LSH_INDEX_FILE = os.path.join(DATA_DIR, "quran_lsh_index.npz")
+NUM_PERMUTATIONS = 128
+SHINGLE_SIZE = 2  # كلمات مفردة + ثنائيات
+MERSENNE_PRIME = (1 << 31) - 1
+LSH_SEED = 1
+LSH_ARTIFACT = "lsh_index"
+LSH_FORMAT = "minhash-v1"
+
+# عتبة Jaccard = هذا المعامل × Jaccard المقابلة لنسبة التشابه (هامش لرفع الاسترجاع)
+LSH_JACCARD_FACTOR = 0.55
+
+# أقل عدد صفوف في النطاق: مع 128 تبديلة → 64 نطاقاً وحوالي 200 ألف زوج مرشّح كحد أقصى (~1% من الأزواج)
+LSH_MIN_ROWS = 2
+
+# تحت هذه النسبة يفقد LSH معظم الأزواج (الاسترجاع 0.33 عند 0.2) → يُستخدم exact_pairs بدلاً منه
+LSH_MIN_SIMILARITY = 0.3
+
+Pair = Tuple[int, int]
+
+# ============================================
+# 🔢 التواقيع
+# ============================================
+def verse_shingles(ids: Sequence[int], vocab_size: int) -> np.ndarray:
+    """مجموعة shingles الآية كأعداد صحيحة (كلمة، ثم كل زوج متتالٍ)"""
+    shingles = set(ids)
+    if SHINGLE_SIZE >= 2:
+        base = vocab_size + 1
+        for first, second in zip(ids, ids[1:]):
+            shingles.add(base + first * base + second)
+    return np.fromiter(shingles, dtype=np.int64, count=len(shingles)) % MERSENNE_PRIME
+
+def permutation_coefficients(num_perm: int = NUM_PERMUTATIONS, seed: int = LSH_SEED) -> Tuple[np.ndarray, np.ndarray]:
+    """معاملات التبديلات (a*x + b) mod p"""
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, MERSENNE_PRIME, size=num_perm).astype(np.int64)
+    b = rng.randint(0, MERSENNE_PRIME, size=num_perm).astype(np.int64)
+    return a, b
+
+def minhash_signatures(token_ids: Sequence[Sequence[int]], vocab_size: int,
+                       num_perm: int = NUM_PERMUTATIONS) -> np.ndarray:
+    """مصفوفة التواقيع (عدد الآيات × num_perm) بنوع uint32"""
+    a, b = permutation_coefficients(num_perm)
+    signatures = np.full((len(token_ids), num_perm), MERSENNE_PRIME, dtype=np.uint32)
+    for index, ids in enumerate(token_ids):
+        if not ids:
+            continue
+        x = verse_shingles(ids, vocab_size)
+        signatures[index] = ((a[:, None] * x[None, :] + b[:, None]) % MERSENNE_PRIME).min(axis=1)
+    return signatures
+
+def lsh_usable(min_similarity: float) -> bool:
+    """هل LSH مفيد عند هذه النسبة (وإلا تُحسب الأزواج الدقيقة مباشرة)"""
+    return min_similarity >= LSH_MIN_SIMILARITY
+
+def jaccard_for_similarity(min_similarity: float) -> float:
+    """
+    عتبة Jaccard التقريبية لنسبة تشابه معينة
+
+    النسبة 2M/(m+n) تشبه معامل Dice، و Jaccard = D / (2 - D)
+    """
+    dice = min(max(min_similarity, 0.0), 1.0)
+    return LSH_JACCARD_FACTOR * dice / (2.0 - dice)
+
+# ============================================
+# 🗂️ الفهرس
+# ============================================
+class MinHashLSH:
+    """تواقيع MinHash للمدوّنة + توليد الأزواج المرشّحة بالنطاقات"""
+
+    __slots__ = ('signatures', 'num_perm', 'manifest')
+
+    def __init__(self, signatures: np.ndarray, manifest: dict):
+        self.signatures = signatures
+        self.num_perm = signatures.shape[1]
+        self.manifest = manifest
+
+    def band_layout(self, jaccard: float) -> Tuple[int, int]:
+        """
+        (rows, bands): أكبر عدد صفوف بحيث عتبة LSH التقريبية (1/b)^(1/r) <= jaccard
+
+        لا يقل عن LSH_MIN_ROWS: تحت ذلك لا يستبعد LSH شيئاً تقريباً (العتبات المنخفضة
+        تفقد بعض الاسترجاع بدلاً من توليد ملايين المرشّحين)
+        """
+        best = (LSH_MIN_ROWS, self.num_perm // LSH_MIN_ROWS)
+        for rows in range(LSH_MIN_ROWS, self.num_perm + 1):
+            bands = self.num_perm // rows
+            if bands < 1:
+                break
+            if (1.0 / bands) ** (1.0 / rows) <= jaccard:
+                best = (rows, bands)
+        return best
+
+    def candidate_pairs(self, jaccard: float, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        أزواج (i, j) حيث i < j تقع في نفس الدلو في نطاق واحد على الأقل
+
+        ⚡ الدلاء بالترتيب (argsort على صفوف النطاق كمفتاح ثنائي) بدلاً من قاموس بايثون،
+        والأزواج كأعداد (i * n + j) تُجمع لكل نطاق ثم np.unique مرة واحدة
+
+        allowed: قناع منطقي لتقييد الآيات المشاركة (مثلاً بعد استبعاد البسملات)
+        Returns:
+            (firsts, seconds) مرتبة حسب (i, j) وبدون تكرار
+        """
+        rows, bands = self.band_layout(jaccard)
+        total = len(self.signatures)
+        indices = np.arange(total) if allowed is None else np.flatnonzero(allowed)
+        key_type = np.dtype((np.void, rows * self.signatures.dtype.itemsize))
+        codes = [np.zeros(0, dtype=np.int64)]
+
+        positions = np.arange(len(indices))
+        for band in range(bands):
+            keys = np.ascontiguousarray(self.signatures[indices, band * rows:(band + 1) * rows]).view(key_type).ravel()
+            order = np.argsort(keys, kind='stable')  # داخل الدلو: الآيات تصاعدياً
+            sorted_keys = keys[order]
+            starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+            sizes = np.diff(np.append(starts, len(sorted_keys)))
+            # كل موقع يُزاوَج مع ما بعده حتى نهاية دلوه
+            followers = np.repeat(starts + sizes, sizes) - positions - 1
+            firsts = np.repeat(positions, followers)
+            seconds = firsts + 1 + np.arange(len(firsts)) - np.repeat(np.cumsum(followers) - followers, followers)
+            members = indices[order].astype(np.int64)
+            codes.append(members[firsts] * total + members[seconds])
+
+        pairs = np.unique(np.concatenate(codes))
+        return pairs // total, pairs % total
+
+    def estimate_jaccard(self, i: int, j: int) -> float:
+        """تقدير Jaccard من نسبة التبديلات المتساوية"""
+        return float(np.mean(self.signatures[i] == self.signatures[j]))
+
+def index_params() -> dict:
+    """إعدادات التواقيع - يجب أن تتطابق مع الملف المحفوظ"""
+    return {'num_perm': NUM_PERMUTATIONS, 'shingle_size': SHINGLE_SIZE, 'seed': LSH_SEED}
+
+def build_lsh_index(corpus, path: str = LSH_INDEX_FILE) -> MinHashLSH:
+    """بناء التواقيع وحفظها بجانب quran.db"""
+    start_time = time.time()
+    signatures = minhash_signatures(corpus.token_ids, len(corpus.vocab))
+    index = MinHashLSH(signatures, build_manifest(LSH_ARTIFACT, LSH_FORMAT, corpus, index_params()))
+    try:
+        np.savez(path, signatures=signatures, manifest=np.array(json.dumps(index.manifest, ensure_ascii=False)))
+        print(f"💾 تم حفظ فهرس LSH: {path}")
+    except Exception as e:
+        print(f"⚠️ تعذّر حفظ فهرس LSH: {e}")
+    print(f"✅ تم بناء فهرس LSH ({signatures.shape[0]} آية × {signatures.shape[1]} تبديلة) في {time.time() - start_time:.2f}ث")
+    return index
+
+def read_lsh_manifest(path: str = LSH_INDEX_FILE) -> Optional[dict]:
+    """الـ manifest المحفوظ (None إذا لم يوجد الملف أو كان بصيغة أقدم بدون manifest)"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return json.loads(str(data['manifest'])) if 'manifest' in data.files else None
+
+def lsh_problem(corpus, manifest: Optional[dict]) -> Optional[str]:
+    """سبب عدم صلاحية الفهرس للمدوّنة الحالية (None = صالح)"""
+    return manifest_problem(manifest, LSH_ARTIFACT, LSH_FORMAT, corpus, index_params())
+
+def load_or_build_lsh_index(corpus, path: str = LSH_INDEX_FILE) -> MinHashLSH:
+    """تحميل الفهرس المحفوظ إذا كان مطابقاً للمدوّنة الحالية، وإلا إعادة بنائه"""
+    if os.path.exists(path):
+        try:
+            problem = lsh_problem(corpus, read_lsh_manifest(path))
+            if problem is None:
+                with np.load(path) as data:
+                    print(f"✅ تم تحميل فهرس LSH من {path}")
+                    return MinHashLSH(data['signatures'], json.loads(str(data['manifest'])))
+            print(f"🔄 فهرس LSH قديم ({problem}) - إعادة البناء")
+        except Exception as e:
+            print(f"⚠️ خطأ في تحميل فهرس LSH: {e} - إعادة البناء")
+    return build_lsh_index(corpus, path)
+
+LSH_INDEX: Optional[MinHashLSH] = None
+
+def get_lsh_index(corpus) -> MinHashLSH:
+    """الفهرس الحالي (يُحمَّل أو يُبنى عند أول استخدام)"""
+    global LSH_INDEX
+    if LSH_INDEX is None or lsh_problem(corpus, LSH_INDEX.manifest) is not None:
+        LSH_INDEX = load_or_build_lsh_index(corpus)
+    return LSH_INDEX
+
+# ============================================
+# ✅ التحقق والاسترجاع
+# ============================================
+def verified_lsh_pairs(corpus, min_similarity: float, allowed: Optional[np.ndarray] = None,
+                       stats: Optional[PrefilterStats] = None) -> Dict[Pair, float]:
+    """
+    الأزواج المرشّحة من LSH بعد التحقق الدقيق: {(i, j): النسبة} حيث i < j
+
+    النسبة محسوبة بالاتجاه (i → j) مثل البحث الشامل (الآية الأقدم أولاً)
+    تحت LSH_MIN_SIMILARITY: النتيجة الدقيقة (exact_pairs) بدلاً من مرشّحي LSH
+    """
+    if not lsh_usable(min_similarity):
+        return exact_pairs(corpus, min_similarity, allowed)
+    lsh = get_lsh_index(corpus)
+    records = corpus.records
+    verified: Dict[Pair, float] = {}
+    firsts, seconds = lsh.candidate_pairs(jaccard_for_similarity(min_similarity), allowed)
+    for i, j in zip(firsts.tolist(), seconds.tolist()):
+        similarity = corpus.similarity(records[i], records[j], min_similarity, stats)
+        if similarity >= min_similarity:
+            verified[(i, j)] = similarity
+    return verified
+
+def exact_pairs(corpus, min_similarity: float, allowed: Optional[np.ndarray] = None) -> Dict[Pair, float]:
+    """النتيجة الدقيقة (brute force عبر الفهرس المقلوب - بدون فقدان) للمقارنة"""
+    records = corpus.records
+    exact: Dict[Pair, float] = {}
+    for verse in records:
+        if allowed is not None and not allowed[verse.index]:
+            continue
+        for other in corpus.similar_candidates(verse, min_similarity):
+            if other.index <= verse.index or (allowed is not None and not allowed[other.index]):
+                continue
+            similarity = corpus.similarity(verse, other, min_similarity)
+            if similarity >= min_similarity:
+                exact[(verse.index, other.index)] = similarity
+    return exact
+
+def lsh_recall(found: Set[Pair], exact: Set[Pair]) -> dict:
+    """نسبة الاسترجاع: كم من الأزواج الدقيقة وجدها LSH"""
+    hits = len(found & exact)
+    return {
+        'exact_pairs': len(exact),
+        'lsh_pairs': len(found),
+        'found': hits,
+        'missed': len(exact) - hits,
+        'recall': round(hits / len(exact), 4) if exact else 1.0
+    }
@@ -24,8 +24,29 @@ import random
 from fastapi import FastAPI, Depends, HTTPException, Query, Path
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from database import get_db, Verse, init_db
+from database import get_db, Verse, init_db, DATABASE_FILE
+from corpus import load_corpus, get_corpus, set_corpus, is_basmala_verse
+from word_kernel import PrefilterStats
+from phrase_index import get_phrase_index
+from lsh_index import (get_lsh_index, jaccard_for_similarity, verified_lsh_pairs, exact_pairs, lsh_recall,
+                       lsh_usable, read_lsh_manifest, lsh_problem, LSH_ARTIFACT, LSH_INDEX_FILE, LSH_MIN_SIMILARITY)
+from cache_builder import build_cache, checkpoint_status, MAX_RESULTS
+from similarity_store import (load_or_import_store, load_store, SIMILARITY_STORE_DIR,
+                              STORE_ARTIFACT, STORE_FORMAT)
+from pair_matrix import (load_pair_matrix, build_pair_matrix, save_pair_matrix, read_pair_meta,
+                         PAIR_FLOOR, PAIR_MATRIX_FILE, PAIR_ARTIFACT, PAIR_FORMAT)
+from artifacts import manifest_problem, artifact_status, read_db_manifest, read_dir_manifest
+from word_stats_store import (build_word_stats, save_word_stats, load_word_stats, distribution,
+                              WORD_STATS_STORE_DIR, WORD_STATS_ARTIFACT, WORD_STATS_FORMAT)
+from ngram_index import (build_ngram_index, save_ngram_index, load_ngram_index,
+                         NGRAM_INDEX_DIR, NGRAM_ARTIFACT, NGRAM_FORMAT, NGRAM_PARAMS)
+from fts_index import (build_fts_table, build_clean_fts_table, fts_table_exists, clean_fts_search,
+                       build_trigram_fts_table, fts_phrase, substring_candidates, trigram_search,
+                       FTS_ARTIFACT, FTS_FORMAT, CLEAN_FTS_ARTIFACT, CLEAN_FTS_FORMAT,
+                       TRIGRAM_FTS_ARTIFACT, TRIGRAM_FTS_FORMAT)
+from bundle import open_bundle
+from jobs import JobRunner, print_progress
+from cache_generation import current_generation, publish_generation, on_publish
 from typing import List, Optional
 import time
 from difflib import SequenceMatcher
@@ -165,9 +186,20 @@ MUTASHABIHAT_BANK = None
 # ============================================
 # 🚀 متغيرات جديدة للتحسينات
 # ============================================
-SIMILARITY_CACHE = None
-WORD_STATS_CACHE = None
-FTS_AVAILABLE = False
+# similarity cache / مصفوفة الأزواج / word stats / FTS5 → جيل واحد يُنشر ذرياً (cache_generation)
+# الطلب يأخذ current_generation() مرة واحدة؛ إعادة البناء تنشر جيلاً جديداً بعد اكتمالها فقط
+
+# كل ملف مشتق يحمل manifest (artifacts) - القديم منها لا يُخدم ويُعاد بناؤه في الخلفية عند الإقلاع
+AUTO_REBUILD_ARTIFACTS = os.environ.get("AUTO_REBUILD_ARTIFACTS", "true").lower() == "true"
+ARTIFACT_REBUILD_JOBS = {}  # اسم الملف → معرّف مهمة إعادة بنائه
+QURAN_BUNDLE = None  # الحزمة المجمّعة المفتوحة عند الإقلاع (python -m bundle) أو None
+
+# جداول FTS5 التي يعتمد عليها البحث: اسم الجدول → (صيغته، حقل توفره في الجيل، ما يستخدمه)
+# تُبنى في الخلفية حتى لو لم توجد (ثوانٍ)، والبحث يمسح الآيات حتى يكتمل بناؤها
+SEARCH_FTS_TABLES = {
+    CLEAN_FTS_ARTIFACT: (CLEAN_FTS_FORMAT, "fts_clean_available", "/search و /search/live"),
+    TRIGRAM_FTS_ARTIFACT: (TRIGRAM_FTS_FORMAT, "fts_trigram_available", "/search/fixed و /search/both"),
+}
 
 # ============================================
 # ✅ دالة حساب التشابه اللفظي (على مستوى الكلمات)
@@ -179,30 +211,6 @@ def calculate_word_similarity(text1: str, text2: str) -> float:
 # ============================================
 # دوال مساعدة
 # ============================================
-def is_basmala_verse(verse: Verse) -> bool:
-    """التحقق من أن الآية هي البسملة - نسخة محسنة"""
-    if verse.ayah != 1 or verse.surah == 9:  # سورة التوبة لا تبدأ بالبسملة
-        return False
-    
-    verse_clean = clean_text(verse.text)
-    basmala_variations = [
-        clean_text("بسم الله الرحمن الرحيم"),
-        clean_text("بسم الله الرحمن الرحيم"),
-        clean_text("بِسْمِ اللَّهِ الرَّحْمَٰنِ الرَّحِيمِ"),
-        clean_text("بِّسْمِ اللَّهِ الرَّحْمَٰنِ الرَّحِيمِ"),
-        "بسم الله الرحمن الرحيم",  # النص النظيف
-    ]
-    
-    # التحقق من جميع الأشكال
-    for basmala in basmala_variations:
-        if (verse_clean == basmala or 
-            verse_clean.startswith(basmala) or
-            basmala in verse_clean):
-            return True
-    
-    # استبعاد الآيات القصيرة جداً التي قد تكون بسملة
-    return len(verse_clean) < 30 and any(word in verse_clean for word in ['بسم', 'الله', 'الرحمن', 'الرحيم'])
-
 def initialize_search_engine(db: Session):
     """تهيئة محرك البحث الدلالي (FAISS) - معطل في Production"""
     global QURAN_EMBEDDINGS, QURAN_IDS, FAISS_INDEX, EMBEDDING_MODEL
@@ -228,66 +236,219 @@ def initialize_search_engine(db: Session):
 # 🚀 دوال جديدة للتحسينات
 # ============================================
 
-def initialize_optimizations(db: Session):
-    """تهيئة أنظمة التحسينات الجديدة"""
-    global SIMILARITY_CACHE, WORD_STATS_CACHE, FTS_AVAILABLE
+def inspect_artifacts(db: Session, corpus, bundle=None) -> dict:
+    """
+    🧾 فحص manifest كل ملف مشتق مقابل المدوّنة وقواعد التطبيع الحالية (بدون تحميل الملفات)
+
+    bundle: الحزمة المجمّعة إن وُجدت (similarity cache ومصفوفة الأزواج وإحصائيات الكلمات والـ n-grams من مجلدها)
+    Returns:
+        {اسم الملف: حالة (artifact_status) + manifest}
+    """
+    store_dir = bundle.store_dir if bundle is not None else SIMILARITY_STORE_DIR
+    pairs_file = bundle.pairs_file if bundle is not None else PAIR_MATRIX_FILE
+    word_stats_dir = bundle.word_stats_dir if bundle is not None else WORD_STATS_STORE_DIR
+    ngram_dir = bundle.ngram_dir if bundle is not None else NGRAM_INDEX_DIR
+    store_meta = read_dir_manifest(store_dir)
+    pair_meta = read_pair_meta(pairs_file)
+    lsh_manifest = read_lsh_manifest()
+    word_stats_meta = read_dir_manifest(word_stats_dir)
+    ngram_meta = read_dir_manifest(ngram_dir)
+    fts_manifest = read_db_manifest(db, FTS_ARTIFACT)
+
+    statuses = [
+        (artifact_status(STORE_ARTIFACT, store_dir, store_meta,
+                         manifest_problem(store_meta, STORE_ARTIFACT, STORE_FORMAT, corpus)), store_meta),
+        (artifact_status(PAIR_ARTIFACT, pairs_file, pair_meta,
+                         manifest_problem(pair_meta, PAIR_ARTIFACT, PAIR_FORMAT, corpus)), pair_meta),
+        (artifact_status(LSH_ARTIFACT, LSH_INDEX_FILE, lsh_manifest, lsh_problem(corpus, lsh_manifest),
+                         exists=os.path.exists(LSH_INDEX_FILE)), lsh_manifest),
+        (artifact_status(WORD_STATS_ARTIFACT, word_stats_dir, word_stats_meta,
+                         manifest_problem(word_stats_meta, WORD_STATS_ARTIFACT, WORD_STATS_FORMAT, corpus)),
+         word_stats_meta),
+        (artifact_status(NGRAM_ARTIFACT, ngram_dir, ngram_meta,
+                         manifest_problem(ngram_meta, NGRAM_ARTIFACT, NGRAM_FORMAT, corpus, NGRAM_PARAMS)),
+         ngram_meta),
+        (artifact_status(FTS_ARTIFACT, DATABASE_FILE, fts_manifest,
+                         manifest_problem(fts_manifest, FTS_ARTIFACT, FTS_FORMAT, corpus),
+                         exists=fts_table_exists(DATABASE_FILE)), fts_manifest)
+    ]
+    for name, (format, _, _) in SEARCH_FTS_TABLES.items():
+        manifest = read_db_manifest(db, name)
+        statuses.append((artifact_status(name, DATABASE_FILE, manifest,
+                                         manifest_problem(manifest, name, format, corpus),
+                                         exists=fts_table_exists(DATABASE_FILE, name)), manifest))
+
+    artifacts = {}
+    for status, manifest in statuses:
+        job = JOB_RUNNER.get(ARTIFACT_REBUILD_JOBS.get(status['artifact'], ''))
+        status['rebuild_job'] = {'id': job.id, 'state': job.state} if job is not None else None
+        status['manifest'] = manifest
+        artifacts[status['artifact']] = status
+    return artifacts
+
+def initialize_optimizations(db: Session, bundle=None):
+    """
+    تهيئة أنظمة التحسينات الجديدة
     
+    كل ملف يُحمَّل فقط إذا طابق الـ manifest الخاص به المدوّنة والتطبيع الحاليين؛
+    القديم يُعاد بناؤه في الخلفية (مهمة بنفس معاملات بنائه) ولا يُخدم حتى تكتمل
+    
+    bundle: الحزمة المجمّعة - similarity cache ومصفوفة الأزواج وFTS5 منها (memory-map)
+    """
     print("\n" + "="*60)
     print("🚀 بدء تهيئة أنظمة التحسينات")
     print("="*60)
     
-    # 1. تحميل similarity cache
+    corpus = get_corpus(db)
+    artifacts = inspect_artifacts(db, corpus, bundle)
+    rebuilds = []  # (اسم الملف، نوع المهمة، المعاملات) - تُرسل بعد نشر الجيل
+    
+    def stale(name: str) -> bool:
+        status = artifacts[name]
+        if status['exists'] and not status['fresh']:
+            print(f"🔄 {name} قديم: {status['reason']}")
+            return True
+        return False
+    
+    # 1. تحميل similarity cache (CSR بـ memory-map - أو تحويل الملف القديم مرة واحدة)
+    similarity_cache = {}
     try:
-        if os.path.exists("similarity_cache.npy"):
-            SIMILARITY_CACHE = np.load("similarity_cache.npy", allow_pickle=True).item()
-            print(f"✅ تم تحميل similarity cache: {len(SIMILARITY_CACHE)} آية")
+        if stale(STORE_ARTIFACT):
+            params = artifacts[STORE_ARTIFACT]['manifest'].get('params', {})
+            rebuilds.append((STORE_ARTIFACT, "similarity", params))
         else:
-            SIMILARITY_CACHE = {}
-            print("⚠️ similarity cache غير موجود، سيتم إنشاؤه عند الحاجة")
+            store_dir = artifacts[STORE_ARTIFACT]['location']
+            store = load_or_import_store(corpus, store_dir)
+            if store is not None:
+                similarity_cache = store
+                print(f"✅ تم تحميل similarity cache: {len(store)} آية "
+                      f"({store.nnz:,} نتيجة، {store.nbytes / 1024:.0f} KB من {store_dir})")
+            else:
+                print("⚠️ similarity cache غير موجود، سيتم إنشاؤه عند الحاجة")
     except Exception as e:
         print(f"❌ خطأ في تحميل similarity cache: {e}")
-        SIMILARITY_CACHE = {}
     
-    # 2. تحميل word statistics cache
+    # 1.b مصفوفة أزواج التشابه (تُبنى في الخلفية خلال ثوانٍ إذا لم تكن محفوظة أو كانت قديمة)
+    similarity_pairs = None
     try:
-        if os.path.exists("word_stats_cache.json"):
-            with open("word_stats_cache.json", 'r', encoding='utf-8') as f:
-                WORD_STATS_CACHE = json.load(f)
-            print(f"✅ تم تحميل word stats cache: {len(WORD_STATS_CACHE)} كلمة")
+        if artifacts[PAIR_ARTIFACT]['fresh']:
+            similarity_pairs = load_pair_matrix(corpus, artifacts[PAIR_ARTIFACT]['location'])
+        if similarity_pairs is not None:
+            print(f"✅ تم تحميل مصفوفة الأزواج: {similarity_pairs.nnz:,} زوج >= {similarity_pairs.floor} "
+                  f"({similarity_pairs.nbytes / 1024:.0f} KB)")
         else:
-            WORD_STATS_CACHE = {}
-            print("⚠️ word stats cache غير موجود، سيتم إنشاؤه عند الحاجة")
+            stale(PAIR_ARTIFACT)
+            manifest = artifacts[PAIR_ARTIFACT]['manifest'] or {}
+            rebuilds.append((PAIR_ARTIFACT, "pairs",
+                             {"pair_floor": manifest.get('params', {}).get('floor', PAIR_FLOOR)}))
     except Exception as e:
-        print(f"❌ خطأ في تحميل word stats cache: {e}")
-        WORD_STATS_CACHE = {}
+        print(f"❌ خطأ في تحميل مصفوفة الأزواج: {e}")
+    
+    # 2. إحصائيات الكلمات (CSR بـ memory-map - تُبنى في الخلفية خلال ثوانٍ إذا لم تكن محفوظة أو كانت قديمة)
+    word_stats = {}
+    try:
+        if artifacts[WORD_STATS_ARTIFACT]['fresh']:
+            word_stats = load_word_stats(corpus, artifacts[WORD_STATS_ARTIFACT]['location']) or {}
+        if word_stats:
+            print(f"✅ تم تحميل word stats: {len(word_stats)} كلمة ({word_stats.nbytes / 1024:.0f} KB)")
+        else:
+            stale(WORD_STATS_ARTIFACT)
+            rebuilds.append((WORD_STATS_ARTIFACT, "word_stats", {}))
+            print("⚠️ word stats غير جاهزة - /autocomplete فارغ و /stats/word من فهرس العبارات حتى يكتمل بناؤها")
+    except Exception as e:
+        print(f"❌ خطأ في تحميل word stats: {e}")
+    
+    # 2.b فهرس الـ n-grams لتكملة العبارات (يُبنى في الخلفية خلال أجزاء من الثانية إذا لم يكن محفوظاً)
+    ngram_index = None
+    try:
+        if artifacts[NGRAM_ARTIFACT]['fresh']:
+            ngram_index = load_ngram_index(corpus, artifacts[NGRAM_ARTIFACT]['location'])
+        if ngram_index is not None:
+            print(f"✅ تم تحميل فهرس الـ n-grams: {len(ngram_index):,} ({ngram_index.nbytes / 1024:.0f} KB)")
+        else:
+            stale(NGRAM_ARTIFACT)
+            rebuilds.append((NGRAM_ARTIFACT, "ngrams", {}))
+            print("⚠️ فهرس الـ n-grams غير جاهز - /autocomplete/phrase فارغ حتى يكتمل بناؤه")
+    except Exception as e:
+        print(f"❌ خطأ في تحميل فهرس الـ n-grams: {e}")
     
     # 3. التحقق من FTS5
+    fts_available = False
+    search_fts = {field: False for _, field, _ in SEARCH_FTS_TABLES.values()}
     try:
-        conn = sqlite3.connect('quran.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='verses_fts'")
-        FTS_AVAILABLE = cursor.fetchone() is not None
-        conn.close()
+        if stale(FTS_ARTIFACT):
+            rebuilds.append((FTS_ARTIFACT, "fts", {}))
+        else:
+            fts_available = artifacts[FTS_ARTIFACT]['exists']
         
-        if FTS_AVAILABLE:
+        if fts_available:
             print("✅ FTS5 index متاح للبحث الفوري")
         else:
             print("⚠️ FTS5 index غير متاح، استخدم /admin/build-fts لبنائه")
+        
+        # جداول البحث: تُبنى في الخلفية حتى لو لم توجد
+        for name, (_, field, used_by) in SEARCH_FTS_TABLES.items():
+            if stale(name) or not artifacts[name]['exists']:
+                rebuilds.append((name, "fts", {}))
+                print(f"⚠️ {name} غير جاهز - {used_by} بالمسح الكامل حتى يكتمل بناؤه")
+            else:
+                search_fts[field] = True
+                print(f"✅ {name} متاح ({used_by})")
     except Exception as e:
         print(f"❌ خطأ في التحقق من FTS5: {e}")
-        FTS_AVAILABLE = False
+    
+    # 4. فهرس LSH يُعاد بناؤه تلقائياً عند أول استخدام إذا كان قديماً
+    if stale(LSH_ARTIFACT):
+        print("   ↪️ سيُعاد بناء فهرس LSH عند أول استخدام")
+    
+    # 🧬 نشر كل ما تم تحميله كجيل واحد
+    publish_generation(similarity_cache=similarity_cache, similarity_pairs=similarity_pairs,
+                       word_stats=word_stats, ngram_index=ngram_index, fts_available=fts_available, **search_fts)
+    
+    # 🔄 إعادة بناء الملفات القديمة فقط - في الخلفية وبعد النشر (نتيجتها تُنشر كجيل لاحق)
+    scheduled = {}  # نوع المهمة → المهمة (مهمة fts واحدة تبني الجدولين)
+    for name, kind, params in rebuilds:
+        if kind in scheduled:
+            ARTIFACT_REBUILD_JOBS[name] = scheduled[kind].id
+            continue
+        job = schedule_rebuild(name, kind, params)
+        if job is not None:
+            scheduled[kind] = job
     
     print("✅ اكتملت تهيئة أنظمة التحسينات\n")
 
-def fast_text_search_fts(query: str, limit: int = 20):
+def schedule_rebuild(name: str, kind: str, params: dict):
+    """إعادة بناء ملف مشتق كمهمة خلفية بمعاملات بنائه السابق (أو الافتراضية إذا لم تعد صالحة)"""
+    if not AUTO_REBUILD_ARTIFACTS:
+        print(f"   ⏸️ {name}: إعادة البناء التلقائية معطلة (AUTO_REBUILD_ARTIFACTS) - استخدم /admin/jobs")
+        return None
+    try:
+        params = job_params(kind, params)
+    except (ValueError, TypeError):
+        params = job_params(kind, {})
+    job = JOB_RUNNER.submit(kind, params)
+    ARTIFACT_REBUILD_JOBS[name] = job.id
+    print(f"   🔄 {name}: إعادة البناء في الخلفية (المهمة {job.id})")
+    return job
+
+def fast_text_search_fts(query: str, limit: int = 20, generation=None):
     """
     🔥 FTS5 محسن - للبحث السريع فقط مع الإشارة أنه غير دقيق
+    
+    ✅ على النص المُطبَّع (verses_clean_fts) إن وُجد: "الصلاة" و"الصلوة" تطابقان "ٱلصَّلَوٰةَ"،
+       وآخر كلمة بادئة (البحث أثناء الكتابة)
+    ↪️ وإلا جدول النص العثماني (verses_fts)، وبدون أي فهرس: مسح المدوّنة
     """
-    if not FTS_AVAILABLE:
-        return []
+    generation = generation or current_generation()
+    if generation.fts_clean_available:
+        results = clean_fts_live_search(query, limit)
+        if results is not None:
+            return results
+    if not generation.fts_available:
+        return [dict(verse, match_type='scan_live') for verse in exact_text_search(None, query, limit)]
     
     try:
-        conn = sqlite3.connect('quran.db')
+        conn = sqlite3.connect(DATABASE_FILE)
         cursor = conn.cursor()
         
         # استخدام البحث بالكلمة كاملة (بدون تنظيف أو تقسيم) للرسم العثماني
@@ -326,274 +487,158 @@ def fast_text_search_fts(query: str, limit: int = 20):
     except Exception as e:
         print(f"❌ خطأ في البحث FTS5: {e}")
         return []
+
+def clean_fts_live_search(query: str, limit: int = 20) -> Optional[List[dict]]:
+    """
+    ⚡ بحث فوري في verses_clean_fts (عبارة + بادئة لآخر كلمة، ترتيب bm25)
+    
+    Returns:
+        النتائج، أو None إذا تعذّر استخدام الفهرس
+    """
+    words = clean_text(query).split()
+    if not words:
+        return []
+    
+    verse_ids = clean_fts_search(DATABASE_FILE, fts_phrase(words, prefix=True), limit, by_rank=True)
+    if verse_ids is None:
+        return None
+    
+    corpus = get_corpus()
+    results = []
+    for verse_id in verse_ids:
+        verse = corpus.get(verse_id)
+        if verse is None:
+            continue
+        results.append({
+            **verse.to_dict(),
+            'similarity': '0.9500',
+            'match_type': 'fts_fast',
+            'note': 'نتيجة سريعة - قد لا تكون دقيقة 100%'
+        })
+    return results
     
 @lru_cache(maxsize=1000)
-def get_cached_similarities(verse_id: int, min_similarity: float = 0.6):
+def get_cached_similarities(generation, verse_id: int, min_similarity: float = 0.6):
     """
     🚀 متشابهات فورية من Cache
     🚀 السرعة: 10-50ms للنتائج المخزنة
+    
+    generation: الجيل الذي يخدم الطلب (جزء من مفتاح lru_cache → لا نتائج قديمة بعد إعادة البناء)
     """
-    global SIMILARITY_CACHE
+    # مصفوفة الأزواج تغطي أي عتبة >= حدها الأدنى (بدون بتر K المخزن)
+    if generation.pairs_cover(min_similarity):
+        return generation.similarity_pairs.similarities(verse_id, min_similarity, limit=20)
     
-    if SIMILARITY_CACHE and verse_id in SIMILARITY_CACHE:
-        cached_results = SIMILARITY_CACHE[verse_id]
-        # تصفية حسب الحد الأدنى للتشابه
-        filtered = [r for r in cached_results if r['similarity'] >= min_similarity]
-        return filtered[:20]  # إرجاع 20 نتيجة كحد أقصى
+    similarity_cache = generation.similarity_cache
+    if similarity_cache and verse_id in similarity_cache:
+        # تصفية حسب الحد الأدنى للتشابه على المصفوفات، ثم 20 نتيجة كحد أقصى
+        return similarity_cache.similarities(verse_id, min_similarity, limit=20)
     
     return []  # إذا لم تكن في cache، نرجع قائمة فارغة
 
+@on_publish
+def clear_generation_memos(generation):
+    """الجيل الجديد لا يحتاج مدخلات الأجيال السابقة (تحرير الذاكرة - المفتاح يتضمن الجيل أصلاً)"""
+    get_cached_similarities.cache_clear()
+
 # ============================================
 # 🔥 الإصلاح 2: تحسين بناء Similarity Cache
 # ============================================
 # استبدل الدالة build_similarity_cache في main.py (حوالي السطر 324)
 
-def build_similarity_cache(db: Session, min_similarity: float = 0.50):  # ✅ غيّر من 0.05 إلى 0.50
+def build_similarity_cache(db: Session, min_similarity: float = 0.50,  # ✅ غيّر من 0.05 إلى 0.50
+                           method: str = "exact", check_recall: bool = False, workers: int = 1,
+                           resume: bool = True, top_k: int = MAX_RESULTS, progress=print_progress):
     """
     🔥 بناء similarity cache محسّن - سريع جداً!
     
     التحسينات الحاسمة:
     - ✅ min_similarity = 0.50 (بدلاً من 0.05)
-    - ✅ MAX_RESULTS = 20 (بدلاً من 50)
-    - ✅ إيقاف مبكر عند الوصول للحد
+    - ✅ أفضل top_k = 20 نتيجة فعلياً (كومة صغرى) بدلاً من أول 20 بترتيب المعرّف
+    - ✅ أضعف نتيجة في الكومة ترفع العتبة أثناء المسح (إقصاء مبكر)
     - ✅ تخطي البسملات
+    - ✅ شرائح على عدة عمليات (cache_builder)
     
-    ⏱️ الزمن المتوقع: 5-15 دقيقة (بدلاً من 5+ ساعات!)
-    """
-    global SIMILARITY_CACHE
-    
-    print("="*60)
-    print("🔥 بدء بناء similarity cache المحسّن (سريع)...")
-    print(f"   🎯 حد التشابه: {min_similarity*100}%")
-    print(f"   ⏱️  الزمن المتوقع: 5-15 دقيقة")
-    print("="*60)
+    method:
+    - exact: المرشّحون من الفهرس المقلوب (بدون فقدان)
+    - lsh: المرشّحون من فهرس MinHash/LSH (تقريبي - check_recall يقيس الاسترجاع)،
+      وتحت LSH_MIN_SIMILARITY يُبنى بـ exact
     
+    workers: عدد العمليات (1 = نفس العملية، 0 = كل الأنوية)
+    resume: استئناف نقطة محفوظة متوافقة بدلاً من البدء من الصفر
+    top_k: عدد المتشابهات المحفوظة لكل آية
+    progress: مستهلك أحداث التقدّم المنظّمة (الطباعة افتراضياً)
+    """
+    corpus = get_corpus(db)
+    store, info = build_cache(corpus, min_similarity, method, check_recall, workers, resume, top_k, progress)
+    # 🧬 البناء تم جانباً → نشر ذري (الطلبات الجارية تكمل على الجيل السابق)
+    publish_generation(similarity_cache=store, similarity_build_info=info)
+    return store
+
+def build_similarity_pairs(db: Session, floor: float = PAIR_FLOOR, progress=print_progress):
+    """
+    🧮 إعادة بناء مصفوفة أزواج التشابه (كل زوج >= floor) وحفظها في similarity_pairs.npz
+    """
+    pairs = build_pair_matrix(get_corpus(db), floor, progress)
+    save_pair_matrix(pairs, PAIR_MATRIX_FILE)
+    publish_generation(similarity_pairs=pairs)
+    return pairs
+
+def build_word_statistics_cache(db: Session):
+    """
+    بناء إحصائيات الكلمات (word_stats_store) وحفظها ونشرها
+    """
+    print("🔄 بدء بناء word statistics cache...")
     start_time = time.time()
     
-    all_verses = db.query(Verse).all()
-    total_verses = len(all_verses)
-    SIMILARITY_CACHE = {}
-    
-    # إحصائيات
-    total_pairs_found = 0
-    total_comparisons = 0
-    skipped_basmala = 0
+    word_stats = build_word_stats(get_corpus(db))  # يُبنى جانباً ثم يُنشر كاملاً
     
-    for i, verse in enumerate(all_verses):
-        # Progress update كل 100 آية (أقل إزعاج)
-        if (i + 1) % 100 == 0:
-            elapsed = time.time() - start_time
-            progress = ((i + 1) / total_verses) * 100
-            avg_time_per_verse = elapsed / (i + 1)
-            remaining_verses = total_verses - (i + 1)
-            eta = avg_time_per_verse * remaining_verses
-            
-            print(f"   📊 {i+1}/{total_verses} ({progress:.1f}%) | "
-                  f"⏱️ {elapsed/60:.1f}م | "
-                  f"ETA: {eta/60:.1f}م | "
-                  f"متشابهات: {total_pairs_found:,}")
-        
-        # ✅ تخطي البسملات (توفير وقت)
-        if is_basmala_verse(verse):
-            SIMILARITY_CACHE[verse.id] = []
-            skipped_basmala += 1
-            continue
-        
-        # البحث عن متشابهات لهذه الآية
-        similar_verses = []
-        
-        # ✅ التحسين الحاسم: حد أقصى 20 نتيجة
-        MAX_RESULTS = 20  # بدلاً من 50
-        
-        for other_verse in all_verses:
-            # تخطي نفس الآية
-            if other_verse.id == verse.id:
-                continue
-            
-            # ✅ تخطي البسملات
-            if is_basmala_verse(other_verse):
-                continue
-            
-            total_comparisons += 1
-            
-            similarity = calculate_word_similarity(verse.text, other_verse.text)
-            
-            # ✅ min_similarity أعلى (0.50) → نتائج أقل وأفضل!
-            if min_similarity <= similarity < 0.99:
-                # تأكد من عدم التكرار
-                existing = any(sv['verse_id'] == other_verse.id for sv in similar_verses)
-                if not existing:
-                    similar_verses.append({
-                        'verse_id': other_verse.id,
-                        'surah': other_verse.surah,
-                        'surah_name': other_verse.surah_name,
-                        'ayah': other_verse.ayah,
-                        'text': other_verse.text,
-                        'similarity': similarity
-                    })
-                    total_pairs_found += 1
-                    
-                    # ✅✅✅ الإضافة الحاسمة: إيقاف مبكر!
-                    if len(similar_verses) >= MAX_RESULTS:
-                        break  # توقف فوراً عند 20 نتيجة!
-
-        # ترتيب وتخزين أفضل النتائج
-        similar_verses.sort(key=lambda x: x['similarity'], reverse=True)
-        SIMILARITY_CACHE[verse.id] = similar_verses[:MAX_RESULTS]
-        
-        # ✅ حفظ تلقائي كل 200 آية (أسرع)
-        if (i + 1) % 200 == 0:
-            try:
-                np.save("similarity_cache_temp.npy", SIMILARITY_CACHE)
-                elapsed_now = time.time() - start_time
-                print(f"   💾 حفظ مؤقت: {i+1} آية ({elapsed_now/60:.1f} دقيقة)...")
-            except Exception as e:
-                print(f"   ⚠️ خطأ في الحفظ المؤقت: {e}")
-    
-    # حفظ نهائي
+    # حفظ المخزن (الـ manifest داخل meta.json)
     try:
-        np.save("similarity_cache.npy", SIMILARITY_CACHE)
-        print(f"\n✅ تم حفظ similarity cache: {len(SIMILARITY_CACHE)} آية")
-        
-        # حذف الملف المؤقت
-        import os
-        if os.path.exists("similarity_cache_temp.npy"):
-            os.remove("similarity_cache_temp.npy")
+        save_word_stats(word_stats, WORD_STATS_STORE_DIR)
+        print(f"✅ تم حفظ word stats: {len(word_stats)} كلمة ({word_stats.nbytes / 1024:.0f} KB)")
     except Exception as e:
-        print(f"❌ خطأ في حفظ similarity cache: {e}")
+        print(f"❌ خطأ في حفظ word stats: {e}")
     
     elapsed = time.time() - start_time
+    print(f"✅ اكتمل بناء word statistics cache في {elapsed:.1f} ثانية")
     
-    # حساب الحجم التقريبي
-    avg_results_per_verse = total_pairs_found / (len(SIMILARITY_CACHE) - skipped_basmala) if (len(SIMILARITY_CACHE) - skipped_basmala) > 0 else 0
-    estimated_size_mb = (len(SIMILARITY_CACHE) * avg_results_per_verse * 200) / 1024 / 1024
-    
-    print("="*60)
-    print(f"✅ اكتمل بناء similarity cache")
-    print(f"   ⏱️  الزمن: {elapsed/60:.1f} دقيقة ({elapsed:.0f} ثانية)")
-    print(f"   📊 المقارنات: {total_comparisons:,}")
-    print(f"   ✅ المتشابهات: {total_pairs_found:,}")
-    print(f"   🚫 البسملات المستبعدة: {skipped_basmala}")
-    print(f"   📈 متوسط النتائج/آية: {avg_results_per_verse:.1f}")
-    print(f"   💾 الحجم التقريبي: ~{estimated_size_mb:.1f} MB")
-    print("="*60)
-    
-    return SIMILARITY_CACHE
+    publish_generation(word_stats=word_stats)
+    return word_stats
 
-def build_word_statistics_cache(db: Session):
+def build_ngram_cache(db: Session):
     """
-    بناء إحصائيات الكلمات مسبقاً - مُحدّث
+    بناء فهرس الـ n-grams (ngram_index) وحفظه ونشره
     """
-    global WORD_STATS_CACHE
-    
-    print("🔄 بدء بناء word statistics cache...")
+    print("🔄 بدء بناء فهرس الـ n-grams...")
     start_time = time.time()
     
-    all_verses = db.query(Verse).all()
-    WORD_STATS_CACHE = {}
-    
-    # كلمات شائعة يجب استبعادها
-    common_words = {
-        'في', 'من', 'إلى', 'على', 'عن', 'أن', 'إن', 'ما', 'لا', 'هل', 'بل',
-        'قد', 'سى', 'كان', 'يكون', 'قال', 'قل', 'إن', 'أن', 'هو', 'هي', 'هم',
-        'كذلك', 'الذي', 'التي', 'الذين', 'اللاتي', 'اللائي', 'ذلك', 'هذه',
-        'هذا', 'هؤلاء', 'تلك', 'أولئك', 'بعض', 'كل', 'جميع', 'أي', 'أين',
-        'متى', 'كيف', 'لماذا', 'كم', 'أيضا', 'ثم', 'حتى', 'أما', 'أو', 'و'
-    }
-    
-    for verse in all_verses:
-        verse_clean = clean_text(verse.text)
-        words = verse_clean.split()
-        
-        for word in words:
-            if len(word) < 2 or word in common_words:
-                continue
-                
-            if word not in WORD_STATS_CACHE:
-                WORD_STATS_CACHE[word] = {
-                    'total_count': 0,
-                    'verses_count': 0,
-                    'verses': [],  # ✅ سيحتوي على {verse_info, count}
-                    'by_surah': {},
-                    'by_juz': {}
-                }
-            
-            # حساب التكرار في هذه الآية
-            count_in_verse = verse_clean.count(word)
-            WORD_STATS_CACHE[word]['total_count'] += count_in_verse
-            
-            # إضافة الآية إذا لم تكن موجودة
-            verse_info = {
-                'id': verse.id,
-                'surah': verse.surah,
-                'surah_name': verse.surah_name,
-                'ayah': verse.ayah,
-                'text': verse.text,
-                'juz': verse.juz,
-                'count': count_in_verse  # ✅ إضافة count هنا أيضاً
-            }
-            
-            # تجنب التكرار
-            existing_verse = next((v for v in WORD_STATS_CACHE[word]['verses'] 
-                                if v['id'] == verse.id), None)
-            if not existing_verse:
-                WORD_STATS_CACHE[word]['verses'].append(verse_info)
-                WORD_STATS_CACHE[word]['verses_count'] = len(WORD_STATS_CACHE[word]['verses'])
-            
-            # تحديث إحصائيات السورة
-            surah_key = f"{verse.surah_name} ({verse.surah})"
-            WORD_STATS_CACHE[word]['by_surah'][surah_key] = WORD_STATS_CACHE[word]['by_surah'].get(surah_key, 0) + count_in_verse
-            
-            # تحديث إحصائيات الجزء
-            if verse.juz:
-                juz_key = f"الجزء {verse.juz}"
-                WORD_STATS_CACHE[word]['by_juz'][juz_key] = WORD_STATS_CACHE[word]['by_juz'].get(juz_key, 0) + count_in_verse
+    ngram_index = build_ngram_index(get_corpus(db))
     
-    # حفظ cache في ملف
     try:
-        with open("word_stats_cache.json", 'w', encoding='utf-8') as f:
-            json.dump(WORD_STATS_CACHE, f, ensure_ascii=False, indent=2)
-        print(f"✅ تم حفظ word stats cache: {len(WORD_STATS_CACHE)} كلمة")
+        save_ngram_index(ngram_index, NGRAM_INDEX_DIR)
+        print(f"✅ تم حفظ فهرس الـ n-grams: {len(ngram_index):,} ({ngram_index.nbytes / 1024:.0f} KB)")
     except Exception as e:
-        print(f"❌ خطأ في حفظ word stats cache: {e}")
+        print(f"❌ خطأ في حفظ فهرس الـ n-grams: {e}")
     
     elapsed = time.time() - start_time
-    print(f"✅ اكتمل بناء word statistics cache في {elapsed:.1f} ثانية")
+    print(f"✅ اكتمل بناء فهرس الـ n-grams في {elapsed:.1f} ثانية")
     
-    return WORD_STATS_CACHE
+    publish_generation(ngram_index=ngram_index)
+    return ngram_index
 
 def build_fts_index(db: Session):
     """
-    بناء فهرس FTS5 للبحث الفوري
+    بناء جداول FTS5 - النص الأصلي والمُطبَّع والثلاثيات (fts_index: كل جدول يُعاد ملؤه إذا كان فارغاً أو قديماً)
     """
     print("🔄 بدء بناء فهرس FTS5...")
     start_time = time.time()
     
     try:
-        conn = sqlite3.connect('quran.db')
-        cursor = conn.cursor()
-        
-        # إنشاء جدول FTS5
-        cursor.execute('''
-            CREATE VIRTUAL TABLE IF NOT EXISTS verses_fts 
-            USING fts5(text, content=verses, content_rowid=id)
-        ''')
-        
-        # ملء الفهرس (إذا كان فارغاً)
-        cursor.execute('SELECT COUNT(*) FROM verses_fts')
-        count = cursor.fetchone()[0]
-        
-        if count == 0:
-            cursor.execute('''
-                INSERT INTO verses_fts(rowid, text)
-                SELECT id, text FROM verses
-            ''')
-            print("✅ تم ملء فهرس FTS5 بالبيانات")
-        else:
-            print(f"✅ فهرس FTS5 موجود بالفعل: {count} آية")
-        
-        conn.commit()
-        conn.close()
+        corpus = get_corpus(db)
+        build_fts_table(DATABASE_FILE, db, corpus)
+        build_clean_fts_table(DATABASE_FILE, db, corpus)
+        build_trigram_fts_table(DATABASE_FILE, db, corpus)
         
         elapsed = time.time() - start_time
         print(f"✅ اكتمل بناء فهرس FTS5 في {elapsed:.1f} ثانية")
@@ -603,15 +648,117 @@ def build_fts_index(db: Session):
         print(f"❌ خطأ في بناء فهرس FTS5: {e}")
         return False
 
+# ============================================
+# 🧵 مهام البناء في الخلفية (عملية منفصلة لكل مهمة)
+# ============================================
+def fts_published_fields() -> dict:
+    """حقول الجيل بعد بناء كل جداول FTS5 بنجاح"""
+    return dict({field: True for _, field, _ in SEARCH_FTS_TABLES.values()}, fts_available=True)
+
+def job_build_similarity(db: Session, progress, min_similarity: float = 0.50, method: str = "exact",
+                         check_recall: bool = False, workers: int = 1, resume: bool = True,
+                         top_k: int = MAX_RESULTS) -> dict:
+    """مهمة: similarity cache (يُحفظ في similarity_cache_csr ويُعاد تحميله في الخادم)"""
+    build_similarity_cache(db, min_similarity, method, check_recall, workers, resume, top_k, progress)
+    return current_generation().similarity_build_info
+
+def job_build_pairs(db: Session, progress, pair_floor: float = PAIR_FLOOR) -> dict:
+    """مهمة: مصفوفة أزواج التشابه"""
+    pairs = build_similarity_pairs(db, pair_floor, progress)
+    return pairs.meta
+
+def job_build_fts(db: Session, progress) -> dict:
+    """مهمة: جداول FTS5 (النص الأصلي + جداول البحث)"""
+    if not build_fts_index(db):
+        raise RuntimeError("فشل بناء فهرس FTS5")
+    return fts_published_fields()
+
+def job_build_word_stats(db: Session, progress) -> dict:
+    """مهمة: إحصائيات الكلمات (WORD_STATS_STORE_DIR)"""
+    return {"word_stats_cache_size": len(build_word_statistics_cache(db))}
+
+def job_build_ngrams(db: Session, progress) -> dict:
+    """مهمة: فهرس الـ n-grams (NGRAM_INDEX_DIR)"""
+    return {"ngram_index_size": len(build_ngram_cache(db))}
+
+JOB_HANDLERS = {
+    "similarity": job_build_similarity,
+    "pairs": job_build_pairs,
+    "fts": job_build_fts,
+    "word_stats": job_build_word_stats,
+    "ngrams": job_build_ngrams,
+}
+
+def job_params(kind: str, data: dict) -> dict:
+    """التحقق من معاملات المهمة (نفس حدود /admin/build-cache) - ValueError عند الخطأ"""
+    if kind == "similarity":
+        params = {
+            "min_similarity": float(data.get("min_similarity", 0.50)),
+            "method": str(data.get("method", "exact")),
+            "check_recall": bool(data.get("check_recall", False)),
+            "workers": int(data.get("workers", 1)),
+            "resume": bool(data.get("resume", True)),
+            "top_k": int(data.get("top_k", MAX_RESULTS))
+        }
+        if not 0.01 <= params["min_similarity"] <= 0.95:
+            raise ValueError("min_similarity يجب أن يكون بين 0.01 و 0.95")
+        if params["method"] not in ("exact", "lsh"):
+            raise ValueError("method يجب أن يكون exact أو lsh")
+        if not 0 <= params["workers"] <= 64:
+            raise ValueError("workers يجب أن يكون بين 0 و 64")
+        if not 1 <= params["top_k"] <= 200:
+            raise ValueError("top_k يجب أن يكون بين 1 و 200")
+        return params
+    if kind == "pairs":
+        pair_floor = float(data.get("pair_floor", PAIR_FLOOR))
+        if not 0.1 <= pair_floor <= 0.9:
+            raise ValueError("pair_floor يجب أن يكون بين 0.1 و 0.9")
+        return {"pair_floor": pair_floor}
+    if kind in JOB_HANDLERS:
+        return {}
+    raise ValueError(f"نوع مهمة غير معروف: {kind} (المتاح: {', '.join(JOB_HANDLERS)})")
+
+def reload_job_artifacts(job):
+    """بعد نجاح مهمة: تحميل ما بنته العملية الفرعية من القرص إلى عملية الخادم ونشره كجيل جديد"""
+    corpus = get_corpus()
+    if job.kind == "similarity":
+        store = load_store(corpus)
+        if store is None:
+            raise RuntimeError(f"تعذّر تحميل similarity cache من {SIMILARITY_STORE_DIR}")
+        generation = publish_generation(similarity_cache=store, similarity_build_info=job.result)
+    elif job.kind == "pairs":
+        pairs = load_pair_matrix(corpus)
+        if pairs is None:
+            raise RuntimeError(f"تعذّر تحميل مصفوفة الأزواج من {PAIR_MATRIX_FILE}")
+        generation = publish_generation(similarity_pairs=pairs)
+    elif job.kind == "word_stats":
+        word_stats = load_word_stats(corpus)
+        if word_stats is None:
+            raise RuntimeError(f"تعذّر تحميل word stats من {WORD_STATS_STORE_DIR}")
+        generation = publish_generation(word_stats=word_stats)
+    elif job.kind == "ngrams":
+        ngram_index = load_ngram_index(corpus)
+        if ngram_index is None:
+            raise RuntimeError(f"تعذّر تحميل فهرس الـ n-grams من {NGRAM_INDEX_DIR}")
+        generation = publish_generation(ngram_index=ngram_index)
+    else:
+        generation = publish_generation(**fts_published_fields())
+    job.result = dict(job.result or {}, cache_generation=generation.number)
+    print(f"✅ المهمة {job.id} ({job.kind}): تم تحميل النتيجة في الخادم (الجيل {generation.number})")
+
+JOB_RUNNER = JobRunner(JOB_HANDLERS, on_done=reload_job_artifacts)
+
 # ============================================
 # 🚀 دالة جديدة: بحث شامل مسرّع باستخدام Similarity Cache
 # ============================================
 
 def fast_all_similarities_from_cache(db: Session, target_verses: List[Verse], compare_verses: List[Verse], 
-                                   min_similarity: float, limit: int, exclude_basmala: bool):
+                                   min_similarity: float, limit: int, exclude_basmala: bool, similarity_cache):
     """
     🚀 بحث شامل مسرّع باستخدام Similarity Cache
     ⚡ السرعة: 1-10 ثوانٍ بدلاً من 300+ ثانية
+    
+    similarity_cache: مخزن الجيل الذي يخدم الطلب (لا يتغير أثناء الحلقة)
     """
     print("🚀 استخدام Similarity Cache للبحث المسرّع...")
     start_time = time.time()
@@ -636,12 +783,11 @@ def fast_all_similarities_from_cache(db: Session, target_verses: List[Verse], co
         if exclude_basmala and is_basmala_verse(target_verse):
             continue
             
-        # جلب المتشابهات المخزنة لهذه الآية
-        if target_verse.id in SIMILARITY_CACHE:
-            cached_similarities = SIMILARITY_CACHE[target_verse.id]
+        # جلب المتشابهات المخزنة لهذه الآية (مصفوفات CSR - بيانات الآيات من المدوّنة)
+        if target_verse.id in similarity_cache:
+            neighbor_ids, scores = similarity_cache.row(target_verse.id)
             
-            for sim in cached_similarities:
-                compare_id = sim['verse_id']
+            for compare_id, similarity in zip(neighbor_ids.tolist(), scores.tolist()):
                 
                 # التأكد من أن الآية المقارنة في النطاق المطلوب
                 if compare_id not in compare_verse_ids:
@@ -657,9 +803,9 @@ def fast_all_similarities_from_cache(db: Session, target_verses: List[Verse], co
                     continue
                 
                 # التحقق من الحد الأدنى للتشابه
-                if sim['similarity'] >= min_similarity:
-                    # جلب الآية المقارنة من قاعدة البيانات
-                    compare_verse = db.query(Verse).filter(Verse.id == compare_id).first()
+                if similarity >= min_similarity:
+                    # جلب الآية المقارنة من المدوّنة (O(1))
+                    compare_verse = get_corpus(db).get(compare_id)
                     if not compare_verse:
                         continue
                     
@@ -673,8 +819,8 @@ def fast_all_similarities_from_cache(db: Session, target_verses: List[Verse], co
                         similarities.append({
                             'verse1': target_verse.to_dict(),
                             'verse2': compare_verse.to_dict(),
-                            'similarity': sim['similarity'],
-                            'score_percent': int(sim['similarity'] * 100)
+                            'similarity': similarity,
+                            'score_percent': int(similarity * 100)
                         })
                     
                     if len(similarities) >= limit:
@@ -691,15 +837,121 @@ def fast_all_similarities_from_cache(db: Session, target_verses: List[Verse], co
     
     return similarities
 
+def pair_matrix_all_similarities(db: Session, target_verses: List[Verse], compare_verses: List[Verse],
+                                 min_similarity: float, limit: int, similarity_pairs):
+    """
+    🧮 بحث شامل من مصفوفة الأزواج: قناع (العتبة + النطاقين) ثم أفضل limit زوج
+    ⚡ كل الأزواج ضمن العتبة بدون عينات (النطاقان مستبعد منهما البسملات مسبقاً عند الطلب)
+    """
+    start_time = time.time()
+    corpus = get_corpus(db)
+    records = corpus.records
+    
+    target_mask = np.zeros(len(corpus), dtype=bool)
+    target_mask[[v.index for v in target_verses]] = True
+    compare_mask = np.zeros(len(corpus), dtype=bool)
+    compare_mask[[v.index for v in compare_verses]] = True
+    
+    firsts, seconds, scores = similarity_pairs.pairs(min_similarity, target_mask, compare_mask)
+    
+    similarities = []
+    for first, second, similarity in zip(firsts.tolist(), seconds.tolist(), scores.tolist()):
+        target_verse, compare_verse = records[first], records[second]
+        
+        # ✅ الاستثناءات تخص التطابق 100% فقط (نصان مُطبَّعان متساويان)
+        if similarity >= 0.99 and is_excluded_100_percent_match(target_verse.text, compare_verse.text):
+            continue
+        
+        similarities.append({
+            'verse1': target_verse.to_dict(),
+            'verse2': compare_verse.to_dict(),
+            'similarity': similarity,
+            'score_percent': int(similarity * 100)
+        })
+        if len(similarities) >= limit:
+            break
+    
+    elapsed = time.time() - start_time
+    print(f"✅ مصفوفة الأزواج: {len(firsts):,} زوج ضمن العتبة، أُرجع {len(similarities)} في {elapsed:.3f}ث")
+    
+    return similarities
+
+# ============================================
+# 🧩 بحث شامل تقريبي باستخدام MinHash/LSH
+# ============================================
+
+def lsh_all_similarities(db: Session, target_verses: List[Verse], compare_verses: List[Verse],
+                         min_similarity: float, limit: int, check_recall: bool = False):
+    """
+    🧩 أزواج مرشّحة من LSH ثم تحقق دقيق (نفس calculate_word_similarity)
+    ⚡ مناسب للقرآن كاملاً عند العتبات المنخفضة - مع قياس الاسترجاع عند الطلب
+    """
+    print("🧩 استخدام MinHash/LSH للبحث الشامل التقريبي...")
+    start_time = time.time()
+    
+    corpus = get_corpus(db)
+    target_mask = np.zeros(len(corpus), dtype=bool)
+    target_mask[[v.index for v in target_verses]] = True
+    compare_mask = np.zeros(len(corpus), dtype=bool)
+    compare_mask[[v.index for v in compare_verses]] = True
+    
+    prefilter_stats = PrefilterStats()
+    verified = verified_lsh_pairs(corpus, min_similarity, target_mask | compare_mask, prefilter_stats)
+    
+    # نفس اتجاه البحث المحسّن: الآية الأقدم من نطاق البحث، والأحدث من نطاق المقارنة
+    def in_scope(pair):
+        i, j = pair
+        return target_mask[i] and compare_mask[j]
+    
+    records = corpus.records
+    found = {pair for pair in verified if in_scope(pair)}
+    
+    similarities = []
+    for i, j in found:
+        verse1, verse2 = records[i], records[j]
+        if is_excluded_100_percent_match(verse1.text, verse2.text):
+            continue
+        similarity = verified[(i, j)]
+        similarities.append({
+            'verse1': verse1.to_dict(),
+            'verse2': verse2.to_dict(),
+            'similarity': similarity,
+            'score_percent': int(similarity * 100)
+        })
+    
+    similarities.sort(key=lambda x: (-x['similarity'], x['verse1']['id'], x['verse2']['id']))
+    similarities = similarities[:limit]
+    
+    lsh_info = {
+        'jaccard_threshold': round(jaccard_for_similarity(min_similarity), 4),
+        'rows_bands': get_lsh_index(corpus).band_layout(jaccard_for_similarity(min_similarity)),
+        'verified_pairs': len(found),
+        'prefilter': prefilter_stats.to_dict()
+    }
+    
+    if not lsh_usable(min_similarity):
+        # تحت LSH_MIN_SIMILARITY يفقد LSH معظم الأزواج → verified_lsh_pairs أعاد النتيجة الدقيقة
+        lsh_info['redirected_to_exact'] = True
+        print(f"   ↪️ النسبة أقل من {LSH_MIN_SIMILARITY}: الأزواج الدقيقة بدلاً من LSH")
+    elif check_recall:
+        exact = {pair for pair in exact_pairs(corpus, min_similarity, target_mask | compare_mask) if in_scope(pair)}
+        lsh_info['recall'] = lsh_recall(found, exact)
+        print(f"   🎯 الاسترجاع: {lsh_info['recall']}")
+    
+    elapsed = time.time() - start_time
+    print(f"✅ LSH: {len(found)} زوج متحقق في {elapsed:.1f}ث")
+    
+    return similarities, lsh_info
+
 # ============================================
 # 🏆 دوال جديدة لوضع الخبير
 # ============================================
 
-def load_mutashabihat_bank():
-    """تحميل بنك الأسئلة من JSON"""
+def load_mutashabihat_bank(json_path: Optional[str] = None):
+    """تحميل بنك الأسئلة من JSON (نسخة الحزمة المجمّعة إن مُرّرت)"""
     global MUTASHABIHAT_BANK
     
-    json_path = FilePath(__file__).parent / "mutashabihat_kalima.json"
+    json_path = FilePath(json_path) if json_path else FilePath(__file__).parent / "mutashabihat_kalima.json"
     
     if not json_path.exists():
         print("⚠️ ملف mutashabihat_kalima.json غير موجود")
@@ -730,6 +982,7 @@ def get_expert_distinguish_question(db: Session, scope_filter):
         return get_distinguish_question(db, scope_filter, 0.85)
     
     questions = MUTASHABIHAT_BANK['questions']
+    corpus = get_corpus(db)
     
     # محاولة إيجاد سؤال مناسب (10 محاولات)
     for attempt in range(10):
@@ -744,18 +997,12 @@ def get_expert_distinguish_question(db: Session, scope_filter):
         valid_verses = []
         
         for verse_info in question_data['verses']:
-            # جلب الآية من قاعدة البيانات
-            verse = db.query(Verse).filter(
-                Verse.surah == verse_info['surah'],
-                Verse.ayah == verse_info['ayah']
-            ).first()
+            # جلب الآية من المدوّنة
+            verse = corpus.get_by_ref(verse_info['surah'], verse_info['ayah'])
             
             if verse:
                 # التحقق من أن الآية في النطاق المحدد
-                if scope_filter == True or db.query(Verse).filter(
-                    Verse.id == verse.id,
-                    scope_filter
-                ).first():
+                if corpus.in_scope(verse, **scope_filter):
                     valid_verses.append(verse)
         
         # إذا وجدنا 2+ آيات صالحة في النطاق
@@ -825,7 +1072,7 @@ def get_word_distractors(db: Session, target_word: str, current_surah_id: int, l
     
     try:
         # جلب آيات قريبة (نطاق سورة)
-        nearby_verses = db.query(Verse).filter(Verse.surah == current_surah_id).limit(10).all()
+        nearby_verses = get_corpus(db).select(surah=current_surah_id)[:10]
         
         all_words = []
         for v in nearby_verses:
@@ -853,17 +1100,17 @@ def get_word_distractors(db: Session, target_word: str, current_surah_id: int, l
 def get_verse_distractor(db: Session, target_verse: Verse, threshold: float, limit: int = 5) -> Optional[Verse]:
     """جلب آية مشتتة متشابهة"""
     # البحث عن آية متشابهة من سورة أخرى
+    corpus = get_corpus(db)
     try:
-        # جلب آيات عشوائية من سورة أخرى
-        other_verses = db.query(Verse).filter(Verse.surah != target_verse.surah, Verse.juz != target_verse.juz).limit(100).all()
+        # جلب آيات من سورة أخرى وجزء آخر (أول 100 بترتيب المعرّف)
+        other_mask = (corpus.surahs != target_verse.surah) & (corpus.juzs != target_verse.juz)
+        other_verses = [corpus.records[i] for i in np.flatnonzero(other_mask)[:100]]
         
         # البحث عن آية تشابهها لفظياً بنسبة عالية
         similar_distractors = []
-        target_clean = clean_text(target_verse.text)
         
         for v in other_verses:
-            v_clean = clean_text(v.text)
-            similarity = calculate_word_similarity(target_clean, v_clean)
+            similarity = corpus.similarity(target_verse, v, 0.75)
             
             # نختار آية متشابهة جداً، ولكن ليست 100%
             if 0.75 < similarity < 0.95:
@@ -875,15 +1122,20 @@ def get_verse_distractor(db: Session, target_verse: Verse, threshold: float, lim
             return similar_distractors[0][0]
         
         # إذا لم نجد، نرجع آية عشوائية قصيرة
-        return db.query(Verse).filter(Verse.surah != target_verse.surah).order_by(func.random()).first()
+        return random_verse_from_other_surah(corpus, target_verse.surah)
         
     except Exception as e:
         print(f"❌ خطأ في جلب مشتت الآية: {e}")
-        return db.query(Verse).filter(Verse.surah != target_verse.surah).order_by(func.random()).first()
+        return random_verse_from_other_surah(corpus, target_verse.surah)
+
+def random_verse_from_other_surah(corpus, surah: int):
+    """آية عشوائية من سورة مختلفة"""
+    indices = np.flatnonzero(corpus.surahs != surah)
+    return corpus.records[int(random.choice(indices))] if len(indices) else None
 
 def get_word_choice_question(db: Session, scope_filter, threshold: float):
     """إنشاء سؤال اختيار الكلمة مع خيارات"""
-    random_verse = db.query(Verse).filter(scope_filter).order_by(func.random()).first()
+    random_verse = get_corpus(db).random_verse(**scope_filter)
     
     if not random_verse:
         return {"error": "لم يتم العثور على آية مطابقة للمعايير."}
@@ -922,7 +1174,7 @@ def get_word_choice_question(db: Session, scope_filter, threshold: float):
 
 def get_distinguish_question(db: Session, scope_filter, threshold: float):
     """إنشاء سؤال تمييز المتشابهات مع خيارات"""
-    random_verse = db.query(Verse).filter(scope_filter).order_by(func.random()).first()
+    random_verse = get_corpus(db).random_verse(**scope_filter)
     
     if not random_verse:
         return {"error": "لم يتم العثور على آية مطابقة للمعايير."}
@@ -963,6 +1215,11 @@ def get_distinguish_question(db: Session, scope_filter, threshold: float):
 def exact_phrase_search(db: Session, query: str, limit: int = 20) -> List[dict]:
     """
     🔥 بحث دقيق عن العبارة الكاملة - يضمن مطابقة 100%
+    
+    ⚡ من فهرس العبارات (phrase_index - suffix array على كلمات المدوّنة): المطابقة في النص المُطبَّع
+    والكلمات بالترتيب تُقرأ من المواقع مباشرة بدلاً من فحص كل آية، والمطابقة في النص الأصلي
+    من raw_text_candidates (جزء كلمة عثمانية قد لا يكون تطبيعه جزءاً من النص المُطبَّع)
+    match_positions: أرقام الكلمات المطابقة في النص المُطبَّع (للتظليل) - فارغة للمطابقة الأصلية فقط
     """
     start_time = time.time()
     
@@ -973,74 +1230,55 @@ def exact_phrase_search(db: Session, query: str, limit: int = 20) -> List[dict]:
     print(f"🔍 البحث الدقيق عن العبارة: '{original_query}'")
     print(f"   بعد التنظيف: '{query_clean}'")
     
-    # جلب جميع الآيات للبحث الدقيق
-    all_verses = db.query(Verse).all()
+    corpus = get_corpus(db)
+    clean_matches, sequence_matches = {}, {}
+    if query_clean:
+        # 1. مطابقة في النص الأصلي (العثماني)
+        raw_matches = raw_text_candidates(corpus, original_query)
+        index = get_phrase_index(corpus)
+        # 2. مطابقة في النص النظيف (نص جزئي - نفس query_clean in text_clean)
+        clean_matches = index.substring_matches(query_clean, corpus.vocab)
+        # 3. مطابقة كلمات بالترتيب (للرسم العثماني) - كلمات القاموس مُطبَّعة مسبقاً
+        word_ids = [corpus.vocab.get(clean_text(word)) for word in query_clean.split()]
+        if None not in word_ids:
+            sequence_matches = index.sequence_matches(word_ids)
+        candidates = sorted(set(clean_matches) | set(sequence_matches) | set(raw_matches))
+    else:
+        # الاستعلام بعد التطبيع فارغ (علامات وقف فقط): '' موجود في كل نص نظيف → كل الآيات (كما كان)
+        candidates = list(range(len(corpus)))
+        clean_matches = dict.fromkeys(candidates, [])
     
     exact_matches = []
     
-    for verse in all_verses:
-        verse_text_original = verse.text  # النص الأصلي
-        verse_clean = clean_text(verse.text)
-        
-        # ✅ البحث الدقيق بثلاث طرق:
+    for verse_index in candidates[:limit]:
+        verse = corpus.records[verse_index]
+        verse_dict = verse.to_dict()
+        verse_dict['similarity'] = "1.0000"
         
+        # ✅ نوع المطابقة بنفس أولوية الطرق الثلاث
         # 1. مطابقة في النص الأصلي (الأفضل)
-        if original_query in verse_text_original:
-            verse_dict = verse.to_dict()
-            verse_dict['similarity'] = "1.0000"
+        if original_query in verse.text:
             verse_dict['match_type'] = 'exact_phrase_original'
-            exact_matches.append(verse_dict)
-            continue
-            
-        # 2. مطابقة في النص النظيف
-        if query_clean in verse_clean:
-            verse_dict = verse.to_dict()
-            verse_dict['similarity'] = "1.0000" 
+        elif verse_index in clean_matches:
             verse_dict['match_type'] = 'exact_phrase_clean'
-            exact_matches.append(verse_dict)
-            continue
-            
-        # 3. مطابقة كلمات بالترتيب (للرسم العثماني)
-        if all_words_in_sequence(query_clean.split(), verse_clean.split()):
-            verse_dict = verse.to_dict()
-            verse_dict['similarity'] = "1.0000"
+        else:
             verse_dict['match_type'] = 'exact_sequence'
-            exact_matches.append(verse_dict)
-        
-        if len(exact_matches) >= limit:
-            break
+        verse_dict['match_positions'] = clean_matches.get(verse_index) or sequence_matches.get(verse_index, [])
+        exact_matches.append(verse_dict)
     
     elapsed = time.time() - start_time
-    print(f"✅ البحث الدقيق: {len(exact_matches)} نتيجة مطابقة 100% في {elapsed:.3f}ث")
+    print(f"✅ البحث الدقيق: {len(exact_matches)} نتيجة مطابقة 100% في {elapsed:.3f}ث (من {len(candidates)} مطابقة في الفهرس)")
     
     return exact_matches
 
-def all_words_in_sequence(query_words: list, verse_words: list) -> bool:
-    """
-    ✅ تحقق من أن كل كلمات الاستعلام موجودة بالترتيب في الآية
-    """
-    if not query_words:
-        return False
-    
-    query_index = 0
-    
-    for verse_word in verse_words:
-        if query_index >= len(query_words):
-            break
-            
-        clean_verse_word = clean_text(verse_word)
-        clean_query_word = clean_text(query_words[query_index])
-        
-        # ✅ مطابقة دقيقة للكلمة
-        if clean_verse_word == clean_query_word:
-            query_index += 1
-    
-    # ✅ نجحنا في إيجاد كل الكلمات بالترتيب
-    return query_index == len(query_words)
-
 def exact_text_search(db: Session, query: str, limit: int = 20) -> List[dict]:
     """
     🔥 بحث نصي دقيق - يبحث في النصين الأصلي والنظيف
+    
+    ⚡ الفحص على مرشّحات فهرس النص المُطبَّع (verses_clean_fts + القاموس) مع مرشّحات النص
+    الأصلي (raw_text_candidates): التطبيع ليس محافظاً على النص الجزئي ("ذَٰل" في "ذَٰلِكَ"
+    يصبح "ذال" وليس جزءاً من "ذلك")؛
+    المسح الكامل إذا لم يوجد الفهرس أو كان الاستعلام بعد التطبيع فارغاً (علامات وقف فقط)
     """
     start_time = time.time()
     
@@ -1050,11 +1288,20 @@ def exact_text_search(db: Session, query: str, limit: int = 20) -> List[dict]:
     print(f"🔍 البحث النصي الدقيق عن: '{original_query}' (نظيف: '{query_clean}')")
     
     exact_matches = []
-    all_verses = db.query(Verse).all()
+    corpus = get_corpus(db)
+    candidates = None
+    if query_clean and current_generation().fts_clean_available:
+        candidates = substring_candidates(DATABASE_FILE, corpus, query_clean)
+        if candidates is not None:
+            candidates = sorted(set(candidates) | set(raw_text_candidates(corpus, original_query)))
+    all_verses = corpus.records if candidates is None else [corpus.records[i] for i in candidates]
     
     for verse in all_verses:
+        if len(exact_matches) >= limit:
+            break
+        
         verse_text_original = verse.text
-        verse_clean = clean_text(verse.text)
+        verse_clean = verse.text_clean  # ⚡ محسوب مسبقاً
         
         # ✅ البحث في النص الأصلي أولاً (للعثماني)
         if original_query in verse_text_original:
@@ -1070,16 +1317,45 @@ def exact_text_search(db: Session, query: str, limit: int = 20) -> List[dict]:
             verse_dict['similarity'] = "1.0000"
             verse_dict['match_type'] = 'exact_clean' 
             exact_matches.append(verse_dict)
-            continue
-            
-        if len(exact_matches) >= limit:
-            break
     
     elapsed = time.time() - start_time
-    print(f"✅ البحث النصي الدقيق: {len(exact_matches)} نتيجة في {elapsed:.3f}ث")
+    method = "مسح كامل" if candidates is None else f"{len(candidates)} مرشّحاً من الفهرس"
+    print(f"✅ البحث النصي الدقيق: {len(exact_matches)} نتيجة في {elapsed:.3f}ث ({method})")
     
     return exact_matches
 
+def raw_text_candidates(corpus, original_query: str) -> List[int]:
+    """
+    مواقع الآيات (بترتيب المصحف) التي يحتوي نصها الأصلي (العثماني) على original_query
+
+    ⚡ من فهرس الثلاثيات (عمود text) إن وُجد، وإلا مسح النصوص الأصلية في الذاكرة
+    (مقارنة نصية فقط بدون تطبيع)
+    """
+    if not original_query:
+        return []
+    if current_generation().fts_trigram_available:
+        verse_ids = trigram_search(DATABASE_FILE, "text", original_query)
+        if verse_ids is not None:
+            return [corpus.index_by_id[verse_id] for verse_id in verse_ids if verse_id in corpus.index_by_id]
+    return [index for index, text in enumerate(corpus.texts) if original_query in text]
+
+def substring_search(db: Session, column: str, query: str, limit: int):
+    """
+    ⚡ الآيات التي يحتوي عمودها (text أو text_clean) على query - من فهرس الثلاثيات
+    
+    Returns:
+        سجلات المدوّنة بترتيب المصحف (بعد التحقق)، أو None → المستدعي يمسح
+        (الفهرس غير جاهز أو الاستعلام أقصر من 3 أحرف)
+    """
+    if not current_generation().fts_trigram_available:
+        return None
+    verse_ids = trigram_search(DATABASE_FILE, column, query, limit)
+    if verse_ids is None:
+        return None
+    corpus = get_corpus(db)
+    verses = (corpus.get(verse_id) for verse_id in verse_ids)
+    return [verse for verse in verses if verse is not None and query in getattr(verse, column)]
+
 def semantic_search(query: str, limit: int = 100):
     """البحث الدلالي باستخدام FAISS - معطل في Production"""
     print(f"⚠️ البحث الدلالي معطل للاستعلام: '{query}'")
@@ -1091,14 +1367,17 @@ def fallback_search(db: Session, query: str, limit: int = 20, threshold: float =
     🔥 بحث احتياطي محدث - برفع threshold إلى 0.7
     """
     start_time = time.time()
-    all_verses = db.query(Verse).all()
+    corpus = get_corpus(db)
     query_clean = clean_text(query)
+    query_clean_twice = clean_text(query_clean)  # calculate_similarity كانت تُطبّع المدخلات مرة ثانية
+    query_tokens = corpus.encode(query_clean_twice)
+    prefilter_stats = PrefilterStats()
     
     final_results = []
     
-    for verse in all_verses:
-        verse_clean = clean_text(verse.text)
-        similarity = calculate_similarity(query_clean, verse_clean)
+    # ⚡ الفهرس المقلوب: فحص الآيات المرشّحة فقط
+    for verse in corpus.candidates(query_tokens.counts, threshold, prefilter_stats):
+        similarity = corpus.query_similarity(query_tokens, verse, threshold, prefilter_stats)
         
         if similarity >= threshold:  # ✅ رفع من 0.3 إلى 0.7
             verse_dict = verse.to_dict()
@@ -1109,12 +1388,14 @@ def fallback_search(db: Session, query: str, limit: int = 20, threshold: float =
     final_results.sort(key=lambda x: x[1], reverse=True)
     
     elapsed = time.time() - start_time
+    print(f"🚧 البحث الاحتياطي - المرشّحات: {prefilter_stats}")
     
     return {
         "query": query,
         "search_time": f"{elapsed:.3f}s",
         "error": error if error else "تم استخدام البحث اللفظي الاحتياطي",
         "total_found": len(final_results),
+        "prefilter": prefilter_stats.to_dict(),
         "results": [item[0] for item in final_results[:limit]]
     }
 
@@ -1124,22 +1405,36 @@ def fallback_search(db: Session, query: str, limit: int = 20, threshold: float =
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """دالة تُنفذ عند بدء التشغيل"""
-    print("\n--- 💾 إعداد قاعدة بيانات SQLite ---")
+    global QURAN_BUNDLE
+    start_time = time.time()
+    
+    # 📦 الحزمة المجمّعة (python -m bundle): كل شيء جاهز بـ memory-map - بدون init_db ولا بناء
+    bundle = QURAN_BUNDLE = open_bundle()
     db = next(get_db())
-    init_db(db)
+    if bundle is not None:
+        set_corpus(bundle.corpus)
+    else:
+        print("\n--- 💾 إعداد قاعدة بيانات SQLite ---")
+        init_db(db)
+        
+        # 📚 تحميل المدوّنة في الذاكرة (مرة واحدة - بدلاً من db.query(Verse).all() لكل طلب)
+        load_corpus(db)
     
     # تهيئة محرك البحث الدلالي
     initialize_search_engine(db)
     
     # 🏆 تحميل بنك المتشابهات
-    load_mutashabihat_bank()
+    load_mutashabihat_bank(bundle.bank_file if bundle is not None and os.path.exists(bundle.bank_file) else None)
     
     # 🚀 تهيئة أنظمة التحسينات
-    initialize_optimizations(db)
+    initialize_optimizations(db, bundle)
+    
+    print(f"⏱️ اكتمل الإقلاع في {time.time() - start_time:.2f}ث{' (من الحزمة المجمّعة)' if bundle is not None else ''}")
     
     db.close()
     yield
     print("\n--- 🧹 إغلاق الخادم ---")
+    JOB_RUNNER.shutdown()
 
 app = FastAPI(
     title="المصحف الذكي API",
@@ -1170,6 +1465,7 @@ def root():
         "endpoints": {
             "search": "/search?q=الكلمة",
             "search_fixed": "/search/fixed?q=الكلمة (يدعم الرسم العثماني)",
+            "search_phrase": "/search/phrase?q=العبارة (مطابقة العبارة أو كلماتها بالترتيب)",
             "live_search": "/search/live?q=الكلمة",
             "similar_verses": "/similar/{verse_id}",
             "quiz": "/quiz/get_question (POST)",
@@ -1194,14 +1490,19 @@ def fixed_search(
     🔍 بحث محسّن يدعم الرسم العثماني بالكامل
     ✅ يبحث في النص الأصلي مباشرة (بدون تنظيف)
     ✅ يدعم جميع أشكال الكتابة العثمانية
+    ⚡ فهرس الثلاثيات (verses_trigram_fts) بدلاً من LIKE على كل الصفوف
     """
     print(f"\n🎯 بحث محسّن للعثماني: '{q}'")
     start_time = time.time()
     
     # البحث في النص الأصلي مباشرة (يدعم العثماني)
-    verses = db.query(Verse).filter(
-        Verse.text.contains(q)
-    ).limit(limit).all()
+    verses = substring_search(db, "text", q, limit)
+    method = "trigram_index"
+    if verses is None:
+        verses = db.query(Verse).filter(
+            Verse.text.contains(q)
+        ).limit(limit).all()
+        method = "contains_search"
     
     results = []
     for verse in verses:
@@ -1218,7 +1519,34 @@ def fixed_search(
         "search_time": f"{elapsed:.3f}s",
         "total_found": len(results),
         "match_type": "exact_original",
-        "method": "contains_search",
+        "method": method,
+        "results": results
+    }
+
+@app.get("/search/phrase")
+def phrase_search(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, gt=0, le=100),
+    db: Session = Depends(get_db)
+):
+    """
+    🔍 بحث دقيق عن العبارة: في النص الأصلي، أو النص المُطبَّع، أو كلماتها بالترتيب (مع فجوات)
+    ✅ match_positions: مواقع الكلمات المطابقة (للتظليل في الواجهة)
+    ⚡ من فهرس العبارات (suffix array) بدلاً من فحص كل آية
+    """
+    print(f"\n🎯 بحث العبارة: '{q}'")
+    start_time = time.time()
+    
+    results = exact_phrase_search(db, q, limit)
+    
+    elapsed = time.time() - start_time
+    
+    return {
+        "query": q,
+        "query_clean": clean_text(q),
+        "search_time": f"{elapsed:.3f}s",
+        "total_found": len(results),
+        "match_type": "exact_phrase",
         "results": results
     }
 
@@ -1239,9 +1567,11 @@ def search_both_methods(
     results = []
     
     # الطريقة 1: البحث في النص الأصلي (العثماني)
-    verses_original = db.query(Verse).filter(
-        Verse.text.contains(q)
-    ).limit(limit).all()
+    verses_original = substring_search(db, "text", q, limit)
+    if verses_original is None:
+        verses_original = db.query(Verse).filter(
+            Verse.text.contains(q)
+        ).limit(limit).all()
     
     for verse in verses_original:
         results.append({
@@ -1252,12 +1582,14 @@ def search_both_methods(
         })
     
     # الطريقة 2: البحث في النص النظيف (العادي)
+    # ⚡ أول limit مطابقة تكفي: المتكرر منها مع الطريقة 1 لا يتجاوز عدد نتائجها
     q_clean = clean_text(q)
-    all_verses = db.query(Verse).all()
+    all_verses = substring_search(db, "text_clean", q_clean, limit)
+    if all_verses is None:
+        all_verses = get_corpus(db).records  # مسح في الذاكرة (بدون تحميل كل صفوف ORM)
     
     for verse in all_verses:
-        verse_clean = clean_text(verse.text)
-        if q_clean in verse_clean:
+        if q_clean in verse.text_clean:
             # تجنب التكرار
             existing = any(r['id'] == verse.id for r in results)
             if not existing:
@@ -1302,7 +1634,8 @@ def live_search_verses(
     start_time = time.time()
     
     # البحث باستخدام FTS5
-    results = fast_text_search_fts(q, limit)
+    generation = current_generation()
+    results = fast_text_search_fts(q, limit, generation)
     
     # إضافة التظليل إذا طُلب
     if highlight:
@@ -1317,7 +1650,8 @@ def live_search_verses(
         "total_found": len(results),
         "match_type": "fts_live",
         "method": "FTS5",
-        "results": results
+        "results": results,
+        "cache_generation": generation.number
     }
 
 @app.get("/similarities/fast/{verse_id}")
@@ -1339,8 +1673,9 @@ def get_fast_similarities(
     if not verse:
         raise HTTPException(status_code=404, detail="الآية غير موجودة")
     
-    # جلب المتشابهات من cache
-    similar_verses = get_cached_similarities(verse_id, min_similarity)
+    # جلب المتشابهات من cache (جيل واحد للطلب كله)
+    generation = current_generation()
+    similar_verses = get_cached_similarities(generation, verse_id, min_similarity)
     
     elapsed = time.time() - start_time
     
@@ -1348,9 +1683,61 @@ def get_fast_similarities(
         "verse": verse.to_dict(),
         "similar_verses": similar_verses,
         "search_time": f"{elapsed:.3f}s",
-        "method": "cache",
+        "method": "pair_matrix" if generation.pairs_cover(min_similarity) else "cache",
         "cache_hit": len(similar_verses) > 0,
-        "total_found": len(similar_verses)
+        "total_found": len(similar_verses),
+        "cache_generation": generation.number
+    }
+
+@app.get("/autocomplete/phrase")
+def get_phrase_suggestions(
+    q: str = Query(..., min_length=1, description="العبارة حتى الآن (الكلمة الأخيرة بدون مسافة بعدها تُكمَّل)"),
+    limit: int = Query(10, gt=0, le=20, description="عدد الاقتراحات"),
+    verses: int = Query(5, ge=0, le=100, description="عدد معرّفات الآيات لكل اقتراح"),
+    db: Session = Depends(get_db)
+):
+    """
+    🚀 اقتراح الكلمة التالية أثناء كتابة عبارة ("يا ايها" → "الذين"، "الناس"...)
+    
+    ✅ من فهرس الـ n-grams: آخر كلمتين (ثلاثيات) ثم آخر كلمة (ثنائيات) إن لم توجد تكملة
+    ✅ الكلمة الأخيرة غير المكتملة ("يا ايها الذ") تقيّد الاقتراحات بما يبدأ بها
+    💡 لإكمال الكلمة الأولى وحدها: /autocomplete/{prefix}
+    """
+    start_time = time.time()
+    
+    words = clean_text(q).split()
+    partial = words.pop() if words and not q[-1].isspace() else ""
+    suggestions = []
+    order = 0
+    generation = current_generation()
+    ngram_index = generation.ngram_index
+    
+    if ngram_index is not None and words:
+        corpus = get_corpus(db)
+        allowed = ngram_index.prefix_ids(partial) if partial else None
+        order, rows = ngram_index.continuations([corpus.vocab.get(word) for word in words], limit, allowed)
+        for table, row in rows:
+            word = ngram_index.words[int(table.next_ids[row])]
+            attested = table.verses(row)
+            suggestions.append({
+                'word': word,
+                'phrase': ' '.join(words[len(words) - order + 1:] + [word]),
+                'count': int(table.counts[row]),
+                'verses_count': len(attested),
+                'verse_ids': attested[:verses].tolist()
+            })
+    
+    elapsed = time.time() - start_time
+    
+    return {
+        "query": q,
+        "context": words[len(words) - order + 1:] if order else [],
+        "partial": partial,
+        "order": order,
+        "suggestions": suggestions,
+        "search_time": f"{elapsed:.4f}s",
+        "total_found": len(suggestions),
+        "cache_generation": generation.number
     }
 
 @app.get("/autocomplete/{prefix}")
@@ -1361,27 +1748,26 @@ def get_autocomplete_suggestions(
     """
     🚀 اقتراحات تلقائية أثناء الكتابة
     ⚡ السرعة: 1-5ms
-    ✅ يعتمد على word statistics cache
+    ✅ يعتمد على word statistics cache: البادئة نطاق متصل بالبحث الثنائي + أكثر الكلمات
+       تكراراً لكل بادئة محسوبة مسبقاً (prefix_top) → بدون ترتيب عند كل حرف
+    ✅ البادئة بالرسم العثماني أو الإملائي (تُطبَّع مثل الكلمات)
     """
     print(f"\n🎯 AutoComplete: '{prefix}'")
     start_time = time.time()
     
     prefix_clean = clean_text(prefix)
     suggestions = []
-    
-    if WORD_STATS_CACHE:
-        # البحث عن الكلمات التي تبدأ بالبادئة
-        for word, stats in WORD_STATS_CACHE.items():
-            if word.startswith(prefix_clean):
-                suggestions.append({
-                    'word': word,
-                    'count': stats['total_count'],
-                    'verses_count': stats['verses_count']
-                })
-        
-        # ترتيب حسب التكرار
-        suggestions.sort(key=lambda x: x['count'], reverse=True)
-        suggestions = suggestions[:limit]
+    generation = current_generation()
+    word_stats = generation.word_stats
+    
+    if word_stats:
+        # أكثر الكلمات تكراراً من التي تبدأ بالبادئة
+        for index in word_stats.complete(prefix_clean, limit):
+            suggestions.append({
+                'word': str(word_stats.words[index]),
+                'count': int(word_stats.totals[index]),
+                'verses_count': word_stats.verses_count(index)
+            })
     
     elapsed = time.time() - start_time
     
@@ -1389,21 +1775,22 @@ def get_autocomplete_suggestions(
         "prefix": prefix,
         "suggestions": suggestions,
         "search_time": f"{elapsed:.3f}s",
-        "total_found": len(suggestions)
+        "total_found": len(suggestions),
+        "cache_generation": generation.number
     }
 
-@app.get("/admin/build-fts")
-def admin_build_fts_index(db: Session = Depends(get_db)):
+@app.get("/admin/build-fts", status_code=202)
+def admin_build_fts_index():
     """
     🔧 بناء فهرس FTS5 (للمسؤولين)
-    ⚠️ يستغرق بضع ثوانٍ - يُشغّل مرة واحدة فقط
+    🧵 يُضاف كمهمة في الخلفية (نفس POST /admin/jobs بـ kind=fts) ويُرجع فوراً
     """
-    print("\n🔧 بناء فهرس FTS5...")
-    success = build_fts_index(db)
-    
+    job = JOB_RUNNER.submit("fts", job_params("fts", {}))
+    print(f"🧵 مهمة جديدة {job.id}: fts")
     return {
-        "success": success,
-        "message": "تم بناء فهرس FTS5 بنجاح" if success else "فشل بناء فهرس FTS5"
+        "message": "تمت إضافة بناء فهرس FTS5 إلى طابور المهام",
+        "job": job.to_dict(),
+        "note": f"تابع التقدّم عبر GET /admin/jobs/{job.id}"
     }
 
 # ============================================
@@ -1411,81 +1798,173 @@ def admin_build_fts_index(db: Session = Depends(get_db)):
 # ============================================
 # استبدل endpoint /admin/build-cache (حوالي السطر 590)
 
-@app.get("/admin/build-cache")
+@app.get("/admin/build-cache", status_code=202)
 def admin_build_cache(
-    cache_type: str = Query("all", regex="^(all|similarity|word_stats)$"),
+    cache_type: str = Query("all", regex="^(all|similarity|pairs|word_stats|ngrams)$"),
     min_similarity: float = Query(0.05, ge=0.01, le=0.5),
-    db: Session = Depends(get_db)
+    method: str = Query("exact", regex="^(exact|lsh)$"),
+    check_recall: bool = Query(False, description="قياس استرجاع LSH مقابل النتيجة الدقيقة"),
+    workers: int = Query(1, ge=0, le=64, description="عدد العمليات (0 = كل الأنوية)"),
+    resume: bool = Query(True, description="استئناف آخر نقطة محفوظة متوافقة"),
+    top_k: int = Query(20, ge=1, le=200, description="عدد أفضل المتشابهات لكل آية"),
+    pair_floor: float = Query(PAIR_FLOOR, ge=0.1, le=0.9, description="أقل نسبة تُحفظ في مصفوفة الأزواج")
 ):
     """
     🔧 بناء أنظمة Cache (للمسؤولين)
     
-    ⚠️ تحذير: قد يستغرق 10-20 دقيقة للقرآن كاملاً
+    🧵 كل نوع يُضاف كمهمة في الخلفية (نفس POST /admin/jobs) ويُرجع فوراً:
+    البناء في عملية منفصلة، مهمة واحدة في كل مرة (لا بناءان على نفس الملفات)
+    تابع التقدّم عبر GET /admin/build-cache/status أو GET /admin/jobs/{id}
     
     Parameters:
-    - cache_type: نوع الـ cache (all, similarity, word_stats)
+    - cache_type: نوع الـ cache (all, similarity, pairs, word_stats, ngrams)
     - min_similarity: الحد الأدنى للتشابه (افتراضي 0.05 = 5%)
+    - method: exact (الفهرس المقلوب) أو lsh (MinHash تقريبي - exact تحت 0.3)
+    - check_recall: مع lsh - مقارنة الأزواج بالنتيجة الدقيقة
+    - workers: عدد العمليات المتوازية لبناء Similarity Cache (0 = كل الأنوية)
+    - resume: استئناف بناء منقطع من similarity_cache_temp.npy (إذا كان متوافقاً)
+    - top_k: عدد أفضل المتشابهات المحفوظة لكل آية (افتراضي 20)
+    - pair_floor: الحد الأدنى لمصفوفة الأزواج (أي عتبة أعلى منه تُجاب بالكامل - افتراضي 0.3)
     """
-    print(f"\n🔧 بناء {cache_type} cache...")
-    print(f"   🎯 min_similarity: {min_similarity}")
+    data = {
+        "min_similarity": min_similarity,
+        "method": method,
+        "check_recall": check_recall,
+        "workers": workers,
+        "resume": resume,
+        "top_k": top_k,
+        "pair_floor": pair_floor
+    }
+    kinds = ["similarity", "pairs", "word_stats", "ngrams"] if cache_type == "all" else [cache_type]
     
-    results = {}
-    start_time = time.time()
+    jobs = []
+    for kind in kinds:
+        job = JOB_RUNNER.submit(kind, job_params(kind, data))
+        print(f"🧵 مهمة جديدة {job.id}: {kind} {job.params}")
+        jobs.append(job.to_dict())
     
-    try:
-        if cache_type in ["all", "similarity"]:
-            print("\n📊 بناء Similarity Cache...")
-            results['similarity_cache'] = build_similarity_cache(db, min_similarity)
-        
-        if cache_type in ["all", "word_stats"]:
-            print("\n📊 بناء Word Stats Cache...")
-            results['word_stats_cache'] = build_word_statistics_cache(db)
-        
-        elapsed = time.time() - start_time
-        
-        return {
-            "success": True,
-            "message": f"تم بناء {cache_type} cache بنجاح",
-            "min_similarity_used": min_similarity,
-            "time_taken": f"{elapsed/60:.1f} دقيقة",
-            "results": {
-                "similarity_cache_size": len(results.get('similarity_cache', {})),
-                "word_stats_cache_size": len(results.get('word_stats_cache', {}))
-            },
-            "note": "استخدم GET /all-similarities?use_cache=true للاستفادة من السرعة"
-        }
+    return {
+        "message": f"تمت إضافة بناء {cache_type} cache إلى طابور المهام ({len(jobs)} مهمة)",
+        "min_similarity_used": min_similarity,
+        "jobs": jobs,
+        "note": "تابع التقدّم عبر GET /admin/build-cache/status أو GET /admin/jobs/{id}"
+    }
     
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        
-        print(f"\n❌ خطأ في بناء الـ cache:")
-        print(error_details)
-        
-        return {
-            "success": False,
-            "message": f"حدث خطأ: {str(e)}",
-            "error_details": error_details
-        }
+def similarity_build_status() -> dict:
+    """حالة آخر مهمة similarity من JOB_RUNNER ({'state': 'idle'} إن لم توجد)"""
+    job = next((job for job in JOB_RUNNER.list() if job.kind == "similarity"), None)
+    if job is None:
+        return {'state': 'idle'}
+    progress = job.progress or {}
+    status = job.to_dict()
+    return {
+        'job_id': job.id,
+        'state': job.state,
+        **job.params,
+        'total_verses': progress.get('total'),
+        'completed_verses': progress.get('total') if job.state == 'done' else progress.get('completed'),
+        'resumed_verses': progress.get('resumed_verses'),
+        'percent': status['percent'],
+        'started_at': job.started_at,
+        'elapsed_seconds': status['elapsed_seconds'],
+        'eta_seconds': status['eta_seconds'],
+        'pairs_found': progress.get('pairs_found'),
+        'pairs_per_second': status['pairs_per_second'],
+        'error': job.error
+    }
+
+@app.get("/admin/build-cache/status")
+def admin_build_cache_status(db: Session = Depends(get_db)):
+    """
+    📡 حالة بناء Similarity Cache
     
+    - build: آخر مهمة similarity (POST /admin/jobs) من آخر حدث تقدّم وصل من عمليتها
+      (التقدّم، الزمن المنقضي، ETA) - البناء يجري في عملية منفصلة فلا حالة له في عملية الخادم
+    - checkpoint: نقطة الاستئناف على القرص (عدد الآيات المكتملة، أول آية متبقية، التوافق)
+    """
+    generation = current_generation()
+    return {
+        "build": similarity_build_status(),
+        "checkpoint": checkpoint_status(get_corpus(db)),
+        "similarity_cache_size": len(generation.similarity_cache),
+        "similarity_pairs": generation.similarity_pairs.meta if generation.similarity_pairs is not None else None,
+        "cache_generation": generation.to_dict(),
+        "jobs": [job.to_dict() for job in JOB_RUNNER.list() if not job.finished]
+    }
+
+@app.post("/admin/jobs", status_code=202)
+def admin_submit_job(data: dict):
+    """
+    🧵 إضافة مهمة بناء في الخلفية (تُرجع فوراً - البناء في عملية منفصلة)
+    
+    Body:
+    - kind: similarity | pairs | fts | word_stats | ngrams
+    - similarity: min_similarity, method, check_recall, workers, resume, top_k
+    - pairs: pair_floor
+    
+    تابع التقدّم عبر GET /admin/jobs/{id} وألغِ عبر DELETE /admin/jobs/{id}
+    """
+    kind = str(data.get("kind", ""))
+    try:
+        params = job_params(kind, data)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    job = JOB_RUNNER.submit(kind, params)
+    print(f"🧵 مهمة جديدة {job.id}: {kind} {params}")
+    return job.to_dict()
+
+@app.get("/admin/jobs")
+def admin_list_jobs():
+    """📋 المهام الجارية والمنتظرة والمنتهية مؤخراً (الأحدث أولاً)"""
+    return {"jobs": [job.to_dict() for job in JOB_RUNNER.list()]}
+
+@app.get("/admin/jobs/{job_id}")
+def admin_get_job(job_id: str = Path(..., description="معرّف المهمة")):
+    """
+    📡 حالة مهمة: state، percent، eta_seconds، pairs_per_second وآخر حدث تقدّم (progress)
+    """
+    job = JOB_RUNNER.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="المهمة غير موجودة")
+    return job.to_dict()
+
+@app.delete("/admin/jobs/{job_id}")
+def admin_cancel_job(job_id: str = Path(..., description="معرّف المهمة")):
+    """⛔ إلغاء مهمة (المنتظرة تُحذف من الطابور، والجارية تُنهى عمليتها)"""
+    job = JOB_RUNNER.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="المهمة غير موجودة")
+    return job.to_dict()
+
 @app.get("/performance/stats")
-def get_performance_statistics():
+def get_performance_statistics(db: Session = Depends(get_db)):
     """
     📊 إحصائيات أداء النظام
+    
+    artifacts: صلاحية كل ملف مشتق (manifest مقابل المدوّنة والتطبيع الحاليين) ومهمة إعادة بنائه
     """
+    generation = current_generation()
+    artifacts = inspect_artifacts(db, get_corpus(db), QURAN_BUNDLE)
     return {
         "database_size": "6,236 verses",
         "faiss_ready": FAISS_INDEX is not None,
         "faiss_index_size": os.path.getsize("quran_faiss_index.bin") / 1024 / 1024 if os.path.exists("quran_faiss_index.bin") else 0,
-        "fts_available": FTS_AVAILABLE,
-        "similarity_cache_size": len(SIMILARITY_CACHE) if SIMILARITY_CACHE else 0,
-        "word_stats_cache_size": len(WORD_STATS_CACHE) if WORD_STATS_CACHE else 0,
+        "fts_available": generation.fts_available,
+        "similarity_cache_size": len(generation.similarity_cache),
+        "word_stats_cache_size": len(generation.word_stats),
+        "cache_generation": generation.to_dict(),
+        "artifacts": {name: {key: value for key, value in status.items() if key != 'manifest'}
+                      for name, status in artifacts.items()},
+        "bundle": {"path": QURAN_BUNDLE.path, "built_at": QURAN_BUNDLE.manifest.get('built_at'),
+                   "params": QURAN_BUNDLE.manifest.get('params')} if QURAN_BUNDLE is not None else None,
         "expert_mode_questions": MUTASHABIHAT_BANK['total_questions'] if MUTASHABIHAT_BANK else 0,
         "optimizations_enabled": [
             "FTS5 Live Search (5-20ms)",
             "Similarity Cache (10-50ms)", 
             "Word Statistics Cache (1-5ms)",
             "AutoComplete Suggestions",
+            "Phrase AutoComplete (n-grams)",
             "LRU Cache (1000 entries)",
             "🚀 Fast All Similarities (1-10s)"  # ✅ إضافة التحسين الجديد
         ]
@@ -1499,6 +1978,8 @@ def get_performance_statistics():
 def get_word_statistics(
     word: str = Query(..., min_length=1, description="الكلمة أو العبارة للبحث"),
     limit: int = Query(100, gt=0, le=1000, description="عدد النتائج"),
+    mode: str = Query("word", regex="^(word|prefix|substring)$",
+                      description="word: كلمات كاملة، prefix: الأخيرة بادئة، substring: نص جزئي (السلوك القديم)"),
     db: Session = Depends(get_db)
 ):
     """
@@ -1510,6 +1991,10 @@ def get_word_statistics(
     - التوزيع حسب السور
     - التوزيع حسب الأجزاء
     - أمثلة من الآيات
+    
+    ✅ من الفهرس المقلوب الموضعي (phrase_index) بدل المرور على كل الآيات:
+    mode=word يعدّ الكلمات الكاملة فقط ("رب" لا تطابق "الربا" ولا "قرب")
+    ✅ الكلمة الواحدة في mode=word من word stats مباشرة (التوزيعات محسوبة مسبقاً)
     """
     start_time = time.time()
     
@@ -1519,51 +2004,53 @@ def get_word_statistics(
         if len(word_clean) < 2:
             raise HTTPException(status_code=400, detail="الكلمة قصيرة جداً")
         
-        all_verses = db.query(Verse).all()
-        
-        matches = []
-        surah_counts = {}
-        juz_counts = {}
-        total_count = 0
+        corpus = get_corpus(db)
+        word_stats = current_generation().word_stats
+        index = word_stats.find(word_clean) if mode == "word" and word_stats else None
         
-        for verse in all_verses:
-            verse_clean = clean_text(verse.text)
-            count = verse_clean.count(word_clean)
-            
-            if count > 0:
-                matches.append({
-                    'verse': verse.to_dict(),
-                    'count': count
-                })
-                
-                total_count += count
-                
-                # إحصائيات حسب السورة
-                surah_key = f"{verse.surah_name} ({verse.surah})"
-                surah_counts[surah_key] = surah_counts.get(surah_key, 0) + count
-                
-                # إحصائيات حسب الجزء
-                if verse.juz:
-                    juz_key = f"الجزء {verse.juz}"
-                    juz_counts[juz_key] = juz_counts.get(juz_key, 0) + count
+        if index is not None:
+            method = "word_stats"
+            verses, counts = word_stats.occurrences(index)
+            surahs, surah_totals = word_stats.by_surah(index)
+            juzs, juz_totals = word_stats.by_juz(index)
+        else:
+            method = "phrase_index"
+            verses, counts = get_phrase_index(corpus).occurrences(corpus, word_clean, mode)
+            surahs, surah_totals = distribution(corpus.surahs[verses], counts)
+            juzs, juz_totals = distribution(corpus.juzs[verses], counts)
+        
+        # التوزيع حسب السورة والجزء (بالترتيب الطبيعي ثم حسب التكرار)
+        surah_order = np.argsort(-surah_totals, kind='stable')
+        juz_order = np.argsort(-juz_totals, kind='stable')
+        surah_counts_sorted = {
+            f"{corpus.surah_names[surah]} ({surah})": total
+            for surah, total in zip(surahs[surah_order].tolist(), surah_totals[surah_order].tolist())
+        }
+        juz_counts_sorted = {
+            f"الجزء {juz}": total
+            for juz, total in zip(juzs[juz_order].tolist(), juz_totals[juz_order].tolist())
+        }
         
         # ترتيب حسب التكرار
-        matches.sort(key=lambda x: x['count'], reverse=True)
-        
-        # ترتيب الإحصائيات
-        surah_counts_sorted = dict(sorted(surah_counts.items(), key=lambda x: x[1], reverse=True))
-        juz_counts_sorted = dict(sorted(juz_counts.items(), key=lambda x: x[1], reverse=True))
+        order = np.argsort(-counts, kind='stable')
+        matches = [
+            {'verse': corpus.records[verse].to_dict(), 'count': int(count)}
+            for verse, count in zip(verses[order[:limit]].tolist(), counts[order[:limit]].tolist())
+        ]
         
         elapsed = time.time() - start_time
         
         return {
             'word': word,
             'word_normalized': word_clean,
-            'total_count': total_count,
-            'verses_count': len(matches),
+            'mode': mode,
+            'method': method,
+            'total_count': int(counts.sum()),
+            'verses_count': len(verses),
             'by_surah': surah_counts_sorted,
             'by_juz': juz_counts_sorted,
-            'matches': matches[:limit],
+            'verse_ids': corpus.ids[verses].tolist(),
+            'matches': matches,
             'search_time': f"{elapsed:.3f}s"
         }
         
@@ -1632,15 +2119,17 @@ def search_verses(
 
         # البحث الدلالي
         candidate_verse_ids = semantic_search(q, limit=100)
-        candidate_verses = db.query(Verse).filter(Verse.id.in_(candidate_verse_ids)).all() if candidate_verse_ids else []
+        corpus = get_corpus(db)
+        candidate_verses = [v for v in (corpus.get(vid) for vid in candidate_verse_ids) if v is not None]
         
         # التصفية باستخدام التشابه اللفظي
         query_clean = clean_text(q)
+        query_clean_twice = clean_text(query_clean)  # calculate_similarity كانت تُطبّع المدخلات مرة ثانية
+        query_tokens = corpus.encode(query_clean_twice)
         final_results = []
         
         for verse in candidate_verses:
-            verse_clean = clean_text(verse.text)
-            similarity = calculate_similarity(query_clean, verse_clean)
+            similarity = corpus.query_similarity(query_tokens, verse, threshold)
             
             if similarity >= threshold:  # ✅ threshold الجديد
                 verse_dict = verse.to_dict()
@@ -1650,13 +2139,11 @@ def search_verses(
                 
         # إذا لم توجد نتائج دلالية كافية، نستخدم البحث اللفظي الكامل
         if len(final_results) < limit:
-            all_verses = db.query(Verse).all()
-            for verse in all_verses:
+            for verse in corpus.records:
                 if verse.id in candidate_verse_ids:  # تجنب التكرار
                     continue
                     
-                verse_clean = clean_text(verse.text)
-                similarity = calculate_similarity(query_clean, verse_clean)
+                similarity = corpus.query_similarity(query_tokens, verse, threshold)
                 
                 if similarity >= threshold:  # ✅ threshold الجديد
                     verse_dict = verse.to_dict()
@@ -1722,12 +2209,14 @@ def get_similar_verses(
     """
     global FAISS_INDEX, EMBEDDING_MODEL, QURAN_IDS, QURAN_EMBEDDINGS
     
-    verse = db.query(Verse).filter(Verse.id == verse_id).first()
+    corpus = get_corpus(db)
+    verse = corpus.get(verse_id)
     if not verse:
         raise HTTPException(status_code=404, detail="الآية غير موجودة")
 
     start_time = time.time()
     similarities = []
+    prefilter_stats = PrefilterStats()
 
     # البحث الهجين الذكي
     if method == "smart" and FAISS_INDEX is not None and QURAN_EMBEDDINGS is not None:
@@ -1745,11 +2234,11 @@ def get_similar_verses(
                     if compare_id == verse_id:
                         continue
                     
-                    compare_verse = db.query(Verse).filter(Verse.id == compare_id).first()
+                    compare_verse = corpus.get(compare_id)
                     if not compare_verse or (exclude_basmala and is_basmala_verse(compare_verse)):
                         continue
                     
-                    lexical_sim = calculate_word_similarity(verse.text, compare_verse.text)
+                    lexical_sim = corpus.similarity(verse, compare_verse, threshold, prefilter_stats)
                     
                     # ✅ استبعاد 100% تشابه
                     if lexical_sim >= threshold and lexical_sim < 0.99:
@@ -1773,7 +2262,8 @@ def get_similar_verses(
 
     # البحث اللفظي (fallback)
     if method == "lexical" or (method == "smart" and not similarities):
-        all_verses = db.query(Verse).all()
+        # ⚡ الفهرس المقلوب: فقط الآيات التي يمكن أن تبلغ العتبة
+        all_verses = corpus.similar_candidates(verse, threshold, prefilter_stats)
         if exclude_basmala:
             all_verses = [v for v in all_verses if not is_basmala_verse(v)]
         
@@ -1781,7 +2271,7 @@ def get_similar_verses(
             if other_verse.id == verse_id:
                 continue
             
-            similarity = calculate_word_similarity(verse.text, other_verse.text)
+            similarity = corpus.similarity(verse, other_verse, threshold, prefilter_stats)
             
             # ✅ استبعاد 100% تشابه
             if similarity >= threshold and similarity < 0.99:
@@ -1806,6 +2296,7 @@ def get_similar_verses(
         'similar_verses': similarities[:limit],
         'search_time': f"{elapsed:.2f}s",
         'method_used': method,
+        'prefilter': prefilter_stats.to_dict(),
         'total_found': len(similarities)
     }
 
@@ -1816,7 +2307,7 @@ def get_specific_verse(
     db: Session = Depends(get_db)
 ):
     """جلب آية محددة"""
-    verse = db.query(Verse).filter(Verse.surah == surah, Verse.ayah == ayah).first()
+    verse = get_corpus(db).get_by_ref(surah, ayah)
     if not verse:
         raise HTTPException(status_code=404, detail=f"لم يتم العثور على الآية {surah}:{ayah}")
     return verse.to_dict()
@@ -1838,8 +2329,9 @@ def compare_verses(
     db: Session = Depends(get_db)
 ):
     """مقارنة آيتين"""
-    verse1 = db.query(Verse).filter(Verse.id == id1).first()
-    verse2 = db.query(Verse).filter(Verse.id == id2).first()
+    corpus = get_corpus(db)
+    verse1 = corpus.get(id1)
+    verse2 = corpus.get(id2)
     
     if not verse1 or not verse2:
         raise HTTPException(status_code=404, detail="آية واحدة أو كلاهما غير موجودة")
@@ -1858,15 +2350,17 @@ def get_statistics(db: Session = Depends(get_db)):
     """إحصائيات قاعدة البيانات"""
     total_verses = db.query(Verse).count()
     surahs = db.query(Verse.surah).distinct().count()
+    generation = current_generation()
     
     return {
         "total_verses": total_verses,
         "total_surahs": surahs,
         "faiss_ready": FAISS_INDEX is not None,
         "smart_hybrid_available": FAISS_INDEX is not None,
-        "fts_available": FTS_AVAILABLE,
-        "similarity_cache_size": len(SIMILARITY_CACHE) if SIMILARITY_CACHE else 0,
-        "word_stats_cache_size": len(WORD_STATS_CACHE) if WORD_STATS_CACHE else 0
+        "fts_available": generation.fts_available,
+        "similarity_cache_size": len(generation.similarity_cache),
+        "word_stats_cache_size": len(generation.word_stats),
+        "cache_generation": generation.number
     }
 
 # ============================================
@@ -1886,10 +2380,16 @@ def get_all_similarities(
     compare_surah: Optional[int] = Query(None, ge=1, le=114),
     compare_juz: Optional[int] = Query(None, ge=1, le=30),
     use_cache: bool = Query(True),  # ✅ إزالة use_faiss (غير مستخدم)
+    method: str = Query("auto", regex="^(auto|lsh)$"),
+    check_recall: bool = Query(False, description="مع lsh: قياس الاسترجاع مقابل النتيجة الدقيقة"),
     db: Session = Depends(get_db)
 ):
     """
     🔥 البحث الشامل المحسّن - سريع بنسبة 100x
+    
+    method:
+    - auto: مصفوفة الأزواج (العتبة >= حدها الأدنى)، ثم Cache إذا كان متاحاً، وإلا البحث المحسّن المحدود
+    - lsh: أزواج MinHash/LSH التقريبية + تحقق دقيق (للقرآن كاملاً) - الأزواج الدقيقة تحت 0.3
     """
     
     # التحقق من صحة المعاملات
@@ -1911,10 +2411,10 @@ def get_all_similarities(
     # ============================================
     # 1. تحديد نطاق البحث (الآيات المستهدفة)
     # ============================================
-    target_query = db.query(Verse)
+    corpus = get_corpus(db)
     
     if full_quran:
-        target_verses = target_query.order_by(Verse.id).all()
+        target_verses = corpus.all()
         search_scope = "القرآن كاملاً"
     elif third:
         if third == 1:
@@ -1927,16 +2427,16 @@ def get_all_similarities(
             juz_range = (21, 30)
             third_name = "الثلث الثالث"
         
-        target_verses = target_query.filter(Verse.juz.between(*juz_range)).all()
+        target_verses = corpus.select(juz_range=juz_range)
         search_scope = f"{third_name} (أجزاء {juz_range[0]}-{juz_range[1]})"
     elif surah:
-        target_verses = target_query.filter(Verse.surah == surah).all()
+        target_verses = corpus.select(surah=surah)
         search_scope = f"سورة {surah}"
     elif juz:
-        target_verses = target_query.filter(Verse.juz == juz).all()
+        target_verses = corpus.select(juz=juz)
         search_scope = f"الجزء {juz}"
     else:
-        target_verses = target_query.order_by(Verse.id).all()
+        target_verses = corpus.all()
         search_scope = "القرآن كاملاً"
 
     if exclude_basmala:
@@ -1947,16 +2447,14 @@ def get_all_similarities(
     # ============================================
     # 2. تحديد نطاق المقارنة (الآيات المقارنة)
     # ============================================
-    compare_query = db.query(Verse)
-    
     if compare_surah:
-        compare_verses = compare_query.filter(Verse.surah == compare_surah).all()
+        compare_verses = corpus.select(surah=compare_surah)
         compare_scope = f"سورة {compare_surah}"
     elif compare_juz:
-        compare_verses = compare_query.filter(Verse.juz == compare_juz).all()
+        compare_verses = corpus.select(juz=compare_juz)
         compare_scope = f"الجزء {compare_juz}"
     else:
-        compare_verses = compare_query.order_by(Verse.id).all()
+        compare_verses = corpus.all()
         compare_scope = "القرآن كاملاً"
     
     if exclude_basmala:
@@ -1975,13 +2473,35 @@ def get_all_similarities(
             "method": "cache"
         }
 
+    lsh_info = None
+    generation = current_generation()  # 🧬 جيل واحد للطلب كله
+    
+    # ============================================
+    # 🧩 3. MinHash/LSH (تقريبي - عند الطلب)
+    # ============================================
+    if method == "lsh":
+        similarities, lsh_info = lsh_all_similarities(
+            db, target_verses, compare_verses, min_similarity, limit, check_recall
+        )
+        method_used = "lsh"
+    
+    # ============================================
+    # 🧮 3. مصفوفة الأزواج (كل الأزواج >= حدها الأدنى - أي عتبة أعلى)
+    # ============================================
+    elif use_cache and generation.pairs_cover(min_similarity):
+        print("🧮 استخدام مصفوفة الأزواج...")
+        similarities = pair_matrix_all_similarities(
+            db, target_verses, compare_verses, min_similarity, limit, generation.similarity_pairs
+        )
+        method_used = "pair_matrix"
+    
     # ============================================
     # 🚀 3. استخدام Similarity Cache (الطريقة السريعة)
     # ============================================
-    if use_cache and SIMILARITY_CACHE and len(SIMILARITY_CACHE) > 0:
+    elif use_cache and len(generation.similarity_cache) > 0:
         print("🚀 استخدام Similarity Cache للبحث المسرّع...")
         similarities = fast_all_similarities_from_cache(
-            db, target_verses, compare_verses, min_similarity, limit, exclude_basmala
+            db, target_verses, compare_verses, min_similarity, limit, exclude_basmala, generation.similarity_cache
         )
         method_used = "cache_accelerated"
     
@@ -2002,6 +2522,7 @@ def get_all_similarities(
         # بدلاً من مقارنة كل شيء
         max_comparisons = limit * 10  # ✅ حد أقصى للمقارنات
         comparisons_done = 0
+        prefilter_stats = PrefilterStats()
         
         for target_verse in target_verses:
             processed += 1
@@ -2038,7 +2559,7 @@ def get_all_similarities(
                 if pair in seen_pairs:
                     continue
                 
-                similarity = calculate_word_similarity(target_verse.text, compare_verse.text)
+                similarity = corpus.similarity(target_verse, compare_verse, min_similarity, prefilter_stats)
                 
                 # الإصلاح: السماح بـ 100% مع استثناءات ذكية  
                 if similarity >= min_similarity and not is_excluded_100_percent_match(target_verse.text, compare_verse.text):
@@ -2063,6 +2584,7 @@ def get_all_similarities(
         
         print(f"📊 إحصائيات البحث المحسّن:")
         print(f"   🔍 إجمالي المقارنات: {comparisons_done:,}")
+        print(f"   🚧 المرشّحات: {prefilter_stats}")
         print(f"   📋 النتائج النهائية: {len(similarities)}")
         
         method_used = "optimized_limited"
@@ -2083,31 +2605,33 @@ def get_all_similarities(
         "search_scope": search_scope,
         "compare_scope": compare_scope,
         "method": method_used,
-        "cache_used": use_cache and SIMILARITY_CACHE and len(SIMILARITY_CACHE) > 0,
-        "note": "استخدم /admin/build-cache لتسريع البحث مستقبلاً" if method_used != "cache_accelerated" else None
+        "cache_used": method_used in ("pair_matrix", "cache_accelerated"),
+        "cache_generation": generation.number,
+        "lsh": lsh_info,
+        "note": "استخدم /admin/build-cache لتسريع البحث مستقبلاً" if method_used == "optimized_limited" else None
     }
 
 # ============================================
 # 🎮 Quiz Endpoints - FIXED COMPLETELY + وضع الخبير 🏆
 # ============================================
 
-def get_quiz_scope_filter(scope_type: str, scope_value: str):
-    """تنشئ شرط الفلترة لجلب آيات الاختبار"""
+def get_quiz_scope_filter(scope_type: str, scope_value: str) -> dict:
+    """تنشئ نطاق آيات الاختبار (معاملات corpus.select / random_verse / in_scope)"""
     if scope_type == 'all':
-        return True
+        return {}
     elif scope_type == 'juz' and scope_value.isdigit():
-        return Verse.juz == int(scope_value)
+        return {'juz': int(scope_value)}
     elif scope_type == 'surah' and scope_value.isdigit():
-        return Verse.surah == int(scope_value)
+        return {'surah': int(scope_value)}
     elif scope_type == 'thulth' and scope_value.isdigit():
         thulth = int(scope_value)
         if thulth == 1:
-            return Verse.juz.between(1, 10)
+            return {'juz_range': (1, 10)}
         elif thulth == 2:
-            return Verse.juz.between(11, 20)
+            return {'juz_range': (11, 20)}
         elif thulth == 3:
-            return Verse.juz.between(21, 30)
-    return True
+            return {'juz_range': (21, 30)}
+    return {}
 
 # ============================================
 # 🏆 دوال جديدة لوضع الخبير لجميع أنواع Quiz
@@ -2120,6 +2644,7 @@ def get_expert_surah_name_question(db: Session, scope_filter):
         return get_quiz_question({"question_type": "surah_name", "expert_mode": False}, db)
     
     questions = MUTASHABIHAT_BANK['questions']
+    corpus = get_corpus(db)
     
     for attempt in range(10):
         question_data = random.choice(questions)
@@ -2129,12 +2654,9 @@ def get_expert_surah_name_question(db: Session, scope_filter):
         
         valid_verses = []
         for verse_info in question_data['verses']:
-            verse = db.query(Verse).filter(
-                Verse.surah == verse_info['surah'],
-                Verse.ayah == verse_info['ayah']
-            ).first()
+            verse = corpus.get_by_ref(verse_info['surah'], verse_info['ayah'])
             
-            if verse and (scope_filter == True or db.query(Verse).filter(Verse.id == verse.id, scope_filter).first()):
+            if verse and corpus.in_scope(verse, **scope_filter):
                 valid_verses.append(verse)
         
         if len(valid_verses) >= 2:
@@ -2144,13 +2666,11 @@ def get_expert_surah_name_question(db: Session, scope_filter):
             other_surahs = list(set([v.surah for v in valid_verses if v.surah != correct_verse.surah]))
             if len(other_surahs) < 3:
                 # إذا لم يكن هناك سور كافية، نستخدم سور عشوائية
-                other_surahs = db.query(Verse.surah).filter(Verse.surah != correct_verse.surah).distinct().limit(3).all()
-                other_surahs = [s[0] for s in other_surahs]
+                other_surahs = [s for s in sorted(corpus.surah_names) if s != correct_verse.surah][:3]
             
             wrong_choices = []
             for surah_id in other_surahs[:3]:
-                surah_name = db.query(Verse.surah_name).filter(Verse.surah == surah_id).first()[0]
-                wrong_choices.append(surah_name)
+                wrong_choices.append(corpus.surah_names[surah_id])
             
             choices = [correct_verse.surah_name] + wrong_choices
             random.shuffle(choices)
@@ -2181,6 +2701,7 @@ def get_expert_word_choice_question(db: Session, scope_filter, threshold: float)
         return get_word_choice_question(db, scope_filter, threshold)
     
     questions = MUTASHABIHAT_BANK['questions']
+    corpus = get_corpus(db)
     
     for attempt in range(10):
         question_data = random.choice(questions)
@@ -2190,12 +2711,9 @@ def get_expert_word_choice_question(db: Session, scope_filter, threshold: float)
         
         valid_verses = []
         for verse_info in question_data['verses']:
-            verse = db.query(Verse).filter(
-                Verse.surah == verse_info['surah'],
-                Verse.ayah == verse_info['ayah']
-            ).first()
+            verse = corpus.get_by_ref(verse_info['surah'], verse_info['ayah'])
             
-            if verse and (scope_filter == True or db.query(Verse).filter(Verse.id == verse.id, scope_filter).first()):
+            if verse and corpus.in_scope(verse, **scope_filter):
                 valid_verses.append(verse)
         
         if len(valid_verses) >= 1:
@@ -2256,6 +2774,7 @@ def get_expert_continue_question(db: Session, scope_filter):
         return get_quiz_question({"question_type": "continue", "expert_mode": False}, db)
     
     questions = MUTASHABIHAT_BANK['questions']
+    corpus = get_corpus(db)
     
     for attempt in range(10):
         question_data = random.choice(questions)
@@ -2265,12 +2784,9 @@ def get_expert_continue_question(db: Session, scope_filter):
         
         valid_verses = []
         for verse_info in question_data['verses']:
-            verse = db.query(Verse).filter(
-                Verse.surah == verse_info['surah'],
-                Verse.ayah == verse_info['ayah']
-            ).first()
+            verse = corpus.get_by_ref(verse_info['surah'], verse_info['ayah'])
             
-            if verse and (scope_filter == True or db.query(Verse).filter(Verse.id == verse.id, scope_filter).first()):
+            if verse and corpus.in_scope(verse, **scope_filter):
                 valid_verses.append(verse)
         
         if len(valid_verses) >= 1:
@@ -2373,19 +2889,17 @@ def get_quiz_question(data: dict, db: Session = Depends(get_db)):
         # ============================================
         
         # 1. اختبار: ما اسم السورة؟
+        corpus = get_corpus(db)
+        
         if question_type == 'surah_name':
-            random_verse = db.query(Verse).filter(scope_filter).order_by(func.random()).first()
+            random_verse = corpus.random_verse(**scope_filter)
     
             if not random_verse:
                 raise HTTPException(status_code=404, detail="No verses found")
     
-            wrong_surahs = db.query(Verse.surah_name).\
-                filter(Verse.surah != random_verse.surah).\
-                distinct().\
-                order_by(func.random()).\
-                limit(3).all()
+            wrong_surahs = [name for surah_id, name in corpus.surah_names.items() if surah_id != random_verse.surah and name]
     
-            wrong_choices = [s[0] for s in wrong_surahs if s[0]][:3]
+            wrong_choices = random.sample(wrong_surahs, min(3, len(wrong_surahs)))
             choices = [random_verse.surah_name] + wrong_choices
             random.shuffle(choices)
     
@@ -2413,7 +2927,7 @@ def get_quiz_question(data: dict, db: Session = Depends(get_db)):
             return get_word_choice_question(db, scope_filter, threshold)
         
         # 4. اختبار: إكمال الآية
-        random_verse = db.query(Verse).filter(scope_filter).order_by(func.random()).first()
+        random_verse = corpus.random_verse(**scope_filter)
         
         if not random_verse:
             raise HTTPException(status_code=404, detail="No verses found")
@@ -2496,8 +3010,9 @@ def get_random_verses_with_similarities(
     print(f"{'='*60}\n")
     
     try:
-        # جلب جميع الآيات
-        all_verses = db.query(Verse).all()
+        # جلب جميع الآيات (نسخة من المدوّنة - سيتم خلطها)
+        corpus = get_corpus(db)
+        all_verses = corpus.all()
         
         # استبعاد البسملات
         all_verses = [v for v in all_verses if not is_basmala_verse(v)]
@@ -2518,8 +3033,15 @@ def get_random_verses_with_similarities(
         attempts = 0
         max_total_attempts = len(all_verses)
         
+        # ✅ مصفوفة الأزواج: عدد المتشابهات لكل آية دفعة واحدة (قناع العتبة بدون البسملات)
+        generation = current_generation()
+        similarity_cache = generation.similarity_cache
+        neighbor_counts = None
+        if generation.pairs_cover(min_similarity):
+            neighbor_counts = generation.similarity_pairs.neighbor_counts(min_similarity, 0.99, ~corpus.basmala_mask)
+        
         # ✅ استخدام Cache إذا كان متاحاً
-        use_cache = SIMILARITY_CACHE and len(SIMILARITY_CACHE) > 0
+        use_cache = neighbor_counts is not None or len(similarity_cache) > 0
         
         # البحث عن آيات مناسبة
         for verse in all_verses:
@@ -2536,11 +3058,14 @@ def get_random_verses_with_similarities(
             # البحث عن متشابهات لهذه الآية
             has_similarities = False
             
+            # ✅ الطريقة 0: مصفوفة الأزواج (O(1) لكل آية)
+            if neighbor_counts is not None:
+                has_similarities = neighbor_counts[verse.index] > 0
+            
             # ✅ الطريقة 1: استخدام Cache (سريع جداً!)
-            if use_cache and verse.id in SIMILARITY_CACHE:
-                cached_sims = SIMILARITY_CACHE[verse.id]
+            elif use_cache and verse.id in similarity_cache:
                 # تحقق من وجود متشابهات ضمن العتبة
-                matching_sims = [s for s in cached_sims if s['similarity'] >= min_similarity]
+                matching_sims = similarity_cache.similarities(verse.id, min_similarity)
                 if len(matching_sims) > 0:
                     has_similarities = True
                     print(f"   ✅ Cache: وجدت {len(matching_sims)} متشابهة للآية {verse.surah}:{verse.ayah}")
@@ -2554,7 +3079,7 @@ def get_random_verses_with_similarities(
                     if other_verse.id == verse.id:
                         continue
                     
-                    similarity = calculate_word_similarity(verse.text, other_verse.text)
+                    similarity = corpus.similarity(verse, other_verse, min_similarity)
                     
                     if min_similarity <= similarity < 0.99:
                         has_similarities = True
@@ -2606,7 +3131,7 @@ def get_random_verses_with_similarities(
         
         print(f"\n{'='*60}")
         print(f"✅ تم جلب {len(selected_verses)} آيات في {elapsed:.2f}ث")
-        print(f"   Method: {'Cache' if use_cache else 'Sample Search'}")
+        print(f"   Method: {'Pair Matrix' if neighbor_counts is not None else 'Cache' if use_cache else 'Sample Search'}")
         print(f"{'='*60}\n")
         
         return {
@@ -2614,8 +3139,9 @@ def get_random_verses_with_similarities(
             "search_time": f"{elapsed:.2f}s",
             "total_found": len(selected_verses),
             "min_similarity": min_similarity,
-            "method": "cache" if use_cache else "sample",
-            "attempts": attempts
+            "method": "pair_matrix" if neighbor_counts is not None else "cache" if use_cache else "sample",
+            "attempts": attempts,
+            "cache_generation": generation.number
         }
         
     except Exception as e:
@@ -2625,7 +3151,7 @@ def get_random_verses_with_similarities(
         
         # Fallback نهائي: آيات عشوائية بسيطة
         try:
-            random_verses = db.query(Verse).order_by(func.random()).limit(limit).all()
+            random_verses = random.sample(get_corpus(db).records, limit)
             return {
                 "verses": [v.to_dict() for v in random_verses],
                 "search_time": "0.00s",
@@ -2649,14 +3175,16 @@ def debug_check_cache(
     db: Session = Depends(get_db)
 ):
     """فحص إذا كانت الآية موجودة في الكاش"""
-    verse = db.query(Verse).filter(Verse.surah == surah, Verse.ayah == ayah).first()
+    verse = get_corpus(db).get_by_ref(surah, ayah)
     
     if not verse:
         raise HTTPException(status_code=404, detail="الآية غير موجودة")
     
     cache_entries = []
-    if verse.id in SIMILARITY_CACHE:
-        for sim in SIMILARITY_CACHE[verse.id]:
+    generation = current_generation()
+    similarity_cache = generation.similarity_cache
+    if similarity_cache and verse.id in similarity_cache:
+        for sim in similarity_cache.similarities(verse.id):
             cache_entries.append({
                 "compare_verse": f"{sim['surah']}:{sim['ayah']}",
                 "similarity": sim['similarity'],
@@ -2665,9 +3193,10 @@ def debug_check_cache(
     
     return {
         "verse": f"{verse.surah}:{verse.ayah}",
-        "in_cache": verse.id in SIMILARITY_CACHE,
+        "in_cache": bool(similarity_cache) and verse.id in similarity_cache,
         "cache_entries_count": len(cache_entries),
-        "cache_entries": cache_entries[:10]  # أول 10 إدخالات فقط
+        "cache_entries": cache_entries[:10],  # أول 10 إدخالات فقط
+        "cache_generation": generation.number
     }
 
 # ============================================
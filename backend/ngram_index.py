@@ -0,0 +1,196 @@
+"""
+فهرس الـ n-grams (تكملة العبارة بالكلمة التالية)
+===========================================
+الاقتراحات التلقائية كانت تكمّل كلمة واحدة فقط، والمستخدم يكتب عبارات مثل "يا ايها الذين".
+هنا كل الثنائيات والثلاثيات المتجاورة داخل الآية (على كلمات المدوّنة المُطبَّعة) بعددها
+والآيات التي وردت فيها، في مجلد من مصفوفات مسطّحة (ngram_index/) لكل رتبة n:
+
+✅ contexts{n}.npy     (int64)  : السياق (أول n-1 كلمة) مُرمَّزاً برقم واحد - مرتب تصاعدياً
+✅ next_ids{n}.npy     (int32)  : الكلمة التالية (معرّف القاموس)
+✅ counts{n}.npy       (int32)  : عدد مرات ورود الـ n-gram
+✅ verse_indptr{n}.npy (int32)  : بداية ونهاية آيات كل n-gram
+✅ verse_ids{n}.npy    (int32)  : معرّفات الآيات (verse_id) تصاعدياً
+✅ meta.json                    : الـ manifest (بصمة المدوّنة + التطبيع) - artifacts
+
+داخل السياق الواحد الصفوف مرتبة تنازلياً حسب العدد → التكملات = نطاق متصل (بحث ثنائي)
+وأول k صف منه هي الأكثر تكراراً: O(log n + k) لكل حرف بدون أي مرور على المدوّنة.
+السياق بكلمتين بلا تكملة → الرجوع لآخر كلمة (backoff).
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from artifacts import build_manifest, save_artifact_dir, load_artifact_dir
+
+# ============================================
+# ⚙️ الإعدادات
+# ============================================
+NGRAM_INDEX_DIR = "ngram_index"
+NGRAM_ARTIFACT = "ngram_index"
+NGRAM_FORMAT = "ngram-v1"
+NGRAM_ORDERS = (3, 2)  # الأطول أولاً (backoff)
+NGRAM_PARAMS = {'orders': list(NGRAM_ORDERS)}  # تُحفظ في الـ manifest ويجب أن تتطابق
+TABLE_ARRAYS = ('contexts', 'next_ids', 'counts', 'verse_indptr', 'verse_ids')
+
+# ============================================
+# 🗂️ الفهرس
+# ============================================
+class NgramTable:
+    """n-grams رتبة واحدة: صف لكل n-gram مرتب بالسياق ثم تنازلياً بالعدد"""
+
+    __slots__ = ('order',) + TABLE_ARRAYS
+
+    def __init__(self, order: int, arrays: Dict[str, np.ndarray]):
+        self.order = order
+        for name in TABLE_ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def __len__(self) -> int:
+        return len(self.next_ids)
+
+    def continuation_range(self, context: int) -> Tuple[int, int]:
+        """[low, high) صفوف السياق (الأكثر تكراراً أولاً)"""
+        low = int(np.searchsorted(self.contexts, context, side='left'))
+        high = int(np.searchsorted(self.contexts, context, side='right'))
+        return low, high
+
+    def verses(self, row: int) -> np.ndarray:
+        return np.asarray(self.verse_ids[int(self.verse_indptr[row]):int(self.verse_indptr[row + 1])])
+
+class NgramIndex:
+    """
+    فهرس التكملات للقراءة فقط (memory-mapped)
+
+    words[word_id] → الكلمة (القاموس بترتيب المعرّف من المدوّنة)
+    sorted_words / sorted_ids → القاموس أبجدياً (الكلمة غير المكتملة = نطاق متصل بالبحث الثنائي)
+    """
+
+    __slots__ = ('tables', 'vocab_size', 'words', 'sorted_words', 'sorted_ids', 'meta', 'corpus')
+
+    def __init__(self, tables: Dict[int, NgramTable], meta: dict, corpus):
+        self.tables = tables
+        self.vocab_size = len(corpus.vocab)
+        self.words: List[str] = sorted(corpus.vocab, key=corpus.vocab.get)
+        self.sorted_words: List[str] = sorted(corpus.vocab)
+        self.sorted_ids = np.array([corpus.vocab[word] for word in self.sorted_words], dtype=np.int32)
+        self.meta = meta
+        self.corpus = corpus
+
+    def __len__(self) -> int:
+        return sum(len(table) for table in self.tables.values())
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(getattr(table, name).nbytes for table in self.tables.values() for name in TABLE_ARRAYS))
+
+    def prefix_ids(self, prefix: str) -> np.ndarray:
+        """معرّفات كلمات القاموس التي تبدأ بـ prefix - O(log V)"""
+        low = bisect_left(self.sorted_words, prefix)
+        high = bisect_right(self.sorted_words, prefix + '\U0010ffff', lo=low)
+        return self.sorted_ids[low:high]
+
+    def continuations(self, context_ids: Sequence[Optional[int]], limit: int = 10,
+                      allowed: Optional[np.ndarray] = None) -> Tuple[int, List[Tuple[NgramTable, int]]]:
+        """
+        أكثر التكملات تكراراً بعد context_ids (آخر كلمتين ثم آخر كلمة إن لم توجد تكملة)
+
+        allowed: معرّفات الكلمات المسموح بها (الكلمة الأخيرة غير المكتملة) أو None للكل
+
+        Returns:
+            (رتبة الـ n-gram المستخدمة أو 0، [(الجدول، رقم الصف)] تنازلياً حسب العدد)
+        """
+        for order in NGRAM_ORDERS:
+            context = list(context_ids[-(order - 1):])
+            if len(context) < order - 1 or None in context:
+                continue
+            table = self.tables[order]
+            low, high = table.continuation_range(encode_context(context, self.vocab_size))
+            rows = np.arange(low, high)
+            if allowed is not None:
+                rows = rows[np.isin(np.asarray(table.next_ids[low:high]), allowed)]
+            if len(rows):
+                return order, [(table, row) for row in rows[:limit].tolist()]
+        return 0, []
+
+def encode_context(word_ids: Sequence[int], vocab_size: int) -> int:
+    """السياق (n-1 كلمة) كرقم واحد: أرقام بالأساس vocab_size"""
+    key = 0
+    for word_id in word_ids:
+        key = key * vocab_size + int(word_id)
+    return key
+
+# ============================================
+# 🏗️ البناء
+# ============================================
+def build_ngram_table(corpus, order: int) -> NgramTable:
+    """كل n-grams الرتبة order داخل الآيات (لا تعبر حدود الآية) بعددها وآياتها"""
+    data = corpus.token_data.astype(np.int64)
+    offsets = corpus.token_offsets
+    vocab_size = len(corpus.vocab)
+    verse_of = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+
+    starts = np.arange(len(data), dtype=np.int64)
+    starts = starts[starts + order - 1 < offsets[1:][verse_of]]
+    contexts = np.zeros(len(starts), dtype=np.int64)
+    for step in range(order - 1):
+        contexts = contexts * vocab_size + data[starts + step]
+    next_ids = data[starts + order - 1]
+    verses = verse_of[starts]
+
+    # تجميع: n-gram واحد لكل (سياق، كلمة تالية) + آياته المختلفة
+    keys = contexts * vocab_size + next_ids
+    sort = np.lexsort((verses, keys))
+    keys, verses = keys[sort], verses[sort]
+    unique_keys, counts = np.unique(keys, return_counts=True)
+    new_pair = np.ones(len(keys), dtype=bool)
+    new_pair[1:] = (keys[1:] != keys[:-1]) | (verses[1:] != verses[:-1])
+    pair_keys, pair_verses = keys[new_pair], verses[new_pair]
+    verse_counts = np.bincount(np.searchsorted(unique_keys, pair_keys), minlength=len(unique_keys))
+    pair_indptr = np.concatenate(([0], np.cumsum(verse_counts)))
+
+    # الصفوف بالسياق ثم تنازلياً بالعدد (التعادل بمعرّف الكلمة) + نقل آيات كل صف معه
+    row_contexts, row_next = unique_keys // vocab_size, unique_keys % vocab_size
+    rows = np.lexsort((row_next, -counts, row_contexts))
+    lengths = verse_counts[rows]
+    verse_indptr = np.concatenate(([0], np.cumsum(lengths)))
+    gather = np.repeat(pair_indptr[rows] - verse_indptr[:-1], lengths) + np.arange(int(verse_indptr[-1]))
+
+    return NgramTable(order, {
+        'contexts': row_contexts[rows],
+        'next_ids': row_next[rows].astype(np.int32),
+        'counts': counts[rows].astype(np.int32),
+        'verse_indptr': verse_indptr.astype(np.int32),
+        'verse_ids': corpus.ids[pair_verses[gather]].astype(np.int32)
+    })
+
+def build_ngram_index(corpus) -> NgramIndex:
+    """الثنائيات والثلاثيات من كلمات المدوّنة المُطبَّعة (corpus.token_data)"""
+    tables = {order: build_ngram_table(corpus, order) for order in NGRAM_ORDERS}
+    meta = dict(build_manifest(NGRAM_ARTIFACT, NGRAM_FORMAT, corpus, NGRAM_PARAMS),
+                vocab_size=len(corpus.vocab), ngrams={str(order): len(table) for order, table in tables.items()})
+    return NgramIndex(tables, meta, corpus)
+
+# ============================================
+# 💾 الحفظ والتحميل
+# ============================================
+def save_ngram_index(index: NgramIndex, path: str = NGRAM_INDEX_DIR):
+    """مصفوفات كل رتبة ({name}{order}.npy) + meta.json بنسخة جديدة تُنشر ذرياً (artifacts.save_artifact_dir)"""
+    save_artifact_dir(path, {f"{name}{order}": getattr(table, name)
+                             for order, table in index.tables.items() for name in TABLE_ARRAYS}, index.meta)
+
+def load_ngram_index(corpus, path: str = NGRAM_INDEX_DIR) -> Optional[NgramIndex]:
+    """تحميل الفهرس بـ memory-map إذا كان مطابقاً للمدوّنة الحالية (وإلا None)"""
+    loaded = load_artifact_dir(path, [f"{name}{order}" for order in NGRAM_ORDERS for name in TABLE_ARRAYS],
+                               NGRAM_ARTIFACT, NGRAM_FORMAT, corpus, NGRAM_PARAMS)
+    if loaded is None:
+        return None
+    arrays, meta = loaded
+    if meta.get('vocab_size') != len(corpus.vocab):
+        print(f"🔄 فهرس الـ n-grams قديم (حجم القاموس تغيّر: {meta.get('vocab_size')} ≠ {len(corpus.vocab)}) - أعد بناءه")
+        return None
+
+    tables = {order: NgramTable(order, {name: arrays[f"{name}{order}"] for name in TABLE_ARRAYS})
+              for order in NGRAM_ORDERS}
+    return NgramIndex(tables, meta, corpus)
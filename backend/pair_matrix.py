@@ -0,0 +1,286 @@
+"""
+مصفوفة أزواج التشابه المتناثرة (scipy.sparse) - تخدم أي عتبة
+===========================================
+الـ similarity cache يُبنى عند عتبة واحدة وبأفضل K لكل آية، فالطلبات بعتبة أخرى
+تحصل على نتائج مبتورة أو ترجع للبحث المحدود بالعينات.
+
+هنا نحفظ كل زوج نسبته >= حد أدنى منخفض (PAIR_FLOOR = 0.3) مرة واحدة:
+
+✅ مصفوفة CSR مثلثية عليا (i < j بترتيب المدوّنة) - النسبة بالاتجاه (الأقدم → الأحدث)
+✅ القيمة المحفوظة عدد الكلمات المتطابقة M (uint8) والنسبة تُعاد 2.0 * M / (m + n) بالضبط
+✅ كل الأزواج بما فيها البسملات والتطابق 100% → الاستبعاد قناع عند الاستعلام
+✅ العتبة / النطاق / أفضل K = قناع وتقطيع على المصفوفات (بدون حلقات على الآيات)
+✅ محفوظة في similarity_pairs.npz مع manifest (بصمة المدوّنة والتطبيع - تُبنى من جديد إذا تغيّرا)
+
+أي عتبة >= PAIR_FLOOR تُجاب بالكامل؛ العتبات الأقل ترجع للمسار القديم.
+
+   python pair_matrix.py --floor 0.3
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from database import SessionLocal, init_db
+from corpus import load_corpus
+from artifacts import build_manifest, manifest_problem
+from jobs import progress_event, print_progress, ProgressCallback
+
+# ============================================
+# ⚙️ الإعدادات
+# ============================================
+PAIR_MATRIX_FILE = "similarity_pairs.npz"
+PAIR_FLOOR = 0.3
+PAIR_ARTIFACT = "similarity_pairs"
+PAIR_FORMAT = "pairs-v1"
+
+# ============================================
+# 🗂️ المصفوفة
+# ============================================
+class PairMatrix:
+    """
+    كل أزواج التشابه فوق الحد الأدنى (للقراءة فقط)
+
+    upper: المثلث العلوي (النسب float64) - لاستعلامات الأزواج
+    full:  upper + upper.T - صف كل آية كاملاً (متشابهاتها قبلها وبعدها)
+    """
+
+    __slots__ = ('matches', 'upper', 'full', 'upper_rows', 'full_rows', 'meta', 'corpus')
+
+    def __init__(self, matches: sparse.csr_matrix, meta: dict, corpus):
+        word_counts = corpus.word_counts.astype(np.float64)
+        rows = np.repeat(np.arange(matches.shape[0], dtype=np.int32), np.diff(matches.indptr))
+        scores = 2.0 * matches.data.astype(np.float64) / (word_counts[rows] + word_counts[matches.indices])
+
+        self.matches = matches
+        self.upper = sparse.csr_matrix((scores, matches.indices, matches.indptr), shape=matches.shape)
+        self.upper_rows = rows
+        self.full = (self.upper + self.upper.T).tocsr()
+        self.full.sort_indices()
+        self.full_rows = np.repeat(np.arange(self.full.shape[0], dtype=np.int32), np.diff(self.full.indptr))
+        self.meta = meta
+        self.corpus = corpus
+
+    def __len__(self) -> int:
+        return self.upper.shape[0]
+
+    @property
+    def floor(self) -> float:
+        return float(self.meta['params']['floor'])
+
+    @property
+    def nnz(self) -> int:
+        return int(self.upper.nnz)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.upper.data.nbytes + self.upper.indices.nbytes + self.upper.indptr.nbytes +
+                   self.full.data.nbytes + self.full.indices.nbytes + self.full.indptr.nbytes)
+
+    def covers(self, min_similarity: float) -> bool:
+        """هل العتبة مغطاة بالكامل (>= الحد الأدنى المحفوظ)؟"""
+        return min_similarity >= self.floor
+
+    def score_mask(self, scores: np.ndarray, min_similarity: float,
+                   max_similarity: Optional[float] = None) -> np.ndarray:
+        keep = scores >= min_similarity
+        if max_similarity is not None:
+            keep &= scores < max_similarity
+        return keep
+
+    # ============================================
+    # 🔎 الاستعلامات
+    # ============================================
+    def neighbors(self, index: int, min_similarity: float, max_similarity: Optional[float] = None,
+                  allowed: Optional[np.ndarray] = None, limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (مواقع المتشابهات، النسب) لآية - تنازلياً بالنسبة ثم تصاعدياً بالموقع
+
+        allowed: قناع منطقي للآيات المسموحة (النطاق / استبعاد البسملات)
+        """
+        start, end = self.full.indptr[index], self.full.indptr[index + 1]
+        others = self.full.indices[start:end]
+        scores = self.full.data[start:end]
+        keep = self.score_mask(scores, min_similarity, max_similarity)
+        if allowed is not None:
+            keep &= allowed[others]
+        others, scores = others[keep], scores[keep]
+        order = np.lexsort((others, -scores))
+        if limit is not None:
+            order = order[:limit]
+        return others[order], scores[order]
+
+    def pairs(self, min_similarity: float, target: np.ndarray, compare: np.ndarray,
+              max_similarity: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (الآية المستهدفة، الآية المقارنة، النسبة) لكل زوج بين النطاقين - تنازلياً بالنسبة
+
+        الزوج يُعد مرة واحدة: الآية الأولى من target إن أمكن بالترتيب (الأقدم، الأحدث)
+        """
+        rows, cols, scores = self.upper_rows, self.upper.indices, self.upper.data
+        forward = target[rows] & compare[cols]
+        backward = target[cols] & compare[rows]
+        keep = self.score_mask(scores, min_similarity, max_similarity) & (forward | backward)
+
+        forward = forward[keep]
+        rows, cols, scores = rows[keep], cols[keep], scores[keep]
+        first = np.where(forward, rows, cols)
+        second = np.where(forward, cols, rows)
+        order = np.lexsort((second, first, -scores))
+        return first[order], second[order], scores[order]
+
+    def neighbor_counts(self, min_similarity: float, max_similarity: Optional[float] = None,
+                        allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        """عدد المتشابهات ضمن العتبة لكل آية دفعة واحدة"""
+        keep = self.score_mask(self.full.data, min_similarity, max_similarity)
+        if allowed is not None:
+            keep &= allowed[self.full.indices]
+        return np.bincount(self.full_rows[keep], minlength=len(self))
+
+    def similarities(self, verse_id: int, min_similarity: float, max_similarity: Optional[float] = 0.99,
+                     limit: Optional[int] = None, exclude_basmala: bool = True) -> List[dict]:
+        """نتائج الآية بنفس شكل الـ similarity cache (بدون البسملات والتطابق 100% افتراضياً)"""
+        corpus = self.corpus
+        index = corpus.index_by_id.get(verse_id)
+        if index is None or (exclude_basmala and corpus.basmala_mask[index]):
+            return []
+        allowed = ~corpus.basmala_mask if exclude_basmala else None
+        others, scores = self.neighbors(index, min_similarity, max_similarity, allowed, limit)
+
+        results = []
+        for other_index, similarity in zip(others.tolist(), scores.tolist()):
+            other_verse = corpus.records[other_index]
+            results.append({
+                'verse_id': other_verse.id,
+                'surah': other_verse.surah,
+                'surah_name': other_verse.surah_name,
+                'ayah': other_verse.ayah,
+                'text': other_verse.text,
+                'similarity': similarity
+            })
+        return results
+
+# ============================================
+# 🏗️ البناء
+# ============================================
+def build_pair_matrix(corpus, floor: float = PAIR_FLOOR,
+                      progress: ProgressCallback = print_progress) -> PairMatrix:
+    """
+    كل زوج (i < j) نسبته >= floor - حد الكيس لكل الآيات دفعة واحدة ثم النواة الدقيقة للمرشّحين
+
+    progress: مستهلك أحداث التقدّم (كل 1000 آية)
+    """
+    start_time = time.time()
+    total = len(corpus)
+    word_counts = corpus.word_counts
+    indptr = np.zeros(total + 1, dtype=np.int32)
+    columns: List[int] = []
+    matches: List[int] = []
+    comparisons = 0
+
+    for index in range(total):
+        bounds = corpus.similarity_bounds(corpus.token_counts[index], int(word_counts[index]))
+        candidates = np.flatnonzero(bounds[index + 1:] >= floor) + index + 1
+        comparisons += len(candidates)
+
+        for other_index in candidates.tolist():
+            similarity = corpus.ratio(index, other_index)
+            if similarity >= floor:
+                length = int(word_counts[index] + word_counts[other_index])
+                columns.append(other_index)
+                matches.append(int(round(similarity * length / 2.0)))
+        indptr[index + 1] = len(columns)
+
+        if (index + 1) % 1000 == 0:
+            # الآية في الموقع i تُقارن بما بعدها فقط → العمل المنجز مجموع (total - k)
+            done = index + 1
+            progress(progress_event('pairs', done, total, start_time, done * total - done * (done - 1) / 2,
+                                    total * (total + 1) / 2, comparisons, pairs_found=len(columns)))
+
+    max_matches = int(word_counts.max()) if total else 0
+    data = np.array(matches, dtype=np.uint8 if max_matches <= np.iinfo(np.uint8).max else np.uint16)
+    matrix = sparse.csr_matrix((data, np.array(columns, dtype=np.int32), indptr), shape=(total, total))
+
+    elapsed = time.time() - start_time
+    meta = dict(build_manifest(PAIR_ARTIFACT, PAIR_FORMAT, corpus, {'floor': floor}),
+                rows=total, nnz=len(columns), comparisons=comparisons, elapsed_seconds=round(elapsed, 2))
+    print(f"✅ مصفوفة الأزواج: {len(columns):,} زوج >= {floor} من {comparisons:,} مقارنة في {elapsed:.2f}ث")
+    return PairMatrix(matrix, meta, corpus)
+
+# ============================================
+# 💾 الحفظ والتحميل
+# ============================================
+def save_pair_matrix(pairs: PairMatrix, path: str = PAIR_MATRIX_FILE):
+    """حفظ M (وليس النسب) في ملف npz واحد - كتابة مؤقتة ثم استبدال"""
+    matches = pairs.matches
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, data=matches.data, indices=matches.indices, indptr=matches.indptr,
+             shape=np.array(matches.shape), meta=np.array(json.dumps(pairs.meta, ensure_ascii=False)))
+    os.replace(tmp_path, path)
+    print(f"💾 تم حفظ مصفوفة الأزواج: {path}")
+
+def read_pair_meta(path: str = PAIR_MATRIX_FILE) -> Optional[dict]:
+    """الـ manifest المحفوظ داخل ملف npz بدون تحميل المصفوفة - None إذا لم يوجد"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return json.loads(str(data['meta']))
+
+def load_pair_matrix(corpus, path: str = PAIR_MATRIX_FILE) -> Optional[PairMatrix]:
+    """تحميل المصفوفة إذا كانت مطابقة للمدوّنة الحالية (وإلا None)"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        problem = manifest_problem(meta, PAIR_ARTIFACT, PAIR_FORMAT, corpus)
+        if problem is not None:
+            print(f"🔄 مصفوفة الأزواج قديمة ({problem}) - إعادة البناء")
+            return None
+        matrix = sparse.csr_matrix((data['data'], data['indices'], data['indptr']),
+                                   shape=tuple(data['shape'].tolist()))
+    if matrix.shape[0] != len(corpus):
+        print("⚠️ مصفوفة الأزواج لا تطابق عدد الآيات - تجاهلها")
+        return None
+    return PairMatrix(matrix, meta, corpus)
+
+def load_or_build_pair_matrix(corpus, path: str = PAIR_MATRIX_FILE, floor: float = PAIR_FLOOR) -> PairMatrix:
+    """المصفوفة المحفوظة، أو بناؤها وحفظها (بضع ثوانٍ للقرآن كاملاً عند 0.3)"""
+    try:
+        pairs = load_pair_matrix(corpus, path)
+        if pairs is not None:
+            return pairs
+    except Exception as e:
+        print(f"⚠️ خطأ في تحميل مصفوفة الأزواج: {e} - إعادة البناء")
+
+    pairs = build_pair_matrix(corpus, floor)
+    try:
+        save_pair_matrix(pairs, path)
+    except Exception as e:
+        print(f"⚠️ تعذّر حفظ مصفوفة الأزواج: {e}")
+    return pairs
+
+# ============================================
+# 🖥️ سطر الأوامر
+# ============================================
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="بناء مصفوفة أزواج التشابه المتناثرة")
+    parser.add_argument("--floor", type=float, default=PAIR_FLOOR, help="أقل نسبة تُحفظ")
+    parser.add_argument("--output", default=PAIR_MATRIX_FILE, help="ملف npz الناتج")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        init_db(db)
+        corpus = load_corpus(db)
+    finally:
+        db.close()
+
+    save_pair_matrix(build_pair_matrix(corpus, args.floor), args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+فهرس العبارات (Suffix Array على مستوى الكلمات)
+===========================================
+exact_phrase_search كان يفحص كل آية بثلاث طرق، و all_words_in_sequence يستدعي clean_text
+على كل كلمة من الآية والاستعلام داخل الحلقة. هنا فهرس واحد على كلمات المدوّنة المُطبَّعة:
+
+✅ Suffix array على مواقع الكلمات (معرّفات القاموس في corpus.token_data) - اللاحقة تنتهي بنهاية الآية
+   → كل العبارات المتجاورة المتطابقة في نطاق واحد متصل من المصفوفة
+✅ عبارة من m كلمات = بحث ثنائي O(m log n) (phrase_positions)
+✅ كلمات بالترتيب مع فجوات = دمج postings المواقع لكل كلمة (sequence_matches) - متجه على الآيات
+✅ نص جزئي داخل النص المُطبَّع (substring_matches) = كلمات داخلية بالعبارة + كلمة أولى تنتهي بالجزء
+   الأول وأخيرة تبدأ بالجزء الأخير (من القاموس) - نفس نتيجة `query in text_clean`
+✅ كل الدوال تُرجع مواقع المطابقة الفعلية (رقم الكلمة داخل الآية) للتظليل
+✅ فهرس مقلوب موضعي (postings المواقع لكل كلمة بصيغة CSR) → عدد التكرارات الدقيق لكل آية
+   بكلمات كاملة أو بادئة أو نص جزئي (occurrences) لـ /stats/word
+
+البناء بالمضاعفة (prefix doubling) بـ NumPy في أجزاء من الثانية → يُبنى في الذاكرة عند أول استخدام
+ويُعاد بناؤه إذا تغيّرت المدوّنة (checksum)، بدون ملف على القرص.
+"""
+
+import time
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ============================================
+# ⚙️ الإعدادات
+# ============================================
+WORD_SCAN_THRESHOLD = 16  # أكثر من هذا العدد من الكلمات → مرور واحد على token_data بدلاً من البحث الثنائي
+
+# ============================================
+# 🔤 الفهرس
+# ============================================
+class PhraseIndex:
+    """suffix array على كلمات المدوّنة + مواقع كل كلمة (موقع = فهرس داخل corpus.token_data)"""
+
+    __slots__ = ('tokens', 'token_data', 'offsets', 'verse_of', 'verse_start', 'verse_end', 'ends',
+                 'suffix_array', 'postings', 'postings_indptr', 'sorted_words', 'sorted_ids',
+                 'checksum', 'build_seconds')
+
+    def __init__(self, corpus):
+        start_time = time.time()
+        self.token_data = corpus.token_data
+        self.tokens: List[int] = corpus.token_data.tolist()
+        offsets = self.offsets = corpus.token_offsets
+        lengths = np.diff(offsets)
+        # لكل موقع: الآية، وبداية الآية ونهايتها (اللاحقة لا تتجاوز نهاية آيتها)
+        self.verse_of = np.repeat(np.arange(len(lengths), dtype=np.int32), lengths)
+        self.verse_start = offsets[:-1][self.verse_of]
+        self.verse_end = offsets[1:][self.verse_of]
+        self.ends: List[int] = self.verse_end.tolist()
+        self.suffix_array = build_suffix_array(corpus.token_data, self.verse_end,
+                                               int(lengths.max()) if len(lengths) else 0)
+        # الفهرس المقلوب الموضعي: مواقع الكلمة w = postings[postings_indptr[w]:postings_indptr[w + 1]] (مرتبة)
+        self.postings = np.argsort(corpus.token_data, kind='stable').astype(np.int64)
+        self.postings_indptr = np.concatenate(([0], np.cumsum(
+            np.bincount(corpus.token_data, minlength=len(corpus.vocab))))).astype(np.int64)
+        # القاموس مرتباً: كلمات البادئة = نطاق متصل (bisect) بدل المرور على القاموس كله
+        self.sorted_words: List[str] = sorted(corpus.vocab)
+        self.sorted_ids = np.array([corpus.vocab[word] for word in self.sorted_words], dtype=np.int32)
+        self.checksum = corpus.checksum
+        self.build_seconds = time.time() - start_time
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def prefix(self, position: int, length: int) -> tuple:
+        """أول length كلمة من اللاحقة (أقصر عند نهاية الآية) - مفتاح المقارنة في البحث الثنائي"""
+        return tuple(self.tokens[position:min(position + length, self.ends[position])])
+
+    def positions(self, word_id: int) -> np.ndarray:
+        """مواقع الكلمة في المدوّنة مرتبة (شريحة من الفهرس المقلوب - بدون نسخ)"""
+        if not 0 <= word_id < len(self.postings_indptr) - 1:
+            return np.zeros(0, dtype=np.int64)
+        return self.postings[self.postings_indptr[word_id]:self.postings_indptr[word_id + 1]]
+
+    def prefix_ids(self, prefix: str) -> List[int]:
+        """معرّفات كلمات القاموس التي تبدأ بـ prefix - O(log V)"""
+        low = bisect_left(self.sorted_words, prefix)
+        high = bisect_right(self.sorted_words, prefix + '\U0010ffff', lo=low)
+        return self.sorted_ids[low:high].tolist()
+
+    # ============================================
+    # 🔍 العبارات المتجاورة
+    # ============================================
+    def phrase_positions(self, word_ids: Sequence[int]) -> np.ndarray:
+        """
+        مواقع بداية العبارة (كلمات متجاورة بالترتيب داخل آية واحدة) - O(m log n)
+
+        Returns:
+            المواقع مرتبة تصاعدياً (int64)
+        """
+        target = tuple(word_ids)
+        if not target:
+            return np.zeros(0, dtype=np.int64)
+        if len(target) == 1:
+            return self.positions(target[0])
+        length = len(target)
+
+        def key(position):
+            return self.prefix(position, length)
+
+        low = bisect_left(self.suffix_array, target, key=key)
+        high = bisect_right(self.suffix_array, target, lo=low, key=key)
+        return np.sort(self.suffix_array[low:high].astype(np.int64))
+
+    def word_positions(self, word_ids: Sequence[int]) -> np.ndarray:
+        """مواقع أي كلمة من word_ids (اتحاد postings المواقع) مرتبة"""
+        if len(word_ids) > WORD_SCAN_THRESHOLD:
+            # كلمات كثيرة (بادئة قصيرة مثلاً): مرور واحد متجه أسرع من بحث ثنائي لكل كلمة
+            return np.flatnonzero(np.isin(self.token_data, np.asarray(word_ids, dtype=np.int32))).astype(np.int64)
+        parts = [self.positions(word_id) for word_id in word_ids]
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+    def group(self, starts: np.ndarray, width: int) -> Dict[int, List[int]]:
+        """{موقع الآية في المدوّنة: أرقام الكلمات المطابقة داخلها} لمطابقات تبدأ في starts بعرض width"""
+        matches: Dict[int, List[int]] = {}
+        offsets = (starts - self.verse_start[starts]).tolist()
+        for verse, offset in zip(self.verse_of[starts].tolist(), offsets):
+            words = matches.setdefault(verse, [])
+            words.extend(word for word in range(offset, offset + width) if word not in words)
+        return matches
+
+    def phrase_matches(self, word_ids: Sequence[int]) -> Dict[int, List[int]]:
+        """الآيات التي تحتوي العبارة كاملة + أرقام كلماتها"""
+        return self.group(self.phrase_positions(word_ids), len(word_ids))
+
+    # ============================================
+    # 🔗 كلمات بالترتيب مع فجوات
+    # ============================================
+    def sequence_matches(self, word_ids: Sequence[int]) -> Dict[int, List[int]]:
+        """
+        الآيات التي تحتوي الكلمات بالترتيب (مع فجوات) = نفس all_words_in_sequence
+
+        دمج postings المواقع: لكل آية مرشّحة نأخذ أول موقع لكل كلمة بعد موقع سابقتها
+        (بحث ثنائي متجه على كل الآيات معاً)
+
+        Returns:
+            {موقع الآية: أرقام الكلمات المطابقة (أول مطابقة بالترتيب)}
+        """
+        if not word_ids:
+            return {}
+        postings = [self.positions(word_id) for word_id in word_ids]
+        if any(len(positions) == 0 for positions in postings):
+            return {}
+
+        verses = np.unique(self.verse_of[postings[0]])
+        starts, ends = self.offsets[verses], self.offsets[verses + 1]
+        current = starts - 1
+        ok = np.ones(len(verses), dtype=bool)
+        matched = []
+        for positions in postings:
+            index = np.searchsorted(positions, current, side='right')
+            found = index < len(positions)
+            nxt = positions[np.minimum(index, len(positions) - 1)]
+            ok &= found & (nxt < ends)
+            current = np.where(ok, nxt, current)
+            matched.append(current)
+
+        return {
+            int(verse): [int(column[k] - starts[k]) for column in matched]
+            for k, verse in enumerate(verses.tolist()) if ok[k]
+        }
+
+    # ============================================
+    # ✂️ نص جزئي داخل النص المُطبَّع
+    # ============================================
+    def substring_matches(self, query_clean: str, vocab: Dict[str, int]) -> Dict[int, List[int]]:
+        """
+        الآيات التي يحتوي نصها المُطبَّع على query_clean (= `query_clean in text_clean`) + أرقام الكلمات
+
+        "w1 w2 … wn" داخل النص: كلمة تنتهي بـ w1، ثم w2..wn-1 كاملة، ثم كلمة تبدأ بـ wn
+        (كلمة واحدة: أي كلمة تحتوي w1)
+        """
+        words = query_clean.split()
+        if not words:
+            return {}
+        if len(words) == 1:
+            ids = [word_id for word, word_id in vocab.items() if words[0] in word]
+            return self.group(self.word_positions(ids), 1)
+
+        first = np.array([word_id for word, word_id in vocab.items() if word.endswith(words[0])], dtype=np.int32)
+        last = np.array([word_id for word, word_id in vocab.items() if word.startswith(words[-1])], dtype=np.int32)
+        interior = words[1:-1]
+        if interior:
+            interior_ids = [vocab.get(word) for word in interior]
+            if None in interior_ids:
+                return {}
+            positions = self.phrase_positions(interior_ids)
+            starts = positions - 1
+            valid = starts >= self.verse_start[positions]
+        else:
+            starts = self.word_positions(first.tolist())
+            valid = np.ones(len(starts), dtype=bool)
+        tail = starts + len(words) - 1
+        valid &= tail < self.verse_end[starts]
+        starts, tail = starts[valid], tail[valid]
+        keep = np.isin(self.token_data[starts], first) & np.isin(self.token_data[tail], last)
+        return self.group(starts[keep], len(words))
+
+    # ============================================
+    # 📊 عدد التكرارات لكل آية
+    # ============================================
+    def prefix_positions(self, words: Sequence[str], vocab: Dict[str, int]) -> np.ndarray:
+        """مواقع بداية "w1 … wn-1 wn*": كلمات كاملة متجاورة ثم كلمة تبدأ بـ wn"""
+        last = self.prefix_ids(words[-1])
+        if len(words) == 1:
+            return self.word_positions(last)
+        exact_ids = [vocab.get(word) for word in words[:-1]]
+        if None in exact_ids or not last:
+            return np.zeros(0, dtype=np.int64)
+        starts = self.phrase_positions(exact_ids)
+        tail = starts + len(exact_ids)
+        valid = tail < self.verse_end[starts]
+        starts, tail = starts[valid], tail[valid]
+        return starts[np.isin(self.token_data[tail], np.asarray(last, dtype=np.int32))]
+
+    def occurrences(self, corpus, query_clean: str, mode: str = "word") -> Tuple[np.ndarray, np.ndarray]:
+        """
+        الآيات التي ورد فيها query_clean وعدد مراته في كل آية
+
+        mode:
+            word      : كلمات كاملة ("رب" لا تطابق "الربا" ولا "قرب") - من postings مباشرة
+            prefix    : الكلمات كاملة والأخيرة بادئة ("رب" تطابق "ربك" و"ربنا")
+            substring : النص الجزئي كما كان (= text_clean.count(query_clean))
+
+        Returns:
+            (مواقع الآيات في المدوّنة مرتبة، عدد المرات لكل آية) - مصفوفتان int64
+        """
+        words = query_clean.split()
+        if not words:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        if mode == "substring":
+            verses = np.array(sorted(self.substring_matches(query_clean, corpus.vocab)), dtype=np.int64)
+            counts = np.array([corpus.texts_clean[verse].count(query_clean) for verse in verses.tolist()],
+                              dtype=np.int64)
+            return verses, counts
+
+        if mode == "prefix":
+            starts = self.prefix_positions(words, corpus.vocab)
+        else:
+            word_ids = [corpus.vocab.get(word) for word in words]
+            if None in word_ids:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+            starts = self.phrase_positions(word_ids)
+
+        verses, counts = np.unique(self.verse_of[starts], return_counts=True)
+        return verses.astype(np.int64), counts.astype(np.int64)
+
+# ============================================
+# 🏗️ البناء
+# ============================================
+def build_suffix_array(token_data: np.ndarray, verse_end: np.ndarray, max_length: int) -> np.ndarray:
+    """
+    suffix array بالمضاعفة: الرتبة بعد الجولة k = ترتيب أول 2k كلمة من كل لاحقة
+
+    ما بعد نهاية الآية رتبته 0 (أصغر من أي كلمة) → اللاحقة الأقصر قبل امتداداتها.
+    اللواحق المتطابقة (نفس نهاية آيتين) مرتبة بالموقع.
+    """
+    size = len(token_data)
+    positions = np.arange(size, dtype=np.int64)
+    if size == 0:
+        return positions.astype(np.int32)
+
+    rank = token_data.astype(np.int64) + 1
+    step = 1
+    while True:
+        following = positions + step
+        second = np.where(following < verse_end, rank[np.minimum(following, size - 1)], 0)
+        order = np.lexsort((second, rank))
+        first_sorted, second_sorted = rank[order], second[order]
+        changed = (first_sorted[1:] != first_sorted[:-1]) | (second_sorted[1:] != second_sorted[:-1])
+        new_rank = np.empty(size, dtype=np.int64)
+        new_rank[order] = np.concatenate(([1], 1 + np.cumsum(changed)))
+        rank = new_rank
+        if rank.max() == size or 2 * step >= max_length:
+            break
+        step *= 2
+
+    return np.lexsort((positions, rank)).astype(np.int32)
+
+# ============================================
+# 🧠 الفهرس الحالي
+# ============================================
+PHRASE_INDEX: Optional[PhraseIndex] = None
+
+def get_phrase_index(corpus) -> PhraseIndex:
+    """الفهرس الحالي (يُبنى عند أول استخدام، ومن جديد إذا تغيّرت المدوّنة)"""
+    global PHRASE_INDEX
+    if PHRASE_INDEX is None or PHRASE_INDEX.checksum != corpus.checksum:
+        PHRASE_INDEX = PhraseIndex(corpus)
+        print(f"🔤 فهرس العبارات (suffix array): {len(PHRASE_INDEX)} كلمة في {PHRASE_INDEX.build_seconds:.2f}ث")
+    return PHRASE_INDEX
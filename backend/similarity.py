@@ -7,20 +7,25 @@
 ✅ إصلاح مشكلة البحث بالعبارات الكاملة
 ✅ إصلاح مشكلة التظليل - "آتوا الزكاة"
 ✅ تم إصلاح جميع حالات الفشل في التطبيع
+✅ محرك تطبيع مُجمَّع (جدول translate + خطوات مُجمَّعة مسبقاً) - نفس الناتج حرفياً وأسرع ~4x
 """
 
 import re
+import hashlib
 from difflib import SequenceMatcher
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Callable
 import unicodedata
 
 # ============================================
 # 🧹 تنظيف النصوص العربية - نسخة محسنة ومدمجة
 # ============================================
 
-def normalize_arabic_text(text: str) -> str:
+def normalize_arabic_text_legacy(text: str) -> str:
     """
-    التطبيع الشامل للنص العربي - يطابق textNormalizer.js بالضبط
+    التطبيع الشامل للنص العربي - النسخة التسلسلية الأصلية (~100 استدعاء re.sub)
+    
+    ⚠️ مرجع فقط: المحرك المُجمَّع normalize_arabic_text يجب أن يطابقها حرفياً
+    (يُستخدم في اختبار الأداء والتحقق أسفل الملف)
     
     Args:
         text: النص المراد تطبيعه
@@ -230,6 +235,177 @@ def normalize_arabic_text(text: str) -> str:
     
     return normalized
 
+# ============================================
+# ⚡ محرك التطبيع المُجمَّع - نفس القواعد بتمريرات أقل
+# ============================================
+# القواعد نفسها الموجودة في normalize_arabic_text_legacy وبنفس الترتيب، لكنها تُجمَّع مرة واحدة:
+# - كل قواعد الحرف الواحد (حذف / استبدال) المتتالية ← جدول str.translate واحد
+# - القواعد النصية الثابتة ← str.replace (مكافئ حرفياً لـ re.sub على نص ثابت وأسرع بكثير)
+# - القواعد ذات الأنماط الحقيقية (حرف اختياري "?") ← تعابير مُجمَّعة مسبقاً (5 فقط)
+# ⚠️ دمج القواعد متعددة الأحرف في تعبير واحد يغيّر الناتج لأن أنماطها تتداخل
+#    (مثلاً "يو?من" و"يو?تي" تتشاركان الياء في "يوتيمن") لذلك يبقى ترتيبها الأصلي
+# ⚠️ القواعد التي لا يمكن أن تنطبق بعد المراحل السابقة حُذفت من هنا (الناتج مطابق حرفياً):
+#    0.5 و3.1 (الألف الخنجرية حُوّلت في 0.2)، 3.2 الأولى و3.9 (أنماط مُشكَّلة بعد إزالة التشكيل)،
+#    3.3 (ة صارت ه في 2.3)، 3.4 و4.1 و4.2 (استبدال بنفس النص)، "اولائك" و"يو?تى" (ئ و ى وُحّدتا)،
+#    قواعد 0.3 الثنائية (مكافئة لحذف الحركة ثم توحيد الهمزة) و"  +" (المسافات وُحّدت في 5.3)
+
+def char_range(first: str, last: str) -> str:
+    """كل الأحرف بين first و last (شاملة) - مكافئ [first-last] في التعابير"""
+    return ''.join(chr(c) for c in range(ord(first), ord(last) + 1))
+
+
+# المرحلة 0: كلمات تعتمد على التشكيل (قبل إزالته)
+DIACRITIC_WORD_RULES = [
+    (r'إِبْرَٰهِۦمُ', 'ابراهيم'),
+    (r'إِبْرَٰهِيمُ', 'ابراهيم'),
+    (r'إِبْرَاهِيمُ', 'ابراهيم'),
+    (r'إِبْرَٰهِمُ', 'ابراهيم'),
+    (r'لَٰكِنَّ?', 'لكن'),
+]
+
+# المراحل 0.2 - 2.3: قواعد الحرف الواحد بالترتيب الأصلي (تُدمج في جدول واحد)
+CHAR_RULES = [
+    ('ٰ', 'ا'),                              # 0.2 الألف الخنجرية
+    ('ٱ', 'ا'),                               # 0.3 همزة الوصل
+    ('ۦۥۢ۠', ''),                            # 0.4 الياء والواو الصغيرة والعلامات
+    (char_range('\u064B', '\u065F'), ''),     # 1.1 الحركات
+    (char_range('\u0610', '\u061A'), ''),     # 1.2 علامات المد والوقف
+    (char_range('\u06D6', '\u06ED'), ''),
+    (char_range('\u08D3', '\u08E1'), ''),     # 1.3 علامات موسعة
+    (char_range('\u08E3', '\u08FF'), ''),
+    ('ۥۦۭ', ''),                             # 1.4
+    ('\u0640', ''),                           # 1.5 Tatweel
+    ('أإآٱء', 'ا'),                           # 2.1 أشكال الألف
+    ('ؤ', 'و'),                               # 2.2 الهمزة على الواو والياء
+    ('ئ', 'ي'),
+    ('ٵ', 'ا'),
+    ('ٲ', 'ا'),
+    ('ى', 'ي'),                               # 2.3 الألف المقصورة والتاء المربوطة
+    ('ة', 'ه'),
+    ('ۃ', 'ه'),
+]
+
+# المرحلتان 3 و4.3: القواعد العثمانية بعد إزالة التشكيل (الترتيب مهم)
+UTHMANI_RULES = [
+    (r'ربوا', 'ربا'),
+    (r'صلواه', 'صلاه'),
+    (r'زكواه', 'زكاه'),
+    (r'حيوه', 'حياه'),
+    (r'منوه', 'مناه'),
+    (r'اامن', 'امن'),
+    (r'ااتوا', 'اتوا'),
+    (r'ااتي', 'اتي'),
+    (r'اولوا', 'اولو'),
+    (r'هاذا', 'هذا'),
+    (r'ذالك', 'ذلك'),
+    (r'يا ?ايها', 'يا ايها'),
+    (r'يا ?بني', 'يا بني'),
+    (r'الاذين', 'الذين'),
+    (r'اللذين', 'الذين'),
+    (r'يو?من', 'يومن'),
+    (r'يو?تي', 'يوتي'),
+]
+
+# المرحلة 5.1 - 5.2: علامات الترقيم والأرقام
+CLEANUP_CHARS = '.,،؛!?؟:-()[]{}"\'«»' + char_range('0', '9') + char_range('٠', '٩')
+
+# المرحلة 6: إزالة التكرارات ثم التصحيح النهائي
+REPEATED_LETTERS = 'ايوه'
+FINAL_RULES = [
+    (r'ربوا', 'ربا'),
+    (r'لاكن', 'لكن'),
+]
+
+
+REGEX_SPECIAL_CHARS = set('.^$*+?{}[]\\|()')
+
+
+def compile_char_table(rules: List[Tuple[str, str]]) -> Dict[int, Any]:
+    """دمج قواعد الحرف الواحد المتتالية في جدول str.translate واحد"""
+    table = {}
+    for char in {c for chars, _ in rules for c in chars}:
+        result = char
+        for chars, replacement in rules:
+            if result and result in chars:
+                result = replacement
+        table[ord(char)] = result or None
+    return table
+
+
+def compile_replace_rules(rules: List[Tuple[str, str]]) -> List[Callable[[str], str]]:
+    """
+    تحويل قواعد (نمط، بديل) إلى خطوات جاهزة بنفس الترتيب:
+    النص الثابت ← str.replace، والنمط الحقيقي ← تعبير مُجمَّع مسبقاً
+    """
+    steps = []
+    for pattern, replacement in rules:
+        if REGEX_SPECIAL_CHARS.isdisjoint(pattern):
+            steps.append(lambda text, p=pattern, r=replacement: text.replace(p, r))
+        else:
+            steps.append(lambda text, sub=re.compile(pattern).sub, r=replacement: sub(r, text))
+    return steps
+
+
+DIACRITIC_WORD_STEPS = compile_replace_rules(DIACRITIC_WORD_RULES)
+CHAR_TABLE = compile_char_table(CHAR_RULES)
+UTHMANI_STEPS = compile_replace_rules(UTHMANI_RULES)
+CLEANUP_TABLE = compile_char_table([(CLEANUP_CHARS, '')])
+FINAL_STEPS = compile_replace_rules(FINAL_RULES)
+
+# ⚠️ إصدار محرك التطبيع: الجداول وحدها لا تصف الناتج - يجب زيادته مع أي تعديل في كود
+# normalize_arabic_text أو compile_replace_rules / compile_char_table
+# (ترتيب المراحل، توحيد المسافات وlower()، حلقة إزالة الحروف المكررة...)
+NORMALIZER_ENGINE_VERSION = 1
+
+# 🏷️ بصمة التطبيع: تتغير مع أي تعديل في القواعد أعلاه أو في إصدار المحرك
+# فتُعاد حسابات النص المُطبَّع المخزّنة (text_clean في قاعدة البيانات)
+NORMALIZER_VERSION = hashlib.sha256(repr((
+    NORMALIZER_ENGINE_VERSION,
+    DIACRITIC_WORD_RULES, CHAR_RULES, UTHMANI_RULES,
+    CLEANUP_CHARS, REPEATED_LETTERS, FINAL_RULES
+)).encode('utf-8')).hexdigest()[:16]
+
+
+def normalize_arabic_text(text: str) -> str:
+    """
+    التطبيع الشامل للنص العربي - يطابق textNormalizer.js بالضبط
+    
+    ⚡ يستخدم المحرك المُجمَّع: ناتج مطابق حرفياً لـ normalize_arabic_text_legacy
+    بجدول translate واحد وخطوات مُجمَّعة مسبقاً بدلاً من ~100 استدعاء re.sub
+    ⚠️ أي تعديل في مراحل هذه الدالة يتطلب زيادة NORMALIZER_ENGINE_VERSION
+    
+    Args:
+        text: النص المراد تطبيعه
+        
+    Returns:
+        النص بعد التطبيع الكامل
+    """
+    if not text:
+        return ""
+    
+    normalized = text
+    for step in DIACRITIC_WORD_STEPS:
+        normalized = step(normalized)
+    
+    normalized = normalized.translate(CHAR_TABLE)
+    
+    for step in UTHMANI_STEPS:
+        normalized = step(normalized)
+    
+    # 5.1 - 5.4: حذف الترقيم والأرقام ثم توحيد المسافات (split يطابق \s+ مع strip)
+    normalized = ' '.join(normalized.translate(CLEANUP_TABLE).split()).lower()
+    
+    # 6: "اا+" ← "ا" وكذلك الياء والواو والهاء
+    for letter in REPEATED_LETTERS:
+        doubled = letter * 2
+        while doubled in normalized:
+            normalized = normalized.replace(doubled, letter)
+    
+    for step in FINAL_STEPS:
+        normalized = step(normalized)
+    
+    return normalized
+
 # 🔧 دالة التوافق للكود القديم
 def clean_text(text: str) -> str:
     """
@@ -354,6 +530,16 @@ def calculate_similarity(text1: str, text2: str, use_words: bool = True) -> floa
         # المقارنة على مستوى الأحرف
         return SequenceMatcher(None, clean1, clean2).ratio()
 
+def calculate_similarity_clean(clean1: str, clean2: str) -> float:
+    """
+    التشابه على مستوى الكلمات لنصين مُطبَّعين مسبقاً (مثل text_clean المخزّن)
+    
+    ✅ نفس نتيجة calculate_similarity(use_words=True) بدون إعادة التطبيع
+    """
+    if not clean1 or not clean2:
+        return 0.0
+    return SequenceMatcher(None, clean1.split(), clean2.split()).ratio()
+
 # ============================================
 # 🔧 دوال مساعدة للبحث والإحصائيات
 # ============================================
@@ -550,20 +736,59 @@ if __name__ == "__main__":
     
     # 2. اختبار الأداء
     import time
-    def benchmark_normalization(text: str, iterations: int = 5000):
-        print(f"⏱️  قياس الأداء ({iterations} تكرار)...")
+    import csv
+    import os
+    def benchmark_normalization(text: str, iterations: int = 5000, normalizer=normalize_arabic_text):
+        print(f"⏱️  قياس الأداء ({iterations} تكرار) - {normalizer.__name__}...")
         print(f"   النص: {text[:50]}...")
         start = time.time()
         for _ in range(iterations):
-            _ = normalize_arabic_text(text)
+            _ = normalizer(text)
         elapsed = time.time() - start
         avg_time = (elapsed / iterations) * 1000  # بالميلي ثانية
         print(f"   ⏱️  الزمن الإجمالي: {elapsed:.3f}ث")
         print(f"   ⚡ متوسط الزمن: {avg_time:.3f}ms")
         print(f"   🚀 السرعة: {iterations/elapsed:.0f} عملية/ثانية")
+        return elapsed
 
     print("\n" + "="*70)
     print("📊 اختبار الأداء على نص نموذجي")
-    sample_text = "يَا أَيُّهَا الَّذِينَ آمَنُوا أَقِيمُوا الصَّلَاةَ وَآتُوا الزَّكَاةَ"
-    benchmark_normalization(sample_text, iterations=5000)
-    print("="*70)
\ No newline at end of file
+    sample_text = "يَا أَيُّهَا الَّذِينَ آمَنُوا أَقِيمُوا الصَّلَاةَ وَآتُوا الزَّكَاةَ"
+    legacy_elapsed = benchmark_normalization(sample_text, iterations=5000, normalizer=normalize_arabic_text_legacy)
+    compiled_elapsed = benchmark_normalization(sample_text, iterations=5000)
+    print(f"   📈 التسريع: {legacy_elapsed/compiled_elapsed:.1f}x")
+    print("="*70)
+    
+    # 3. اختبار المطابقة والأداء على القرآن كاملاً (6,236 آية)
+    def benchmark_corpus(texts: List[str], rounds: int = 3):
+        print(f"⏱️  قياس الأداء على {len(texts):,} آية ({rounds} جولات)...")
+        
+        legacy_results = [normalize_arabic_text_legacy(t) for t in texts]
+        compiled_results = [normalize_arabic_text(t) for t in texts]
+        mismatches = sum(1 for a, b in zip(legacy_results, compiled_results) if a != b)
+        print(f"   {'✅' if mismatches == 0 else '❌'} المطابقة الحرفية: {len(texts) - mismatches}/{len(texts)}")
+        
+        timings = {}
+        for normalizer in (normalize_arabic_text_legacy, normalize_arabic_text):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for t in texts:
+                    normalizer(t)
+            elapsed = time.perf_counter() - start
+            timings[normalizer.__name__] = elapsed
+            per_call_us = elapsed / (rounds * len(texts)) * 1e6
+            print(f"   ⚡ {normalizer.__name__}: {elapsed/rounds:.3f}ث/جولة | {per_call_us:.1f}µs/آية")
+        
+        speedup = timings['normalize_arabic_text_legacy'] / timings['normalize_arabic_text']
+        print(f"   📈 التسريع: {speedup:.1f}x")
+    
+    csv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quran_data_arabic_juz.csv")
+    print("\n" + "="*70)
+    print("📊 اختبار الأداء على القرآن كاملاً")
+    if os.path.exists(csv_path):
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            corpus_texts = [row['text'] for row in csv.DictReader(f)]
+        benchmark_corpus(corpus_texts)
+    else:
+        print(f"⚠️ الملف غير موجود: {csv_path}")
+    print("="*70)
@@ -0,0 +1,235 @@
+"""
+similarity cache بصيغة CSR ثنائية مضغوطة (تُحمَّل بـ memory-map)
+===========================================
+الصيغة القديمة (similarity_cache.npy) قاموس Python مخلّل: لكل آية قائمة dicts تكرر
+نص الآية المجاورة واسم السورة ورقم الآية → رسم كائنات ضخم في الذاكرة (512 MB على Render).
+
+الصيغة الجديدة مجلد من مصفوفات مسطّحة (similarity_cache_csr/):
+
+✅ indptr.npy     (int32)        : بداية ونهاية صف كل آية (بترتيب المدوّنة)
+✅ neighbors.npy  (int16/int32)  : معرّف الآية المتشابهة (verse_id)
+✅ matches.npy    (uint8/uint16) : عدد الكلمات المتطابقة M
+✅ meta.json                     : الـ manifest (بصمة المدوّنة + التطبيع + العتبة + K) - artifacts
+
+النسبة تُعاد بنفس حساب النواة حرفياً: 2.0 * M / (m + n) (أطوال الآيتين من المدوّنة)
+→ بايت واحد لكل نتيجة بدون أي فقدان دقة (أدق من float16 أو الأجزاء من الألف)
+
+بيانات الآيات (النص، السورة، الآية) تُضاف من المدوّنة عند بناء الاستجابة فقط.
+
+تحويل ملف قديم:
+
+   python similarity_store.py --import similarity_cache.npy
+"""
+
+import argparse
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database import SessionLocal, init_db
+from corpus import load_corpus
+from artifacts import build_manifest, manifest_problem, save_artifact_dir, read_dir_manifest, load_artifact_dir
+
+# ============================================
+# ⚙️ الإعدادات
+# ============================================
+SIMILARITY_STORE_DIR = "similarity_cache_csr"
+LEGACY_CACHE_FILE = "similarity_cache.npy"
+STORE_ARTIFACT = "similarity_cache"
+STORE_FORMAT = "csr-v1"
+STORE_ARRAYS = ('indptr', 'neighbors', 'matches')
+
+# ============================================
+# 🗂️ المخزن
+# ============================================
+class SimilarityStore:
+    """
+    similarity cache للقراءة فقط فوق مصفوفات CSR (memory-mapped)
+
+    واجهة قاموس للقراءة: len(store) / verse_id in store / store[verse_id] → نفس قوائم dicts القديمة
+    """
+
+    __slots__ = ('indptr', 'neighbors', 'matches', 'meta', 'corpus')
+
+    def __init__(self, indptr: np.ndarray, neighbors: np.ndarray, matches: np.ndarray,
+                 meta: dict, corpus):
+        self.indptr = indptr
+        self.neighbors = neighbors
+        self.matches = matches
+        self.meta = meta
+        self.corpus = corpus
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def __contains__(self, verse_id) -> bool:
+        return verse_id in self.corpus.index_by_id
+
+    def __getitem__(self, verse_id: int) -> List[dict]:
+        if verse_id not in self.corpus.index_by_id:
+            raise KeyError(verse_id)
+        return self.similarities(verse_id)
+
+    def get(self, verse_id: int, default=None):
+        return self.similarities(verse_id) if verse_id in self else default
+
+    @property
+    def nnz(self) -> int:
+        return int(self.indptr[-1])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.indptr.nbytes + self.neighbors.nbytes + self.matches.nbytes)
+
+    def count(self, verse_id: int) -> int:
+        """عدد المتشابهات المخزنة لآية"""
+        index = self.corpus.index_by_id[verse_id]
+        return int(self.indptr[index + 1] - self.indptr[index])
+
+    def row(self, verse_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(معرّفات المتشابهات، النسب) لآية - مرتبة تنازلياً كما خُزّنت"""
+        corpus = self.corpus
+        index = corpus.index_by_id[verse_id]
+        start, end = int(self.indptr[index]), int(self.indptr[index + 1])
+        neighbor_ids = np.asarray(self.neighbors[start:end], dtype=np.int32)
+        matches = np.asarray(self.matches[start:end], dtype=np.float64)
+        lengths = corpus.word_counts[index] + corpus.word_counts[corpus.indices_of(neighbor_ids)]
+        return neighbor_ids, 2.0 * matches / lengths
+
+    def similarities(self, verse_id: int, min_similarity: float = 0.0,
+                     limit: Optional[int] = None) -> List[dict]:
+        """نتائج الآية بنفس شكل الـ cache القديم (بيانات الآيات من المدوّنة)"""
+        neighbor_ids, scores = self.row(verse_id)
+        keep = scores >= min_similarity
+        neighbor_ids, scores = neighbor_ids[keep], scores[keep]
+        if limit is not None:
+            neighbor_ids, scores = neighbor_ids[:limit], scores[:limit]
+
+        results = []
+        for neighbor_id, similarity in zip(neighbor_ids.tolist(), scores.tolist()):
+            other_verse = self.corpus.get(neighbor_id)
+            results.append({
+                'verse_id': other_verse.id,
+                'surah': other_verse.surah,
+                'surah_name': other_verse.surah_name,
+                'ayah': other_verse.ayah,
+                'text': other_verse.text,
+                'similarity': similarity
+            })
+        return results
+
+# ============================================
+# 🏗️ البناء من النتائج
+# ============================================
+def store_from_rows(corpus, rows: Dict[int, Sequence[Tuple[int, float]]], params: dict) -> Tuple[SimilarityStore, int]:
+    """
+    بناء المصفوفات من {verse_id: [(neighbor_id, similarity), ...]} (مرتبة تنازلياً)
+
+    params: معاملات البناء (تُحفظ في الـ manifest)
+
+    يُرجع (المخزن، عدد النسب التي لا تطابق 2M/(m+n) بالضبط - 0 لأي cache من النواة)
+    """
+    word_counts = corpus.word_counts
+    indptr = np.zeros(len(corpus) + 1, dtype=np.int32)
+    neighbor_list: List[int] = []
+    match_list: List[int] = []
+    mismatched = 0
+
+    for verse in corpus.records:
+        for neighbor_id, similarity in rows.get(verse.id, ()):
+            other = corpus.get(neighbor_id)
+            if other is None:
+                continue
+            length = verse.word_count + other.word_count
+            matches = int(round(similarity * length / 2.0))
+            if 2.0 * matches / length != similarity:
+                mismatched += 1
+            neighbor_list.append(neighbor_id)
+            match_list.append(matches)
+        indptr[verse.index + 1] = len(neighbor_list)
+
+    max_id = int(corpus.ids.max()) if len(corpus) else 0
+    neighbors = np.array(neighbor_list, dtype=np.int16 if max_id <= np.iinfo(np.int16).max else np.int32)
+    max_matches = int(word_counts.max()) if len(corpus) else 0
+    matches = np.array(match_list, dtype=np.uint8 if max_matches <= np.iinfo(np.uint8).max else np.uint16)
+
+    meta = dict(build_manifest(STORE_ARTIFACT, STORE_FORMAT, corpus, params),
+                rows=len(corpus), nnz=len(neighbor_list))
+    return SimilarityStore(indptr, neighbors, matches, meta, corpus), mismatched
+
+def store_from_legacy_cache(corpus, cache: dict, params: Optional[dict] = None) -> Tuple[SimilarityStore, int]:
+    """تحويل قاموس الـ cache القديم {verse_id: [dict, ...]}"""
+    rows = {verse_id: [(entry['verse_id'], entry['similarity']) for entry in entries]
+            for verse_id, entries in cache.items()}
+    return store_from_rows(corpus, rows, dict(params or {}, source="legacy-npy"))
+
+# ============================================
+# 💾 الحفظ والتحميل
+# ============================================
+def save_store(store: SimilarityStore, path: str = SIMILARITY_STORE_DIR):
+    """المصفوفات + meta.json بنسخة جديدة تُنشر ذرياً (artifacts.save_artifact_dir)"""
+    save_artifact_dir(path, {name: getattr(store, name) for name in STORE_ARRAYS}, store.meta)
+
+def store_problem(corpus, path: str = SIMILARITY_STORE_DIR) -> Optional[str]:
+    """سبب عدم صلاحية المخزن المحفوظ للمدوّنة الحالية (None = صالح)"""
+    return manifest_problem(read_dir_manifest(path), STORE_ARTIFACT, STORE_FORMAT, corpus)
+
+def load_store(corpus, path: str = SIMILARITY_STORE_DIR) -> Optional[SimilarityStore]:
+    """تحميل المخزن بـ memory-map إذا كان مطابقاً للمدوّنة الحالية (وإلا None)"""
+    loaded = load_artifact_dir(path, STORE_ARRAYS, STORE_ARTIFACT, STORE_FORMAT, corpus)
+    if loaded is None:
+        return None
+    arrays, meta = loaded
+    if len(arrays['indptr']) != len(corpus) + 1:
+        print("⚠️ similarity cache لا يطابق عدد الآيات - تجاهله")
+        return None
+    return SimilarityStore(arrays['indptr'], arrays['neighbors'], arrays['matches'], meta, corpus)
+
+def import_legacy_cache(corpus, legacy_path: str = LEGACY_CACHE_FILE,
+                        path: str = SIMILARITY_STORE_DIR) -> Optional[SimilarityStore]:
+    """تحويل similarity_cache.npy القديم إلى الصيغة الجديدة وحفظه"""
+    if not os.path.exists(legacy_path):
+        return None
+    start_time = time.time()
+    cache = np.load(legacy_path, allow_pickle=True).item()
+    store, mismatched = store_from_legacy_cache(corpus, cache)
+    del cache
+    save_store(store, path)
+    print(f"✅ تم تحويل {legacy_path} → {path}: {len(store)} آية، {store.nnz:,} نتيجة، "
+          f"{store.nbytes / 1024:.0f} KB في {time.time() - start_time:.2f}ث")
+    if mismatched:
+        print(f"⚠️ {mismatched:,} نسبة لا تطابق نواة الكلمات (cache من إصدار أقدم؟) - خُزّنت لأقرب قيمة")
+    return load_store(corpus, path)
+
+def load_or_import_store(corpus, path: str = SIMILARITY_STORE_DIR,
+                         legacy_path: str = LEGACY_CACHE_FILE) -> Optional[SimilarityStore]:
+    """المخزن الحالي، أو تحويل الملف القديم مرة واحدة إذا لم يوجد غيره"""
+    store = load_store(corpus, path)
+    if store is None and os.path.exists(legacy_path) and read_dir_manifest(path) is None:
+        print(f"🔄 تحويل similarity cache القديم ({legacy_path}) إلى صيغة CSR...")
+        store = import_legacy_cache(corpus, legacy_path, path)
+    return store
+
+# ============================================
+# 🖥️ سطر الأوامر
+# ============================================
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="تحويل similarity cache القديم (.npy) إلى صيغة CSR")
+    parser.add_argument("--import", dest="legacy_path", default=LEGACY_CACHE_FILE, help="ملف .npy القديم")
+    parser.add_argument("--output", default=SIMILARITY_STORE_DIR, help="مجلد الصيغة الجديدة")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        init_db(db)
+        corpus = load_corpus(db)
+    finally:
+        db.close()
+
+    if import_legacy_cache(corpus, args.legacy_path, args.output) is None:
+        print(f"❌ الملف غير موجود: {args.legacy_path}")
+
+if __name__ == "__main__":
+    main()
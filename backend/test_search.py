@@ -0,0 +1,71 @@
+"""
+اختبارات البحث النصي الدقيق على قاعدة بيانات مؤقتة (نسخة من quran.db)
+================================================================
+التشغيل من المجلد backend: python -m pytest -q test_search.py
+"""
+
+import os
+import shutil
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope="module")
+def search_db(tmp_path_factory):
+    """نسخة من قاعدة البيانات مع جداول FTS5 (الأصلي + المُطبَّع + الثلاثيات) ومدوّنة محمّلة"""
+    work_dir = tmp_path_factory.mktemp("db")
+    shutil.copy(os.path.join(BACKEND_DIR, "quran.db"), work_dir / "quran.db")
+    shutil.copy(os.path.join(BACKEND_DIR, "quran_data_arabic_juz.csv"), work_dir / "quran_data_arabic_juz.csv")
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)  # DATABASE_FILE نسبي ("./quran.db")
+
+    import main
+    from cache_generation import publish_generation
+
+    db = next(main.get_db())
+    main.init_db(db)
+    main.load_corpus(db)
+    assert main.build_fts_index(db)
+    publish_generation(**main.fts_published_fields())
+    yield main, db
+
+    db.close()
+    os.chdir(previous_dir)
+
+
+def raw_matches(main, query: str) -> list:
+    """معرّفات الآيات التي يحتوي نصها العثماني على query (مسح مباشر)"""
+    return [verse.id for verse in main.get_corpus().records if query in verse.text]
+
+
+@pytest.mark.parametrize("query", ["ذَٰل", "َٰلِكَ لَءَا", "كَوٰةَ وَه"])
+@pytest.mark.parametrize("trigram", [True, False])
+def test_exact_text_search_partial_uthmani(search_db, query, trigram):
+    """جزء من كلمة عثمانية: تطبيعه ليس نصاً جزئياً من text_clean ويجب أن يُطابَق في النص الأصلي"""
+    main, db = search_db
+    from cache_generation import publish_generation
+
+    publish_generation(fts_trigram_available=trigram)
+    try:
+        expected = raw_matches(main, query)
+        results = main.exact_text_search(db, query, limit=len(expected) + 1)
+    finally:
+        publish_generation(fts_trigram_available=True)
+
+    assert expected
+    assert [result['id'] for result in results] == expected
+    assert {result['match_type'] for result in results} == {'exact_original'}
+
+
+@pytest.mark.parametrize("query", ["ذَٰل", "َٰلِكَ لَءَا", "كَوٰةَ وَه"])
+def test_exact_phrase_search_partial_uthmani(search_db, query):
+    """نفس الحالة في بحث العبارة: المطابقة في النص الأصلي لا تعتمد على فهرس النص المُطبَّع"""
+    main, db = search_db
+    expected = raw_matches(main, query)
+    results = main.exact_phrase_search(db, query, limit=len(expected) + 1)
+
+    assert expected
+    assert [result['id'] for result in results] == expected
+    assert {result['match_type'] for result in results} == {'exact_phrase_original'}
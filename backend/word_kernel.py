@@ -0,0 +1,300 @@
+"""
+نواة التشابه اللفظي على معرّفات الكلمات (int32)
+===========================================
+calculate_similarity تعيد تطبيع النصين وتقسيمهما وتبني SequenceMatcher جديداً
+لكل زوج - وهذه أكبر تكلفة في build_similarity_cache و /similar و fallback_search.
+
+✅ قاموس كلمات: كل كلمة مُطبَّعة ← معرّف int32
+✅ كل آية مصفوفة معرّفات + فهرس مواقع (b2j) محسوب مرة واحدة
+✅ word_ratio تعيد نفس نسبة SequenceMatcher(None, words1, words2).ratio() حرفياً:
+   نفس خوارزمية find_longest_match / get_matching_blocks (بدون autojunk لأن أطول آية < 200 كلمة)
+✅ مرشّحات بحدود عليا مثبتة قبل النواة (الطول ثم كيس الكلمات) مع عدادات لكل مرحلة
+"""
+
+from difflib import SequenceMatcher
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# SequenceMatcher تفعّل autojunk للتسلسل الثاني إذا كان طوله >= 200
+AUTOJUNK_MIN_LENGTH = 200
+
+# ============================================
+# 📒 قاموس الكلمات
+# ============================================
+def build_vocabulary(token_lists: Sequence[Sequence[str]]) -> Dict[str, int]:
+    """قاموس كلمة ← معرّف (بترتيب أول ظهور)"""
+    vocab: Dict[str, int] = {}
+    for words in token_lists:
+        for word in words:
+            if word not in vocab:
+                vocab[word] = len(vocab)
+    return vocab
+
+def encode_words(words: Sequence[str], vocab: Dict[str, int]) -> Tuple[int, ...]:
+    """
+    تحويل كلمات إلى معرّفات
+
+    الكلمات غير الموجودة في القاموس (من استعلام المستخدم) تأخذ معرّفات سالبة مميزة:
+    لا تطابق أي كلمة في المدوّنة لكنها تطابق تكرارها داخل الاستعلام نفسه
+    """
+    unknown: Dict[str, int] = {}
+    ids = []
+    for word in words:
+        word_id = vocab.get(word)
+        if word_id is None:
+            word_id = unknown.setdefault(word, -1 - len(unknown))
+        ids.append(word_id)
+    return tuple(ids)
+
+def pack_token_ids(id_lists: Sequence[Sequence[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """تخزين مضغوط: مصفوفة int32 واحدة + إزاحات (الآية i = data[offsets[i]:offsets[i+1]])"""
+    offsets = np.zeros(len(id_lists) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(ids) for ids in id_lists])
+    data = np.fromiter((t for ids in id_lists for t in ids), dtype=np.int32, count=int(offsets[-1]))
+    return data, offsets
+
+def build_b2j(ids: Sequence[int]) -> Dict[int, List[int]]:
+    """فهرس المواقع لكل معرّف (نفس b2j في SequenceMatcher بدون junk)"""
+    b2j: Dict[int, List[int]] = {}
+    for j, word_id in enumerate(ids):
+        b2j.setdefault(word_id, []).append(j)
+    return b2j
+
+def count_words(ids: Sequence[int]) -> Dict[int, int]:
+    """عدد تكرار كل معرّف (كيس الكلمات)"""
+    counts: Dict[int, int] = {}
+    for word_id in ids:
+        counts[word_id] = counts.get(word_id, 0) + 1
+    return counts
+
+class EncodedText(NamedTuple):
+    """نص مُرمَّز جاهز للمقارنة (استعلام مثلاً)"""
+    ids: Tuple[int, ...]
+    b2j: Dict[int, List[int]]
+    counts: Dict[int, int]
+
+def encode_text(text_clean: str, vocab: Dict[str, int]) -> EncodedText:
+    """ترميز نص مُطبَّع مع فهرس المواقع وكيس الكلمات"""
+    ids = encode_words(text_clean.split(), vocab)
+    return EncodedText(ids, build_b2j(ids), count_words(ids))
+
+# ============================================
+# ⚡ النواة
+# ============================================
+def matching_words(a: Sequence[int], b: Sequence[int], b2j: Dict[int, List[int]]) -> int:
+    """
+    مجموع أطوال الكتل المتطابقة (مثل sum(get_matching_blocks()))
+
+    نقل مباشر لـ find_longest_match: نفس ترتيب المسح ونفس كسر التعادل،
+    فنفس الكتل تُختار ونفس المجموع يُحسب
+    """
+    total = 0
+    nothing: List[int] = []
+    queue = [(0, len(a), 0, len(b))]
+
+    while queue:
+        alo, ahi, blo, bhi = queue.pop()
+
+        besti, bestj, bestsize = alo, blo, 0
+        j2len: Dict[int, int] = {}
+        for i in range(alo, ahi):
+            j2lenget = j2len.get
+            newj2len: Dict[int, int] = {}
+            for j in b2j.get(a[i], nothing):
+                if j < blo:
+                    continue
+                if j >= bhi:
+                    break
+                k = newj2len[j] = j2lenget(j - 1, 0) + 1
+                if k > bestsize:
+                    besti, bestj, bestsize = i - k + 1, j - k + 1, k
+            j2len = newj2len
+
+        if bestsize:
+            total += bestsize
+            if alo < besti and blo < bestj:
+                queue.append((alo, besti, blo, bestj))
+            if besti + bestsize < ahi and bestj + bestsize < bhi:
+                queue.append((besti + bestsize, ahi, bestj + bestsize, bhi))
+
+    return total
+
+def word_ratio(a: Sequence[int], b: Sequence[int], b2j: Dict[int, List[int]]) -> float:
+    """
+    نسبة التشابه على مستوى الكلمات = calculate_similarity_clean على النصين الأصليين
+
+    a: معرّفات النص الأول، b: معرّفات النص الثاني، b2j: build_b2j(b)
+    """
+    la, lb = len(a), len(b)
+    if not la or not lb:
+        return 0.0
+    if lb >= AUTOJUNK_MIN_LENGTH:
+        # خارج نطاق القرآن - نرجع للمرجع لضمان نفس سلوك autojunk
+        return SequenceMatcher(None, list(a), list(b)).ratio()
+    if a == b:
+        return 1.0
+    return 2.0 * matching_words(a, b, b2j) / (la + lb)
+
+# ============================================
+# 🚧 المرشّحات المسبقة (حدود عليا مثبتة)
+# ============================================
+# النسبة = 2*M/(m+n) حيث M مجموع الكتل المتطابقة، و:
+#   1. M <= min(m, n)               → حد الطول   (= real_quick_ratio)
+#   2. M <= |تقاطع كيسي الكلمات|   → حد الكيس   (= quick_ratio)
+# إذا كان الحد أقل من العتبة فالنسبة الحقيقية أقل منها حتماً → لا حاجة للنواة
+
+class PrefilterStats:
+    """
+    عدادات المرشّحات: كم زوجاً أُقصي في كل مرحلة وكم وصل للنواة
+
+    index_skipped: أزواج لم تُفحص أصلاً لأن الفهرس المقلوب لم يرشّحها (inverted_index)
+    """
+
+    __slots__ = ('index_skipped', 'pairs', 'length_pruned', 'bag_pruned', 'exact')
+
+    def __init__(self):
+        self.index_skipped = 0
+        self.pairs = 0
+        self.length_pruned = 0
+        self.bag_pruned = 0
+        self.exact = 0
+
+    def merge(self, other: 'PrefilterStats'):
+        self.index_skipped += other.index_skipped
+        self.pairs += other.pairs
+        self.length_pruned += other.length_pruned
+        self.bag_pruned += other.bag_pruned
+        self.exact += other.exact
+
+    def to_dict(self) -> dict:
+        pruned = self.length_pruned + self.bag_pruned
+        return {
+            'index_skipped': self.index_skipped,
+            'pairs': self.pairs,
+            'length_pruned': self.length_pruned,
+            'bag_pruned': self.bag_pruned,
+            'exact_computed': self.exact,
+            'pruned_percent': round(100.0 * pruned / self.pairs, 1) if self.pairs else 0.0
+        }
+
+    def __str__(self) -> str:
+        d = self.to_dict()
+        skipped = f"تخطّاها الفهرس: {d['index_skipped']:,} | " if d['index_skipped'] else ""
+        return (f"{skipped}أزواج: {d['pairs']:,} | حد الطول: {d['length_pruned']:,} | "
+                f"حد الكيس: {d['bag_pruned']:,} | النواة: {d['exact_computed']:,} "
+                f"({d['pruned_percent']}% أُقصي مبكراً)")
+
+def bag_overlap(counts1: Dict[int, int], counts2: Dict[int, int]) -> int:
+    """حجم تقاطع كيسي الكلمات (مجموع min للتكرارات)"""
+    if len(counts1) > len(counts2):
+        counts1, counts2 = counts2, counts1
+    overlap = 0
+    for word_id, count in counts1.items():
+        other = counts2.get(word_id)
+        if other:
+            overlap += count if count < other else other
+    return overlap
+
+def filtered_ratio(a: Sequence[int], b: Sequence[int], b2j: Dict[int, List[int]],
+                   a_counts: Dict[int, int], b_counts: Dict[int, int],
+                   threshold: float, stats: Optional[PrefilterStats] = None) -> float:
+    """
+    word_ratio مع المرشّحات: النسبة الحقيقية إذا أمكن أن تبلغ العتبة، وإلا 0.0
+
+    ⚠️ القيمة 0.0 للأزواج المُقصاة تكفي للمقارنة بالعتبة فقط (>= threshold أو > threshold)
+    """
+    if stats is not None:
+        stats.pairs += 1
+    la, lb = len(a), len(b)
+    total = la + lb
+
+    # 1. حد الطول
+    if not la or not lb or 2.0 * min(la, lb) / total < threshold:
+        if stats is not None:
+            stats.length_pruned += 1
+        return 0.0
+
+    # 2. حد كيس الكلمات
+    if 2.0 * bag_overlap(a_counts, b_counts) / total < threshold:
+        if stats is not None:
+            stats.bag_pruned += 1
+        return 0.0
+
+    # 3. النواة الدقيقة للناجين فقط
+    if stats is not None:
+        stats.exact += 1
+    return word_ratio(a, b, b2j)
+
+# ============================================
+# 🧪 اختبار المطابقة والأداء
+# ============================================
+if __name__ == "__main__":
+    import csv
+    import os
+    import random
+    import time
+
+    from similarity import normalize_arabic_text, calculate_similarity, calculate_similarity_clean
+
+    csv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quran_data_arabic_juz.csv")
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        texts = [row['text'] for row in csv.DictReader(f)]
+
+    texts_clean = [normalize_arabic_text(t) for t in texts]
+    token_lists = [t.split() for t in texts_clean]
+    vocab = build_vocabulary(token_lists)
+    token_ids = [encode_words(words, vocab) for words in token_lists]
+    b2js = [build_b2j(ids) for ids in token_ids]
+    data, offsets = pack_token_ids(token_ids)
+
+    print("="*70)
+    print(f"📒 القاموس: {len(vocab):,} كلمة | {len(data):,} معرّف ({data.nbytes/1024:.0f} KB int32)")
+
+    random.seed(42)
+    sample = random.sample(range(len(texts)), 120)
+    pairs = [(i, j) for i in sample for j in sample if i != j]  # all-pairs على عينة
+    pairs += [tuple(random.sample(range(len(texts)), 2)) for _ in range(20000)]
+    print(f"🔢 عدد الأزواج: {len(pairs):,}")
+
+    # 1. المطابقة الحرفية
+    mismatches = sum(
+        1 for i, j in pairs
+        if word_ratio(token_ids[i], token_ids[j], b2js[j]) != calculate_similarity_clean(texts_clean[i], texts_clean[j])
+    )
+    print(f"{'✅' if mismatches == 0 else '❌'} المطابقة مع SequenceMatcher: {len(pairs) - mismatches}/{len(pairs)}")
+
+    # 2. الأداء (أزواج/ثانية)
+    def bench(name, fn, subset):
+        start = time.perf_counter()
+        for i, j in subset:
+            fn(i, j)
+        elapsed = time.perf_counter() - start
+        rate = len(subset) / elapsed
+        print(f"   ⚡ {name}: {rate:,.0f} زوج/ثانية")
+        return rate
+
+    slow_pairs = pairs[:3000]
+    base = bench("calculate_similarity (تطبيع + SequenceMatcher)",
+                 lambda i, j: calculate_similarity(texts[i], texts[j]), slow_pairs)
+    clean = bench("calculate_similarity_clean (SequenceMatcher)",
+                  lambda i, j: calculate_similarity_clean(texts_clean[i], texts_clean[j]), pairs)
+    kernel = bench("word_ratio (معرّفات int32)",
+                   lambda i, j: word_ratio(token_ids[i], token_ids[j], b2js[j]), pairs)
+    print(f"   📈 التسريع: {kernel/base:.0f}x مقابل calculate_similarity | {kernel/clean:.1f}x مقابل SequenceMatcher")
+
+    # 3. المرشّحات: نفس النتائج عند أي عتبة + نسبة الإقصاء
+    counts = [count_words(ids) for ids in token_ids]
+    exact_ratios = [word_ratio(token_ids[i], token_ids[j], b2js[j]) for i, j in pairs]
+    print("\n🚧 المرشّحات المسبقة:")
+    for threshold in (0.3, 0.5, 0.7, 0.85):
+        stats = PrefilterStats()
+        wrong = 0
+        start = time.perf_counter()
+        for (i, j), exact in zip(pairs, exact_ratios):
+            ratio = filtered_ratio(token_ids[i], token_ids[j], b2js[j], counts[i], counts[j], threshold, stats)
+            if (ratio >= threshold) != (exact >= threshold) or (ratio >= threshold and ratio != exact):
+                wrong += 1
+        rate = len(pairs) / (time.perf_counter() - start)
+        print(f"   {'✅' if wrong == 0 else '❌'} عتبة {threshold}: {rate:,.0f} زوج/ثانية | {stats}")
+    print("="*70)
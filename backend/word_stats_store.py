@@ -0,0 +1,246 @@
+"""
+إحصائيات الكلمات بصيغة ثنائية مضغوطة (تُحمَّل بـ memory-map)
+===========================================
+word_stats_cache.json كان 35 MB: كل كلمة تحمل قائمة dicts للآيات بنصها العثماني كاملاً،
+و json.load عند الإقلاع يحوّله إلى مئات الـ MB من كائنات Python (512 MB على Render).
+
+الصيغة الجديدة مجلد من مصفوفات مسطّحة (word_stats_store/):
+
+✅ words.npy          (<U)     : الكلمات المُطبَّعة مرتبة (بحث ثنائي + نطاق البادئة للاقتراحات)
+✅ totals.npy         (int32)  : إجمالي تكرار كل كلمة
+✅ indptr.npy         (int32)  : بداية ونهاية postings كل كلمة
+✅ verse_ids.npy      (int32)  : معرّفات الآيات (verse_id) تصاعدياً
+✅ counts.npy         (uint8)  : عدد مرات الكلمة في الآية
+✅ surah_indptr / surahs (uint8) / surah_totals (int32) : التوزيع حسب السورة (السور التي وردت فيها فقط)
+✅ juz_indptr / juzs (uint8) / juz_totals (int32)       : التوزيع حسب الجزء
+✅ prefixes / prefix_top (int32, K عمود) : أكثر K كلمة تكراراً لكل بادئة يبدأ بها أكثر من K كلمة
+   → الاقتراحات بدون ترتيب نطاق البادئة كله (البادئات الأقل تُرتّب مباشرة - K كلمة على الأكثر)
+✅ meta.json                    : الـ manifest (بصمة المدوّنة + التطبيع) - artifacts
+
+العدد بالكلمات الكاملة (مثل /stats/word?mode=word) وليس بالنص الجزئي،
+وبيانات الآيات (النص، السورة، الآية) تُضاف من المدوّنة عند بناء الاستجابة فقط.
+"""
+
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from artifacts import build_manifest, save_artifact_dir, load_artifact_dir
+
+# ============================================
+# ⚙️ الإعدادات
+# ============================================
+WORD_STATS_STORE_DIR = "word_stats_store"
+WORD_STATS_ARTIFACT = "word_stats"
+WORD_STATS_FORMAT = "csr-v2"   # v2: + prefixes / prefix_top
+STORE_ARRAYS = ('words', 'totals', 'indptr', 'verse_ids', 'counts',
+                'surah_indptr', 'surahs', 'surah_totals', 'juz_indptr', 'juzs', 'juz_totals',
+                'prefixes', 'prefix_top')
+AUTOCOMPLETE_TOP_K = 20  # = أقصى limit في /autocomplete
+
+# كلمات شائعة تُستبعد من الإحصائيات
+COMMON_WORDS = {
+    'في', 'من', 'إلى', 'على', 'عن', 'أن', 'إن', 'ما', 'لا', 'هل', 'بل',
+    'قد', 'سى', 'كان', 'يكون', 'قال', 'قل', 'إن', 'أن', 'هو', 'هي', 'هم',
+    'كذلك', 'الذي', 'التي', 'الذين', 'اللاتي', 'اللائي', 'ذلك', 'هذه',
+    'هذا', 'هؤلاء', 'تلك', 'أولئك', 'بعض', 'كل', 'جميع', 'أي', 'أين',
+    'متى', 'كيف', 'لماذا', 'كم', 'أيضا', 'ثم', 'حتى', 'أما', 'أو', 'و'
+}
+
+# ============================================
+# 🗂️ المخزن
+# ============================================
+class WordStatsStore:
+    """
+    إحصائيات الكلمات للقراءة فقط فوق مصفوفات CSR (memory-mapped)
+
+    len(store) / word in store / store.find(word) → رقم الكلمة في المصفوفات
+    """
+
+    __slots__ = STORE_ARRAYS + ('meta', 'corpus')
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: dict, corpus):
+        for name in STORE_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.meta = meta
+        self.corpus = corpus
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __contains__(self, word) -> bool:
+        return self.find(word) is not None
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(getattr(self, name).nbytes for name in STORE_ARRAYS))
+
+    def find(self, word: str) -> Optional[int]:
+        """رقم الكلمة (بحث ثنائي في words) أو None"""
+        index = int(np.searchsorted(self.words, word))
+        return index if index < len(self.words) and self.words[index] == word else None
+
+    def prefix_range(self, prefix: str) -> Tuple[int, int]:
+        """[low, high) الكلمات التي تبدأ بـ prefix (نطاق متصل في القاموس المرتب)"""
+        if not prefix:
+            return 0, len(self.words)
+        low = int(np.searchsorted(self.words, prefix, side='left'))
+        if len(prefix) > self.words.dtype.itemsize // 4:
+            return low, low  # أطول من أي كلمة (searchsorted يقصّ المفتاح لعرض المصفوفة)
+        return low, int(np.searchsorted(self.words, next_prefix(prefix), side='left'))
+
+    def complete(self, prefix: str, limit: int = AUTOCOMPLETE_TOP_K) -> List[int]:
+        """
+        أرقام أكثر limit كلمة تكراراً تبدأ بـ prefix (التعادل بالترتيب الأبجدي)
+
+        البادئة الواسعة: صف جاهز من prefix_top؛ الضيقة (K كلمة أو أقل): ترتيب نطاقها مباشرة
+        """
+        low, high = self.prefix_range(prefix)
+        top_k = self.prefix_top.shape[1]
+        if high - low > top_k and limit <= top_k:
+            row = int(np.searchsorted(self.prefixes, prefix))
+            if row < len(self.prefixes) and self.prefixes[row] == prefix:
+                return np.asarray(self.prefix_top[row, :limit]).tolist()
+        totals = np.asarray(self.totals[low:high])
+        return (low + np.argsort(-totals, kind='stable')[:limit]).tolist()
+
+    def verses_count(self, index: int) -> int:
+        return int(self.indptr[index + 1] - self.indptr[index])
+
+    def occurrences(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(مواقع الآيات في المدوّنة تصاعدياً، عدد المرات في كل آية) - int64"""
+        start, end = int(self.indptr[index]), int(self.indptr[index + 1])
+        verses = self.corpus.indices_of(np.asarray(self.verse_ids[start:end]))
+        return verses.astype(np.int64), np.asarray(self.counts[start:end], dtype=np.int64)
+
+    def by_surah(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(السور تصاعدياً، تكرار الكلمة في كل منها)"""
+        start, end = int(self.surah_indptr[index]), int(self.surah_indptr[index + 1])
+        return np.asarray(self.surahs[start:end], dtype=np.int64), np.asarray(self.surah_totals[start:end], dtype=np.int64)
+
+    def by_juz(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(الأجزاء تصاعدياً، تكرار الكلمة في كل منها)"""
+        start, end = int(self.juz_indptr[index]), int(self.juz_indptr[index + 1])
+        return np.asarray(self.juzs[start:end], dtype=np.int64), np.asarray(self.juz_totals[start:end], dtype=np.int64)
+
+def next_prefix(prefix: str) -> str:
+    """أول نص بعد كل ما يبدأ بـ prefix في الترتيب: نفس البادئة مع زيادة آخر حرف"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def distribution(keys: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    مجموع counts لكل مفتاح (سورة أو جزء) - المفاتيح الموجودة فقط تصاعدياً
+
+    المفتاح 0 (جزء غير معروف) لا يُحسب
+    """
+    totals = np.bincount(keys, weights=counts).astype(np.int64) if len(keys) else np.zeros(1, dtype=np.int64)
+    present = np.flatnonzero(totals)
+    present = present[present > 0]
+    return present, totals[present]
+
+# ============================================
+# 🏗️ البناء
+# ============================================
+def build_word_stats(corpus) -> WordStatsStore:
+    """
+    إحصائيات كل كلمة مُطبَّعة (بطول حرفين على الأقل وليست من COMMON_WORDS) - مرور واحد خطي
+
+    كل آية تُقسَّم مرة واحدة (Counter: عدد مرات كل كلمة فيها) وتُضاف لـ postings الكلمة،
+    ثم الإجماليات والتوزيع حسب السورة والجزء بـ np.bincount على كل الـ postings معاً
+    """
+    postings: Dict[str, Tuple[List[int], List[int]]] = {}  # الكلمة → (مواقع الآيات، العدد في كل آية)
+
+    for verse in corpus.records:
+        for word, count in Counter(verse.text_clean.split()).items():
+            if len(word) < 2 or word in COMMON_WORDS:
+                continue
+            entry = postings.get(word)
+            if entry is None:
+                entry = postings[word] = ([], [])
+            entry[0].append(verse.index)
+            entry[1].append(count)
+
+    words = sorted(postings)
+    lengths = np.array([len(postings[word][0]) for word in words], dtype=np.int64)
+    indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int32)
+    verses = np.fromiter(chain.from_iterable(postings[word][0] for word in words), dtype=np.int64, count=int(indptr[-1]))
+    counts = np.fromiter(chain.from_iterable(postings[word][1] for word in words), dtype=np.int64, count=int(indptr[-1]))
+    word_of = np.repeat(np.arange(len(words), dtype=np.int64), lengths)
+
+    surah_indptr, surahs, surah_totals = distribution_csr(word_of, corpus.surahs[verses], counts, len(words))
+    juz_indptr, juzs, juz_totals = distribution_csr(word_of, corpus.juzs[verses], counts, len(words))
+
+    totals = np.bincount(word_of, weights=counts, minlength=len(words)).astype(np.int32)
+    prefixes, prefix_top = build_prefix_top(words, totals)
+
+    max_count = int(counts.max()) if len(counts) else 0
+    arrays = {
+        'words': np.array(words, dtype=f"<U{max((len(word) for word in words), default=1)}"),
+        'totals': totals,
+        'indptr': indptr,
+        'verse_ids': corpus.ids[verses].astype(np.int32),
+        'counts': counts.astype(np.uint8 if max_count <= np.iinfo(np.uint8).max else np.uint16),
+        'surah_indptr': surah_indptr,
+        'surahs': surahs.astype(np.uint8),
+        'surah_totals': surah_totals,
+        'juz_indptr': juz_indptr,
+        'juzs': juzs.astype(np.uint8),
+        'juz_totals': juz_totals,
+        'prefixes': prefixes,
+        'prefix_top': prefix_top
+    }
+    meta = dict(build_manifest(WORD_STATS_ARTIFACT, WORD_STATS_FORMAT, corpus),
+                words=len(words), postings=int(indptr[-1]))
+    return WordStatsStore(arrays, meta, corpus)
+
+def distribution_csr(word_of: np.ndarray, keys: np.ndarray, counts: np.ndarray,
+                     size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    التوزيع لكل الكلمات دفعة واحدة: np.bincount على (الكلمة، المفتاح) → CSR
+
+    Returns:
+        (indptr لكل كلمة، المفاتيح تصاعدياً داخل كل كلمة، المجاميع) - المفتاح 0 لا يُحسب
+    """
+    width = int(keys.max()) + 1 if len(keys) else 1
+    totals = np.bincount(word_of * width + keys, weights=counts, minlength=size * width).astype(np.int64)
+    present = np.flatnonzero(totals)
+    present = present[present % width > 0]
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(present // width, minlength=size)))).astype(np.int32)
+    return indptr, (present % width).astype(np.int64), totals[present].astype(np.int32)
+
+def build_prefix_top(words: List[str], totals: np.ndarray,
+                     top_k: int = AUTOCOMPLETE_TOP_K) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    أكثر top_k كلمة تكراراً لكل بادئة (من كلمات القاموس المرتب words) يبدأ بها أكثر من top_k كلمة
+
+    Returns:
+        (البادئات مرتبة، مصفوفة (عدد البادئات × top_k) بأرقام الكلمات تنازلياً حسب التكرار)
+    """
+    prefixes, rows = [], []
+    for prefix in sorted({word[:length] for word in words for length in range(1, len(word) + 1)}):
+        low = bisect_left(words, prefix)
+        high = bisect_left(words, next_prefix(prefix), lo=low)
+        if high - low > top_k:
+            prefixes.append(prefix)
+            rows.append(low + np.argsort(-totals[low:high], kind='stable')[:top_k])
+
+    prefix_top = np.array(rows, dtype=np.int32).reshape(len(rows), top_k)
+    return np.array(prefixes, dtype=f"<U{max((len(prefix) for prefix in prefixes), default=1)}"), prefix_top
+
+# ============================================
+# 💾 الحفظ والتحميل
+# ============================================
+def save_word_stats(store: WordStatsStore, path: str = WORD_STATS_STORE_DIR):
+    """المصفوفات + meta.json بنسخة جديدة تُنشر ذرياً (artifacts.save_artifact_dir)"""
+    save_artifact_dir(path, {name: getattr(store, name) for name in STORE_ARRAYS}, store.meta)
+
+def load_word_stats(corpus, path: str = WORD_STATS_STORE_DIR) -> Optional[WordStatsStore]:
+    """تحميل المخزن بـ memory-map إذا كان مطابقاً للمدوّنة الحالية (وإلا None)"""
+    loaded = load_artifact_dir(path, STORE_ARRAYS, WORD_STATS_ARTIFACT, WORD_STATS_FORMAT, corpus)
+    if loaded is None:
+        return None
+    arrays, meta = loaded
+    return WordStatsStore(arrays, meta, corpus)